@@ -0,0 +1,87 @@
+import os
+import resource
+import sys
+import time
+
+import numpy as np
+
+# --- Configuration ---
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(os.path.dirname(BENCH_DIR), "src")
+FIXTURES_DIR = os.path.join(BENCH_DIR, "fixtures")
+CORPORA_DIR = os.path.join(BENCH_DIR, ".corpora")
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+
+# Benchmarks import the pipeline modules the same way the scripts in src/ import each other
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far (Linux reports KB, macOS bytes)."""
+    try:
+        # VmHWM restarts at exec; ru_maxrss on Linux keeps the parent's peak from before it
+        with open("/proc/self/status") as f:
+            return round(next(int(line.split()[1]) for line in f if line.startswith("VmHWM:")) / 1024, 1)
+    except (OSError, StopIteration):
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+class Timer:
+    """Collects per-call latencies: `with timer: ...` or `timer.wrap(fn)`."""
+
+    def __init__(self):
+        self.latencies = []
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.latencies.append(time.perf_counter() - self.start)
+
+    def wrap(self, fn):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.latencies.append(time.perf_counter() - start)
+        return timed
+
+
+def summarize(items, seconds, latencies, latency_of, **extra):
+    """The machine-readable result of one benchmark run: throughput plus latency percentiles (ms)."""
+    ms = np.asarray(latencies, dtype=np.float64) * 1000
+    result = {"items": items, "seconds": round(seconds, 4),
+              "throughput": round(items / seconds, 1) if seconds else None, "latency_of": latency_of,
+              "samples": int(len(ms))}
+    for name, q in (("p50_ms", 50), ("p95_ms", 95), ("p99_ms", 99)):
+        result[name] = round(float(np.percentile(ms, q)), 3) if len(ms) else None
+    result["max_ms"] = round(float(ms.max()), 3) if len(ms) else None
+    result.update(extra)
+    return result
+
+
+def render(fixture, count=1, **values):
+    """
+    A saved page from fixtures/ with its `<!-- ROW -->` block repeated `count`
+    times. `{{i}}` and `{{id}}` are the row number and its numeric id
+    (10000000 + i); other `{{name}}` placeholders come from `values`.
+    """
+    with open(os.path.join(FIXTURES_DIR, fixture), encoding="utf-8") as f:
+        page = f.read()
+    head, _, rest = page.partition("<!-- ROW -->")
+    if rest:
+        row, _, tail = rest.partition("<!-- /ROW -->")
+        page = head + "".join(row.replace("{{i}}", str(i)).replace("{{id}}", str(book_id(i)))
+                              for i in range(1, count + 1)) + tail
+    for key, value in values.items():
+        page = page.replace("{{" + key + "}}", str(value))
+    return page.encode("utf-8")
+
+
+def book_id(i):
+    return 10000000 + i
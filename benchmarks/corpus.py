@@ -0,0 +1,93 @@
+import io
+import json
+import os
+import random
+
+import numpy as np
+from PIL import Image
+from tqdm import tqdm
+
+from common import CORPORA_DIR
+from annotation_store import STORE_NAME, AnnotationStore
+
+# --- Configuration ---
+GENRES = ["classicfiction", "hindi", "marathi", "kannada", "sciencefiction", "poetry"]
+DUPLICATE_EVERY = 20      # every 20th cover is a byte-identical re-download of the previous one
+COVER_SIZE = (240, 360)
+MARKER = ".complete"
+
+
+def cover_name(i):
+    """Scraper-style raw file name, URL residue included, e.g. 'hindi10000007-book-7?from_search=true&...&rank=7'."""
+    return f"{GENRES[i % len(GENRES)]}{10000000 + i}-book-{i}?from_search=true&from_srp=true&qid=QFEVixPxCf&rank={i % 20 + 1}"
+
+
+def synthetic_cover(i, size=COVER_SIZE):
+    """A small JPEG whose dHash differs per index (a blurred random grid, so near-dup search has real work)."""
+    rng = np.random.default_rng(i)
+    grid = rng.integers(0, 256, (12, 8, 3), dtype=np.uint8)
+    img = Image.fromarray(grid).resize(size, Image.BILINEAR)
+    buffer = io.BytesIO()
+    img.save(buffer, "JPEG", quality=85)
+    return buffer.getvalue()
+
+
+def synthetic_labelme(i, image_name, size=COVER_SIZE):
+    """LabelMe JSON with 3-6 text polygons (a few deliberately out of bounds, as Gemini sometimes returns)."""
+    rnd = random.Random(i)
+    w, h = size
+    shapes = []
+    for _ in range(rnd.randint(3, 6)):
+        x0, y0 = rnd.uniform(-10, w * 0.7), rnd.uniform(-10, h * 0.8)
+        x1, y1 = x0 + rnd.uniform(20, w * 0.5), y0 + rnd.uniform(10, h * 0.15)
+        shapes.append({"label": "text", "points": [[x0, y0], [x1, y0], [x1, y1], [x0, y1]],
+                       "group_id": None, "shape_type": "polygon", "flags": {}})
+    return {"version": "5.0.1", "flags": {}, "shapes": shapes, "imagePath": image_name,
+            "imageData": None, "imageHeight": h, "imageWidth": w}
+
+
+def make_corpus(size):
+    """
+    `size` annotated covers under .corpora/<size>/raw, generated once and
+    reused by every benchmark and run. Annotations are there both as LabelMe
+    sidecars and in the directory's AnnotationStore. Returns the raw directory.
+    """
+    root = os.path.join(CORPORA_DIR, str(size))
+    raw_dir = os.path.join(root, "raw")
+    if os.path.exists(os.path.join(root, MARKER)):
+        if not os.path.exists(os.path.join(raw_dir, STORE_NAME)):
+            AnnotationStore(raw_dir).close()  # corpora from before the store: import their sidecars once
+        return raw_dir
+    os.makedirs(raw_dir, exist_ok=True)
+    data = None
+    for i in tqdm(range(size), desc=f"Generating {size}-image corpus"):
+        if data is None or i % DUPLICATE_EVERY:
+            data = synthetic_cover(i)
+        name = cover_name(i)
+        with open(os.path.join(raw_dir, name + ".jpg"), "wb") as f:
+            f.write(data)
+        with open(os.path.join(raw_dir, name + ".json"), "w") as f:
+            json.dump(synthetic_labelme(i, name + ".jpg"), f)
+    AnnotationStore(raw_dir).close()
+    open(os.path.join(root, MARKER), "w").close()
+    return raw_dir
+
+
+def corpus_files(raw_dir, ext=".jpg"):
+    """Sorted paths of one file type in a corpus."""
+    return sorted(os.path.join(raw_dir, name) for name in os.listdir(raw_dir) if name.endswith(ext))
+
+
+def make_dataset_tree(root, names, test_every=5):
+    """
+    Empty image/label files for `names` under root/{train,test}/{images,labels}
+    -- the layout finalize.py and master_cleaner.py rename. Contents are
+    irrelevant to renaming, so nothing is copied.
+    """
+    for split in ("train", "test"):
+        for kind in ("images", "labels"):
+            os.makedirs(os.path.join(root, split, kind), exist_ok=True)
+    for i, name in enumerate(names):
+        split = "test" if i % test_every == 0 else "train"
+        open(os.path.join(root, split, "images", name + ".jpg"), "w").close()
+        open(os.path.join(root, split, "labels", name + ".txt"), "w").close()
@@ -0,0 +1,130 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+from common import RESULTS_DIR, peak_rss_mb
+from corpus import make_corpus
+
+# --- Configuration ---
+DEFAULT_SIZES = "100,1000"
+DEFAULT_REPEAT = 3
+COMPARE_FIELDS = ("throughput", "p50_ms", "p95_ms", "p99_ms", "peak_rss_mb")
+
+
+def _git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run_child(args):
+    """Runs one benchmark in this (fresh) process and writes its result, peak RSS included."""
+    from suite import BENCHMARKS
+    fn, _ = BENCHMARKS[args.child]
+    raw_dir = make_corpus(args.size)
+    workdir = tempfile.mkdtemp(prefix=f"bench_{args.child}_", dir=args.workdir)
+    os.chdir(workdir)  # scrapers with hard-coded output folders write here, not into the repo
+    result = fn(args.size, raw_dir, workdir, args)
+    result.update({"benchmark": args.child, "size": args.size, "peak_rss_mb": peak_rss_mb()})
+    with open(args.out, 'w') as f:
+        json.dump(result, f)
+
+
+def run_suite(args):
+    """
+    Every selected benchmark at every corpus size, each in its own subprocess
+    so peak RSS is per benchmark. Results go to results/<timestamp>.json.
+    """
+    from suite import BENCHMARKS
+    names = args.only.split(',') if args.only else list(BENCHMARKS)
+    unknown = [n for n in names if n not in BENCHMARKS]
+    if unknown:
+        sys.exit(f"Unknown benchmark(s): {', '.join(unknown)}. Choose from: {', '.join(BENCHMARKS)}")
+    sizes = [int(s) for s in args.sizes.split(',')]
+    for size in sizes:
+        make_corpus(size)  # generated up front so no benchmark pays for it
+
+    report = {"meta": {"started": time.strftime("%Y-%m-%dT%H:%M:%S"), "git": _git_revision(),
+                       "python": platform.python_version(), "platform": platform.platform(),
+                       "cpu_count": os.cpu_count(), "repeat": args.repeat, "fake_latency": args.fake_latency,
+                       "fake_error_rate": args.fake_error_rate, "fake_per_image": args.fake_per_image,
+                       "fake_invalid_rate": args.fake_invalid_rate, "server_latency": args.server_latency},
+              "results": []}
+    with tempfile.TemporaryDirectory(prefix="benchmarks_", dir=args.workdir) as scratch:
+        for size in sizes:
+            for name in names:
+                if size > BENCHMARKS[name][1]:
+                    print(f"  {name:<18} {size:>7}  skipped (max size {BENCHMARKS[name][1]})")
+                    continue
+                out = os.path.join(scratch, f"{name}_{size}.json")
+                cmd = [sys.executable, os.path.abspath(__file__), "--child", name, "--size", str(size), "--out", out,
+                       "--workdir", scratch, "--repeat", str(args.repeat), "--fake-latency", str(args.fake_latency),
+                       "--fake-error-rate", str(args.fake_error_rate), "--fake-per-image", str(args.fake_per_image),
+                       "--fake-invalid-rate", str(args.fake_invalid_rate), "--server-latency", str(args.server_latency)]
+                proc = subprocess.run(cmd, stdout=None if args.verbose else subprocess.DEVNULL,
+                                      stderr=None if args.verbose else subprocess.PIPE, text=True)
+                if proc.returncode != 0:
+                    print(f"  {name:<18} {size:>7}  FAILED\n{proc.stderr or ''}")
+                    report["results"].append({"benchmark": name, "size": size, "error": (proc.stderr or "")[-2000:]})
+                    continue
+                with open(out) as f:
+                    result = json.load(f)
+                report["results"].append(result)
+                print(f"  {name:<18} {size:>7}  {result['throughput']:>10} items/s  p50 {result['p50_ms']} ms  "
+                      f"p99 {result['p99_ms']} ms (per {result['latency_of']})  peak RSS {result['peak_rss_mb']} MB")
+
+    output = args.output or os.path.join(RESULTS_DIR, time.strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to '{output}'.")
+
+
+def compare(old_path, new_path):
+    """Prints new/old ratios for every benchmark and size present in both result files."""
+    with open(old_path) as f:
+        old = {(r["benchmark"], r["size"]): r for r in json.load(f)["results"] if "error" not in r}
+    with open(new_path) as f:
+        new = {(r["benchmark"], r["size"]): r for r in json.load(f)["results"] if "error" not in r}
+    print(f"{'benchmark':<18} {'size':>7}  " + "  ".join(f"{field:>16}" for field in COMPARE_FIELDS))
+    for key in sorted(old.keys() & new.keys()):
+        cells = []
+        for field in COMPARE_FIELDS:
+            a, b = old[key].get(field), new[key].get(field)
+            cells.append(f"{b} ({b / a:.2f}x)".rjust(16) if a and b is not None else str(b).rjust(16))
+        print(f"{key[0]:<18} {key[1]:>7}  " + "  ".join(cells))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Offline benchmarks: local fixture server, fake Gemini, synthetic corpora")
+    parser.add_argument('--sizes', type=str, default=DEFAULT_SIZES, help='Corpus sizes, e.g. 100,1000,10000,100000')
+    parser.add_argument('--only', type=str, default=None, help='Comma-separated benchmark names')
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help='Repetitions of whole-run benchmarks')
+    parser.add_argument('--fake-latency', type=float, default=0.05, help='Seconds per fake Gemini call')
+    parser.add_argument('--fake-error-rate', type=float, default=0.0, help='Fraction of fake Gemini calls that 503')
+    parser.add_argument('--fake-per-image', type=float, default=0.005, help='Extra seconds per image in a fake call')
+    parser.add_argument('--fake-invalid-rate', type=float, default=0.02,
+                        help='Fraction of images a fake batch reply gets wrong')
+    parser.add_argument('--server-latency', type=float, default=0.0, help='Seconds the fixture server waits per response')
+    parser.add_argument('--output', type=str, default=None, help='Result file (default: benchmarks/results/<time>.json)')
+    parser.add_argument('--workdir', type=str, default=None, help='Scratch directory (default: system temp)')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='Compare two result files and exit')
+    parser.add_argument('--verbose', action='store_true', help="Show the benchmarked code's own output")
+    parser.add_argument('--child', type=str, default=None, help=argparse.SUPPRESS)
+    parser.add_argument('--size', type=int, default=None, help=argparse.SUPPRESS)
+    parser.add_argument('--out', type=str, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+    elif args.child:
+        run_child(args)
+    else:
+        run_suite(args)
@@ -0,0 +1,600 @@
+import io
+import os
+import random
+import shutil
+import time
+import tracemalloc
+from functools import partial
+
+from common import Timer, summarize, render, book_id
+from corpus import GENRES, cover_name, corpus_files, make_dataset_tree
+
+# --- Configuration ---
+QUERY = "indian fiction"
+PROMPT = "Return every text region of this cover as LabelMe-style JSON shapes."
+SCRAPE_WORKERS = 8
+ANNOTATE_IN_FLIGHT = 16
+ANNOTATE_BATCH = 8           # covers per request in annotate_batch
+
+
+# --- Scraping against the local fixture server ---
+def _cover_route(raw_dir):
+    """Serves corpus image i for any cover URL ending in <book_id(i)>...; read lazily so RSS stays flat."""
+    covers = corpus_files(raw_dir)
+
+    def route(path, query):
+        digits = os.path.basename(path).split('.')[0].split('-')[0]
+        with open(covers[(int(digits) - book_id(0)) % len(covers)], 'rb') as f:
+            return "image/jpeg", f.read()
+    return route
+
+
+def _fixture_routes(size, raw_dir, site):
+    cover = _cover_route(raw_dir)
+    if site == "goodreads":
+        routes = {"/search": ("text/html", render("goodreads_search.html", size, query=QUERY, total=size))}
+        for i in range(1, size + 1):
+            routes[f"/book/show/{book_id(i)}-book-{i}"] = (
+                lambda path, query, i=i: ("text/html", render("goodreads_book.html", i=i, id=book_id(i))))
+            routes[f"/covers/{book_id(i)}.jpg"] = cover
+    elif site == "amazon":
+        routes = {"/s": ("text/html", render("amazon_search.html", size, query=QUERY))}
+        for i in range(1, size + 1):
+            routes[f"/images/I/{book_id(i)}._AC_UY218_.jpg"] = cover
+    else:
+        routes = {"/search": ("text/html", render("flipkart_search.html", size, query=QUERY))}
+        for i in range(1, size + 1):
+            routes[f"/image/200/200/{book_id(i)}.jpeg"] = cover
+    return routes
+
+
+def _scrape(size, raw_dir, workdir, site, args):
+    from fixture_server import FixtureServer
+    from fetcher import Fetcher
+    from image_store import ImageStore
+
+    store = ImageStore(os.path.join(workdir, "store"))
+    os.makedirs(os.path.join(workdir, "covers"))  # scraper.py's CLI creates it; the function expects it
+    timer = Timer()
+    with FixtureServer(_fixture_routes(size, raw_dir, site), latency=args.server_latency) as server:
+        fetcher = Fetcher(rate_per_host=1e9, burst=1e9, max_workers=SCRAPE_WORKERS)
+        fetcher.get = timer.wrap(fetcher.get)
+        start = time.perf_counter()
+        if site == "goodreads":
+            from scraper import scrape_goodreads_search
+            saved = len(scrape_goodreads_search(QUERY, size, os.path.join(workdir, "covers"), fetcher,
+                                                base_url=server.url, store=store) or [])
+        elif site == "amazon":
+            from scraper_indic import scrape_amazon_indic
+            scrape_amazon_indic(QUERY, size, fetcher, store, site_url=server.url)
+            saved = len(os.listdir("data_indic"))
+        else:
+            from scraper_flipkart import scrape_flipkart
+            scrape_flipkart(QUERY, size, fetcher, store, site_url=server.url)
+            saved = len(os.listdir("data_flipkart"))
+        seconds = time.perf_counter() - start
+        fetcher.close()
+        hits = server.hits
+    store.close()
+    return summarize(saved, seconds, timer.latencies, "http request", requests=hits)
+
+
+def bench_scrape_goodreads(size, raw_dir, workdir, args):
+    """Search page -> book pages -> covers, on the fetcher's pool."""
+    return _scrape(size, raw_dir, workdir, "goodreads", args)
+
+
+def bench_scrape_amazon(size, raw_dir, workdir, args):
+    """Search page -> covers, sequential (scraper_indic)."""
+    return _scrape(size, raw_dir, workdir, "amazon", args)
+
+
+def bench_scrape_flipkart(size, raw_dir, workdir, args):
+    """Search page -> covers, sequential (scraper_flipkart)."""
+    return _scrape(size, raw_dir, workdir, "flipkart", args)
+
+
+# --- HTML extraction on saved pages ---
+# (fixture, site, field, rows) -- row counts match a real results page on each site
+EXTRACT_PAGES = [("goodreads_search.html", "goodreads", "book_links", 20), ("goodreads_book.html", "goodreads", "cover", 1),
+                 ("amazon_search.html", "amazon", "covers", 48), ("flipkart_search.html", "flipkart", "covers", 40)]
+TRACED_PAGES = 40  # pages parsed again under tracemalloc for the per-page allocation peak
+
+
+def _bench_extract(size, engine):
+    from extractors import SiteExtractor
+
+    pages = []
+    for fixture, site, field, rows in EXTRACT_PAGES:
+        page = render(fixture, rows, query=QUERY, total=rows, i=1, id=book_id(1))
+        if engine == "soup":
+            parse = _full_soup_parse(site, field)
+        else:
+            parse = partial(SiteExtractor(site, engine=engine).extract, field=field, limit=1 if field == "cover" else None)
+        pages.append((page, parse))
+
+    timer = Timer()
+    found = 0
+    start = time.perf_counter()
+    for i in range(size):
+        page, parse = pages[i % len(pages)]
+        with timer:
+            found += len(parse(page))
+    seconds = time.perf_counter() - start
+
+    peaks = []
+    for i in range(min(size, TRACED_PAGES)):
+        page, parse = pages[i % len(pages)]
+        tracemalloc.start()
+        parse(page)
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return summarize(size, seconds, timer.latencies, "page", values_found=found,
+                     page_kb=round(sum(len(p) for p, _ in pages) / len(pages) / 1024, 1),
+                     alloc_peak_kb_per_page=round(sum(peaks) / len(peaks) / 1024, 1))
+
+
+def _full_soup_parse(site, field):
+    """What the scrapers did before extractors.py: a whole html.parser tree, then find_all."""
+    from bs4 import BeautifulSoup
+    from extractors import load_selectors
+    rule = load_selectors()[site][field]
+
+    def parse(content):
+        soup = BeautifulSoup(content, 'html.parser')
+        return [tag[rule["attr"]] for tag in soup.find_all(rule["tag"], class_=rule["class"], **{rule["attr"]: True})]
+    return parse
+
+
+def bench_extract_soup(size, raw_dir, workdir, args):
+    """Baseline: full BeautifulSoup tree per page."""
+    return _bench_extract(size, "soup")
+
+
+def bench_extract_strainer(size, raw_dir, workdir, args):
+    """BeautifulSoup with a SoupStrainer: only matching tags are built."""
+    return _bench_extract(size, "strainer")
+
+
+def bench_extract_stream(size, raw_dir, workdir, args):
+    """stdlib HTMLParser start-tag callbacks, stopping early on book pages."""
+    return _bench_extract(size, "stream")
+
+
+def bench_extract_lxml(size, raw_dir, workdir, args):
+    """lxml parser target (C parser, no tree), stopping early on book pages."""
+    return _bench_extract(size, "lxml")
+
+
+# --- Download validation ---
+def bench_is_image_valid(size, raw_dir, workdir, args):
+    """Pillow verify() of every downloaded cover, from bytes already in memory."""
+    from image_store import is_image_valid
+
+    payloads = []
+    for path in corpus_files(raw_dir):
+        with open(path, 'rb') as f:
+            payloads.append(f.read())
+    timer = Timer()
+    start = time.perf_counter()
+    valid = 0
+    for data in payloads:
+        with timer:
+            valid += is_image_valid(io.BytesIO(data))
+    return summarize(len(payloads), time.perf_counter() - start, timer.latencies, "image", valid=valid)
+
+
+
+# --- Cover ingestion: download, check, store, normalize, open for annotation ---
+def _bench_ingest(size, raw_dir, workdir, args, make_ingest):
+    """Runs `make_ingest(fetcher, store, normalizer, workdir)(url, path)` on `size` covers from the fixture server."""
+    from fixture_server import FixtureServer
+    from fetcher import Fetcher
+    from image_store import ImageStore
+    from master_pipeline import SHARED_IMAGES
+    from normalize import Normalizer
+
+    store = ImageStore(os.path.join(workdir, "store"))
+    normalizer = Normalizer(cache_dir=os.path.join(workdir, "normalized"), store=store, keep=SHARED_IMAGES)
+    covers = os.path.join(workdir, "covers")
+    os.makedirs(covers)
+    timer = Timer()
+    with FixtureServer(_fixture_routes(size, raw_dir, "goodreads"), latency=args.server_latency) as server:
+        fetcher = Fetcher(rate_per_host=1e9, burst=1e9, max_workers=SCRAPE_WORKERS)
+        ingest = timer.wrap(make_ingest(fetcher, store, normalizer, workdir))
+        jobs = [(f"{server.url}/covers/{book_id(i)}.jpg", os.path.join(covers, f"cover_{i}.jpg"))
+                for i in range(1, size + 1)]
+        start = time.perf_counter()
+        accepted = sum(fetcher.pool.map(lambda job: ingest(*job), jobs))
+        seconds = time.perf_counter() - start
+        fetcher.close()
+    return summarize(size, seconds, timer.latencies, "cover (request to opened for annotation)",
+                     accepted=accepted, objects=len(store.all_shas()))
+
+
+def _legacy_ingest(fetcher, store, normalizer, workdir):
+    """The pre-Ingestor path: whole body in memory, verify(), write, then decode twice more."""
+    from image_store import is_image_valid
+
+    def ingest(url, path):
+        response = fetcher.get(url)
+        if response.status_code != 200 or not is_image_valid(io.BytesIO(response.content)):
+            return False
+        store.add_bytes(response.content, path)
+        normalizer.normalize(path)
+        normalizer.open(path)[0].close()
+        return True
+    return ingest
+
+
+def _stream_ingest(fetcher, store, normalizer, workdir):
+    from ingest import Ingestor, Rejected
+
+    ingestor = Ingestor(fetcher, store, os.path.join(workdir, ".incoming"), normalizer)
+
+    def ingest(url, path):
+        try:
+            fetched = ingestor.download(url)
+            _, img = ingestor.accept(fetched, path)
+        except Rejected:
+            return False
+        ingestor.share(fetched, path, img)
+        normalizer.open(path)[0].close()
+        return True
+    return ingest
+
+
+def bench_ingest_legacy(size, raw_dir, workdir, args):
+    """fetcher.get, is_image_valid, ImageStore.add_bytes, then normalize and open decode the cover again."""
+    return _bench_ingest(size, raw_dir, workdir, args, _legacy_ingest)
+
+
+def bench_ingest_stream(size, raw_dir, workdir, args):
+    """ingest.Ingestor: streamed to disk while hashed, header sniffed, one decode shared with normalize and open."""
+    return _bench_ingest(size, raw_dir, workdir, args, _stream_ingest)
+
+# --- Annotation through the quota-aware scheduler and a fake Gemini ---
+def _bench_annotate(size, raw_dir, workdir, args, batch_size):
+    """gemini_client.AnnotationBatcher on every cover via AnnotationScheduler, against FakeGenerativeModel."""
+    from annotation_scheduler import AnnotationScheduler
+    from annotation_store import AnnotationStore
+    from fakes import FakeGenerativeModel
+    from gemini_client import AnnotationBatcher
+
+    model = FakeGenerativeModel(latency=args.fake_latency, jitter=args.fake_latency / 2,
+                                error_rate=args.fake_error_rate, per_image=args.fake_per_image,
+                                invalid_rate=args.fake_invalid_rate)
+    annotations = AnnotationStore(os.path.join(workdir, f"annotations_{batch_size}"))
+    images = corpus_files(raw_dir)
+    submitted, latencies = {}, []
+    failed = 0
+    start = time.perf_counter()
+    with AnnotationScheduler(rpm=1e9, max_in_flight=ANNOTATE_IN_FLIGHT) as scheduler:
+        batcher = AnnotationBatcher(model, PROMPT, scheduler, batch_size, max_wait=0.05, store=annotations)
+        for path in images:
+            submitted[path] = time.perf_counter()
+        for path, _, error in batcher.map(images):
+            latencies.append(time.perf_counter() - submitted[path])
+            failed += error is not None
+        seconds = time.perf_counter() - start
+        batcher.close()
+        stats = dict(scheduler.stats)
+    return summarize(len(images), seconds, latencies, "image (queued to annotated)", failed=failed,
+                     model_calls=model.calls, retries=stats["retries"], invalid=batcher.stats["invalid"],
+                     stored=len(annotations))
+
+
+def bench_annotate(size, raw_dir, workdir, args):
+    """One cover per Gemini request."""
+    return _bench_annotate(size, raw_dir, workdir, args, batch_size=1)
+
+
+def bench_annotate_batch(size, raw_dir, workdir, args):
+    """ANNOTATE_BATCH covers per Gemini request; invalid entries are retried one at a time."""
+    return _bench_annotate(size, raw_dir, workdir, args, batch_size=ANNOTATE_BATCH)
+
+
+def bench_cascade(size, raw_dir, workdir, args):
+    """cascade_annotate: FakeOCR on every cover, FakeGenerativeModel for the ones it scores low."""
+    from annotation_scheduler import AnnotationScheduler
+    from cascade_annotate import cascade_annotate
+    from fakes import FakeGenerativeModel, FakeOCR
+
+    image_dir = os.path.join(workdir, "covers")
+    os.makedirs(image_dir)
+    for path in corpus_files(raw_dir):
+        os.link(path, os.path.join(image_dir, os.path.basename(path)))
+    model = FakeGenerativeModel(latency=args.fake_latency, jitter=args.fake_latency / 2,
+                                error_rate=args.fake_error_rate, per_image=args.fake_per_image,
+                                invalid_rate=args.fake_invalid_rate)
+    start = time.perf_counter()
+    with AnnotationScheduler(rpm=1e9, max_in_flight=ANNOTATE_IN_FLIGHT) as scheduler:
+        counts = cascade_annotate(image_dir, gemini_batch_size=ANNOTATE_BATCH, model=model, scheduler=scheduler,
+                                  ocr=FakeOCR())
+    seconds = time.perf_counter() - start
+    all_gemini_calls = -(-counts["images"] // ANNOTATE_BATCH)
+    return summarize(counts["images"], seconds, [seconds], "full run",
+                     escalation_rate=round(counts["escalated"] / counts["images"], 3), model_calls=model.calls,
+                     calls_saved=all_gemini_calls - model.calls, images_per_hour=round(counts["images_per_hour"]),
+                     failed=counts["failed"])
+
+
+# --- LabelMe -> YOLO conversion (prepare_dataset / dataset_builder) ---
+def bench_yolo_convert(size, raw_dir, workdir, args):
+    """yolo_convert.convert over the whole corpus, `--repeat` times."""
+    from yolo_convert import convert
+
+    jsons = corpus_files(raw_dir, '.json')
+    label_dir = os.path.join(workdir, "labels")
+    os.makedirs(label_dir)
+    labels = [os.path.join(label_dir, f"{i}.txt") for i in range(len(jsons))]
+    timer = Timer()
+    for _ in range(args.repeat):
+        with timer:
+            stats = convert(jsons, labels)
+    return summarize(len(jsons) * args.repeat, sum(timer.latencies), timer.latencies, "full run",
+                     shapes=stats["shapes"], dropped=stats["dropped"])
+
+
+# --- Annotation store vs LabelMe sidecars ---
+def bench_annotations_import(size, raw_dir, workdir, args):
+    """annotation_store import: every sidecar of the corpus into a fresh store, `--repeat` times."""
+    from annotation_store import AnnotationStore
+
+    images = corpus_files(raw_dir)
+    timer = Timer()
+    for attempt in range(args.repeat):
+        # The store imports sidecars only for images in its own directory
+        image_dir = os.path.join(workdir, f"store{attempt}")
+        os.makedirs(image_dir)
+        for path in images:
+            os.link(path, os.path.join(image_dir, os.path.basename(path)))
+        annotations = AnnotationStore(image_dir, import_legacy=False)
+        with timer:
+            count = annotations.import_sidecars(raw_dir)
+        annotations.close()
+        if not count:
+            raise RuntimeError(f"imported no annotations from {len(images)} covers in '{raw_dir}'")
+    return summarize(count * args.repeat, sum(timer.latencies), timer.latencies, "full run")
+
+
+def bench_annotations_export_yolo(size, raw_dir, workdir, args):
+    """AnnotationStore.export_yolo over the corpus (compare: yolo_convert, which reads the sidecars)."""
+    from annotation_store import AnnotationStore
+
+    annotations = AnnotationStore(raw_dir)
+    timer = Timer()
+    for attempt in range(args.repeat):
+        with timer:
+            stats = annotations.export_yolo(os.path.join(workdir, f"labels{attempt}"))
+    return summarize(stats["files"] * args.repeat, sum(timer.latencies), timer.latencies, "full run",
+                     shapes=stats["shapes"], dropped=stats["dropped"])
+
+
+def bench_annotations_few_shapes_scan(size, raw_dir, workdir, args):
+    """'Covers with at most 3 shapes' by opening and parsing every sidecar (the old way)."""
+    import json
+
+    timer = Timer()
+    for _ in range(args.repeat):
+        with timer:
+            found = []
+            for path in corpus_files(raw_dir, '.json'):
+                with open(path, 'r') as f:
+                    if len(json.load(f)['shapes']) <= 3:
+                        found.append(path)
+    return summarize(size * args.repeat, sum(timer.latencies), timer.latencies, "query", matches=len(found))
+
+
+def bench_annotations_few_shapes_query(size, raw_dir, workdir, args):
+    """The same question as an indexed AnnotationStore query."""
+    from annotation_store import AnnotationStore
+
+    annotations = AnnotationStore(raw_dir)
+    timer = Timer()
+    for _ in range(args.repeat):
+        with timer:
+            found = annotations.names(max_shapes=3)
+    return summarize(size * args.repeat, sum(timer.latencies), timer.latencies, "query", matches=len(found))
+
+
+# --- Bulk renames (finalize.py / master_cleaner.py) ---
+def _bench_rename(size, workdir, args, names, prefix_of, sanitize_names):
+    from rename_engine import rename
+
+    timer = Timer()
+    for attempt in range(args.repeat):
+        root = os.path.join(workdir, f"dataset{attempt}")
+        make_dataset_tree(root, names)
+        with timer:
+            moves = rename(root, prefix_of, sanitize_names=sanitize_names)
+        shutil.rmtree(root)
+    return summarize(2 * size * args.repeat, sum(timer.latencies), timer.latencies, "full run", renames=len(moves))
+
+
+def bench_rename_finalize(size, raw_dir, workdir, args):
+    """finalize.py: '<language>_<messy>' -> '<language>_NNN' across train/test images and labels."""
+    from rename_engine import underscore_prefix
+    names = [f"{GENRES[i % len(GENRES)]}_{cover_name(i).split('?')[0]}" for i in range(size)]
+    return _bench_rename(size, workdir, args, names, underscore_prefix, False)
+
+
+def bench_rename_clean(size, raw_dir, workdir, args):
+    """master_cleaner.py: strip URL residue, then '<prefix>_NNN'."""
+    from rename_engine import language_prefix
+    return _bench_rename(size, workdir, args, [cover_name(i) for i in range(size)], language_prefix, True)
+
+
+# --- Incremental dataset build (prepare_dataset / master_pipeline phase 2) ---
+def _build(raw_dir, dataset_dir, store_dir):
+    from dataset_builder import build_dataset
+    from image_store import ImageStore
+    from normalize import Normalizer
+
+    store = ImageStore(store_dir)
+    normalizer = Normalizer(cache_dir=os.path.join(store_dir, "normalized"), store=store)
+    build_dataset(raw_dir, dataset_dir, store=store, normalizer=normalizer)
+    store.close()
+
+
+def bench_dataset_cold(size, raw_dir, workdir, args):
+    """build_dataset from nothing: hash, dedup, split, export, convert."""
+    timer = Timer()
+    for attempt in range(args.repeat):
+        with timer:
+            _build(raw_dir, os.path.join(workdir, f"dataset{attempt}"), os.path.join(workdir, f"store{attempt}"))
+    return summarize(size * args.repeat, sum(timer.latencies), timer.latencies, "full run")
+
+
+def bench_dataset_noop(size, raw_dir, workdir, args):
+    """build_dataset again with nothing changed: the manifest fast path."""
+    dataset_dir, store_dir = os.path.join(workdir, "dataset"), os.path.join(workdir, "store")
+    _build(raw_dir, dataset_dir, store_dir)
+    timer = Timer()
+    for _ in range(args.repeat):
+        with timer:
+            _build(raw_dir, dataset_dir, store_dir)
+    return summarize(size * args.repeat, sum(timer.latencies), timer.latencies, "full run")
+
+
+# --- Dataset layout: loose files vs packed shards (train.py's input) ---
+PACK_SHARD_SIZE = 4 * 1024 * 1024  # small enough that even the 1000-cover corpus spans several shards
+
+
+def _loose_dataset(raw_dir, root):
+    """dataset_builder's layout with real cover bytes and a few YOLO rows per label, as finalize.py names it."""
+    samples = []
+    for i, path in enumerate(corpus_files(raw_dir)):
+        split = "test" if i % 5 == 0 else "train"
+        name = f"{GENRES[i % len(GENRES)]}_{i:06d}"
+        for kind in ("images", "labels"):
+            os.makedirs(os.path.join(root, split, kind), exist_ok=True)
+        shutil.copyfile(path, os.path.join(root, split, "images", name + ".jpg"))
+        with open(os.path.join(root, split, "labels", name + ".txt"), "w") as f:
+            f.write("".join(f"0 0.5 {0.1 + 0.2 * row:.2f} 0.8 0.1\n" for row in range(3)))
+        samples.append((split, name))
+    return samples
+
+
+def _packed_dataset(raw_dir, workdir):
+    from shards import pack_dataset
+    loose = os.path.join(workdir, "dataset")
+    samples = _loose_dataset(raw_dir, loose)
+    return samples, pack_dataset(loose, os.path.join(workdir, "packed"), PACK_SHARD_SIZE)
+
+
+def bench_layout_pack(size, raw_dir, workdir, args):
+    """shards.py: pack the loose dataset into tar shards plus offset index."""
+    from shards import pack_dataset
+    loose = os.path.join(workdir, "dataset")
+    _loose_dataset(raw_dir, loose)
+    timer = Timer()
+    for attempt in range(args.repeat):
+        with timer:
+            pack_dataset(loose, os.path.join(workdir, f"packed{attempt}"), PACK_SHARD_SIZE)
+    return summarize(size * args.repeat, sum(timer.latencies), timer.latencies, "full run")
+
+
+def bench_layout_loose_random(size, raw_dir, workdir, args):
+    """Shuffled epoch over loose files: open + read image and label per sample."""
+    root = os.path.join(workdir, "dataset")
+    samples = _loose_dataset(raw_dir, root)
+    random.Random(0).shuffle(samples)
+    timer = Timer()
+    for split, name in samples:
+        with timer:
+            with open(os.path.join(root, split, "images", name + ".jpg"), "rb") as f:
+                f.read()
+            with open(os.path.join(root, split, "labels", name + ".txt"), "r") as f:
+                f.read()
+    return summarize(size, sum(timer.latencies), timer.latencies, "sample")
+
+
+def bench_layout_packed_random(size, raw_dir, workdir, args):
+    """Shuffled epoch over the packed dataset: ShardReader[i] through the mmap'd index."""
+    from shards import ShardReader, SPLITS
+    _, packed = _packed_dataset(raw_dir, workdir)
+    readers = [ShardReader(os.path.join(packed, split)) for split in SPLITS]
+    order = [(reader, i) for reader in readers for i in range(len(reader))]
+    random.Random(0).shuffle(order)
+    timer = Timer()
+    for reader, i in order:
+        with timer:
+            reader[i]
+    return summarize(size, sum(timer.latencies), timer.latencies, "sample")
+
+
+def bench_layout_packed_stream(size, raw_dir, workdir, args):
+    """Sequential pass over the packed dataset (iter(ShardReader)), shard by shard."""
+    from shards import ShardReader, SPLITS
+    _, packed = _packed_dataset(raw_dir, workdir)
+    timer = Timer()
+    start = time.perf_counter()
+    for split in SPLITS:
+        samples = iter(ShardReader(os.path.join(packed, split)))
+        while True:
+            with timer:
+                sample = next(samples, None)
+            if sample is None:
+                timer.latencies.pop()
+                break
+    return summarize(size, time.perf_counter() - start, timer.latencies, "sample")
+
+
+def _bench_copy(size, source, workdir, args):
+    timer = Timer()
+    for attempt in range(args.repeat):
+        with timer:
+            shutil.copytree(source, os.path.join(workdir, f"copy{attempt}"))
+    files = sum(len(files) for _, _, files in os.walk(source))
+    return summarize(size * args.repeat, sum(timer.latencies), timer.latencies, "full copy", files=files)
+
+
+def bench_layout_loose_copy(size, raw_dir, workdir, args):
+    """Copying the loose dataset tree (what moving it between machines costs per file)."""
+    root = os.path.join(workdir, "dataset")
+    _loose_dataset(raw_dir, root)
+    return _bench_copy(size, root, workdir, args)
+
+
+def bench_layout_packed_copy(size, raw_dir, workdir, args):
+    """Copying the packed dataset: a few shards, an index and metadata."""
+    _, packed = _packed_dataset(raw_dir, workdir)
+    return _bench_copy(size, packed, workdir, args)
+
+
+# name -> (function, largest corpus it runs on; bigger sizes are skipped)
+BENCHMARKS = {
+    "scrape_goodreads": (bench_scrape_goodreads, 10_000),
+    "scrape_amazon": (bench_scrape_amazon, 10_000),
+    "scrape_flipkart": (bench_scrape_flipkart, 10_000),
+    "extract_soup": (bench_extract_soup, 100_000),
+    "extract_strainer": (bench_extract_strainer, 100_000),
+    "extract_stream": (bench_extract_stream, 100_000),
+    "is_image_valid": (bench_is_image_valid, 100_000),
+    "ingest_legacy": (bench_ingest_legacy, 10_000),
+    "ingest_stream": (bench_ingest_stream, 10_000),
+    "annotate": (bench_annotate, 10_000),
+    "annotate_batch": (bench_annotate_batch, 10_000),
+    "cascade": (bench_cascade, 10_000),
+    "yolo_convert": (bench_yolo_convert, 100_000),
+    "annotations_import": (bench_annotations_import, 100_000),
+    "annotations_export_yolo": (bench_annotations_export_yolo, 100_000),
+    "annotations_few_shapes_scan": (bench_annotations_few_shapes_scan, 100_000),
+    "annotations_few_shapes_query": (bench_annotations_few_shapes_query, 100_000),
+    "rename_finalize": (bench_rename_finalize, 100_000),
+    "rename_clean": (bench_rename_clean, 100_000),
+    "dataset_cold": (bench_dataset_cold, 100_000),
+    "dataset_noop": (bench_dataset_noop, 100_000),
+    "layout_pack": (bench_layout_pack, 100_000),
+    "layout_loose_random": (bench_layout_loose_random, 100_000),
+    "layout_packed_random": (bench_layout_packed_random, 100_000),
+    "layout_packed_stream": (bench_layout_packed_stream, 100_000),
+    "layout_loose_copy": (bench_layout_loose_copy, 100_000),
+    "layout_packed_copy": (bench_layout_packed_copy, 100_000),
+}
+try:
+    import lxml.etree  # noqa: F401
+    BENCHMARKS["extract_lxml"] = (bench_extract_lxml, 100_000)
+except ImportError:
+    pass
@@ -2,16 +2,8 @@
 echo "--- Starting filename cleanup ---"
 DATASET_DIR="dataset"
 
-find "$DATASET_DIR" -type f | while read -r filepath; do
-    dir=$(dirname "$filepath")
-    filename=$(basename "$filepath")
-
-    if [[ "$filename" == \? ]]; then
-        new_filename="${filename%%\?*}"
-        extension="${filename##*.}"
-        new_filepath="$dir/$new_filename.$extension"
-        mv "$filepath" "$new_filepath"
-    fi
-done
+# Strips URL residue ('cover.jpg?from_search=true' -> 'cover.jpg') from every file,
+# planned in one pass and applied crash-safely by the shared rename engine
+python "$(dirname "$0")/src/rename_engine.py" --root "$DATASET_DIR" --mode sanitize || exit 1
 
 echo "✅ Filename cleaning complete."
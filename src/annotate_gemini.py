@@ -1,76 +1,97 @@
-import google.generativeai as genai
 import os
-import json
-from PIL import Image
 from tqdm import tqdm
-import time
+import argparse
 
-# --- Configure the API Key ---
-# This securely gets the key from your Codespace secrets
-try:
-    API_KEY = os.environ['GEMINI_API_KEY']
-    genai.configure(api_key=API_KEY)
-except KeyError:
-    print("ERROR: GEMINI_API_KEY not found in environment secrets.")
-    print("Please follow the setup steps to add your API key to Codespaces secrets and reload the window.")
-    exit()
+from annotation_cache import AnnotationCache
+from annotation_store import AnnotationStore
+from normalize import Normalizer
+from gemini_client import BATCH_SIZE, GEMINI_MODEL_NAME, AnnotationBatcher, GeminiConfigError, gemini_model
+from annotation_scheduler import AnnotationScheduler, DEFAULT_RPM, DEFAULT_MAX_IN_FLIGHT
+import metrics
+
+PROMPT = """
+Analyze this book cover image. Identify every distinct region containing text.
+For each text region, provide the corner coordinates of its bounding polygon.
+Your response MUST be a single, valid JSON object and nothing else.
+The JSON object should have one key: "shapes".
+The value of "shapes" should be a list of objects, where each object has:
+- A "label" key with the value "text".
+- A "points" key with a list of [x, y] coordinates for the polygon.
+Example: {"shapes": [{"label": "text", "points": [[x1,y1],[x2,y2],[x3,y3],[x4,y4]]}]}
+"""
+
+def auto_annotate_with_gemini(image_dir, model=None, scheduler=None, batch_size=BATCH_SIZE):
+    """
+    Uses the Gemini API to generate annotations in LabelMe JSON format.
+    Covers are sent `batch_size` to a request; calls run concurrently through
+    an AnnotationScheduler that paces them to the API quota. `model` may be
+    any object with `generate_content` (e.g. a fake).
+    """
 
-def auto_annotate_with_gemini(image_dir):
-    """Uses the Gemini API to generate annotations in LabelMe JSON format."""
-    
     print("Initializing Gemini Pro Vision model...")
-    model = genai.GenerativeModel('gemini-1.5-flash-latest')
-    
+    # Annotations live in one store per directory; it also seeds the cache (by image hash + model + prompt)
+    annotations = AnnotationStore(image_dir)
+    cache = AnnotationCache()
+    cache.warm(annotations, "gemini", GEMINI_MODEL_NAME, PROMPT)
+    # Gemini sees a size-capped copy; polygons come back in original pixels
+    normalizer = Normalizer(store=cache.store)
+
     image_files = [f for f in os.listdir(image_dir) if f.lower().endswith(('.png', '.jpg', '.jpeg'))]
     print(f"Found {len(image_files)} images to annotate...")
 
-    for filename in tqdm(image_files, desc="Annotating with Gemini"):
+    annotated = set(annotations.names())
+    tasks = []
+    for filename in image_files:
         image_path = os.path.join(image_dir, filename)
-        json_path = os.path.join(image_dir, os.path.splitext(filename)[0] + '.json')
 
-        if os.path.exists(json_path):
+        if filename in annotated:
             continue
+        # A copy of this cover (under any name) may already be annotated
+        if cache.reuse(image_path, annotations, "gemini", GEMINI_MODEL_NAME, PROMPT):
+            continue
+        tasks.append(filename)
 
-        try:
-            img = Image.open(image_path)
-            
-            prompt = """
-            Analyze this book cover image. Identify every distinct region containing text.
-            For each text region, provide the corner coordinates of its bounding polygon.
-            Your response MUST be a single, valid JSON object and nothing else.
-            The JSON object should have one key: "shapes".
-            The value of "shapes" should be a list of objects, where each object has:
-            - A "label" key with the value "text".
-            - A "points" key with a list of [x, y] coordinates for the polygon.
-            Example: {"shapes": [{"label": "text", "points": [[x1,y1],[x2,y2],[x3,y3],[x4,y4]]}]}
-            """
-
-            response = model.generate_content([prompt, img])
-            cleaned_response = response.text.strip().replace("json", "").replace("", "")
-            data = json.loads(cleaned_response)
-            
-            labelme_output = {
-                "version": "5.0.1", "flags": {},
-                "shapes": data.get("shapes", []),
-                "imagePath": filename, "imageData": None,
-                "imageHeight": img.height, "imageWidth": img.width,
-            }
-
-            for shape in labelme_output["shapes"]:
-                shape["group_id"] = None
-                shape["shape_type"] = "polygon"
-                shape["flags"] = {}
-
-            with open(json_path, 'w') as f:
-                json.dump(labelme_output, f, indent=2)
-
-            time.sleep(1.5)
+    if not tasks:
+        print("All images are already annotated.")
+        return
+    # The Gemini client is only set up when there is something to send it
+    model = model or gemini_model(GEMINI_MODEL_NAME)
 
-        except Exception as e:
-            print(f"\nCould not process {filename}. Error: {e}")
-            time.sleep(5)
+    own_scheduler = scheduler is None
+    scheduler = scheduler or AnnotationScheduler()
+    batcher = AnnotationBatcher(model, PROMPT, scheduler, batch_size, store=annotations, normalizer=normalizer)
+    paths = [os.path.join(image_dir, filename) for filename in tasks]
+    with metrics.stage("annotate", images=len(tasks)):
+        for image_path, labelme, error in tqdm(batcher.map(paths), total=len(paths), desc="Annotating with Gemini"):
+            if error is not None:
+                print(f"\nCould not process {os.path.basename(image_path)}. Error: {error}")
+            else:
+                cache.put(image_path, labelme, "gemini", GEMINI_MODEL_NAME, PROMPT)
+    batcher.close()
+    batcher.report()
+    scheduler.report()
+    cache.report()
+    normalizer.report()
+    annotations.report()
+    if own_scheduler: scheduler.close()
 
     print("\n✅ Gemini annotation complete!")
 
-if _name_ == '_main_':
-    auto_annotate_with_gemini('book_covers_mixed')
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Annotate book covers with Gemini")
+    parser.add_argument('--dir', type=str, default='book_covers_mixed', help='Directory of images to annotate')
+    parser.add_argument('--rpm', type=float, default=DEFAULT_RPM, help='Requests-per-minute quota')
+    parser.add_argument('--tpm', type=float, default=None, help='Tokens-per-minute quota (optional)')
+    parser.add_argument('--max-in-flight', type=int, default=DEFAULT_MAX_IN_FLIGHT, help='Upper bound on concurrent calls')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Covers per Gemini request (1 = one each)')
+    metrics.add_arguments(parser)
+    args = parser.parse_args()
+    metrics.configure_from_args(args, "annotate_gemini")
+
+    try:
+        with AnnotationScheduler(rpm=args.rpm, tpm=args.tpm, max_in_flight=args.max_in_flight) as scheduler:
+            auto_annotate_with_gemini(args.dir, scheduler=scheduler, batch_size=args.batch_size)
+    except GeminiConfigError as e:
+        print(f"ERROR: Could not configure the Gemini API. {e}")
+        print("Add your key to the GEMINI_API_KEY environment variable (e.g. Codespaces secrets) and try again.")
+        exit(1)
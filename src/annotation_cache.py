@@ -0,0 +1,183 @@
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from annotation_store import AnnotationStore, annotator_name
+from image_store import ImageStore
+import metrics
+
+# --- Configuration ---
+CACHE_PATH = ".annotation_cache.sqlite3"
+MAX_ASPECT_DIFF = 0.01  # a near-duplicate's annotation is reused only if the aspect ratios match this closely
+
+
+def prompt_hash(prompt):
+    return hashlib.sha256(prompt.strip().encode('utf-8')).hexdigest()[:16]
+
+
+def rescale(labelme, filename, width, height):
+    """
+    Copy of a LabelMe dict with its points scaled to a `width` x `height`
+    image of the same aspect ratio, by one factor for both axes.
+    """
+    scale = width / labelme['imageWidth']
+    shapes = [dict(shape, points=[[x * scale, y * scale] for x, y in shape['points']]) for shape in labelme['shapes']]
+    return dict(labelme, shapes=shapes, imagePath=filename, imageWidth=width, imageHeight=height)
+
+
+class AnnotationCache:
+    """
+    Persistent annotation results keyed by
+    (image SHA-256, annotator backend, model name, prompt hash).
+    Annotations therefore survive renames and moves between directories, and
+    changing the prompt or model naturally misses instead of serving stale
+    output. With `near_duplicates`, a miss falls back to the image's
+    near-duplicate group in the ImageStore, so a resized copy of an annotated
+    cover with the same aspect ratio is also a hit. It is off by default: a
+    wrong group would be a wrong label stored without any API call to flag it.
+    """
+
+    def __init__(self, path=CACHE_PATH, store=None, near_duplicates=False):
+        self.store = store or ImageStore()
+        self.near_duplicates = near_duplicates
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("""CREATE TABLE IF NOT EXISTS annotations (
+            sha TEXT, backend TEXT, model TEXT, prompt_hash TEXT,
+            width INTEGER, height INTEGER, labelme TEXT, created REAL,
+            PRIMARY KEY (sha, backend, model, prompt_hash))""")
+        self.db.commit()
+        self.stats = {"hits": 0, "misses": 0}
+
+    def _get(self, sha, key):
+        with self.lock:
+            row = self.db.execute(
+                "SELECT labelme FROM annotations WHERE sha=? AND backend=? AND model=? AND prompt_hash=?",
+                (sha, *key)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _get_near(self, sha, canonical, key, filename):
+        """A cached annotation of another image in `canonical`'s group with the same aspect ratio as `sha`."""
+        width, height = self.store.size(sha)
+        for other in self.store.group(canonical):
+            if other == sha:
+                continue
+            labelme = self._get(other, key)
+            if labelme is not None and abs(labelme['imageWidth'] * height / labelme['imageHeight'] - width) \
+                    <= MAX_ASPECT_DIFF * width:
+                return rescale(labelme, filename, width, height)
+        return None
+
+    def lookup(self, image_path, backend, model, prompt=""):
+        """Returns the cached LabelMe dict for this image, or None."""
+        key = (backend, model, prompt_hash(prompt))
+        filename = os.path.basename(image_path)
+        sha, canonical, _ = self.store.add_file(image_path)
+        labelme = self._get(sha, key)
+        if labelme is not None:
+            labelme = dict(labelme, imagePath=filename)
+        elif self.near_duplicates and canonical != sha:
+            labelme = self._get_near(sha, canonical, key, filename)
+        if labelme is not None:
+            with self.lock:
+                self.stats["hits"] += 1
+            metrics.inc("annotation_cache_lookups_total", backend=backend, result="hit")
+            return labelme
+        with self.lock:
+            self.stats["misses"] += 1
+        metrics.inc("annotation_cache_lookups_total", backend=backend, result="miss")
+        return None
+
+    def reuse(self, image_path, annotations, backend, model, prompt=""):
+        """Saves the cached annotation for `image_path` in the AnnotationStore `annotations`; True on a hit."""
+        labelme = self.lookup(image_path, backend, model, prompt)
+        if labelme is None:
+            return False
+        annotations.put(os.path.basename(image_path), labelme, annotator_name(backend, model))
+        return True
+
+    def put(self, image_path, labelme, backend, model, prompt=""):
+        """Caches `labelme` under the image's hash."""
+        key = (backend, model, prompt_hash(prompt))
+        sha, _, _ = self.store.add_file(image_path)
+        row = (sha, *key, labelme['imageWidth'], labelme['imageHeight'], json.dumps(labelme), time.time())
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO annotations VALUES (?, ?, ?, ?, ?, ?, ?, ?)", row)
+            self.db.commit()
+
+    def warm(self, annotations, backend, model, prompt=""):
+        """
+        Seeds the cache from an image directory's AnnotationStore: rows made by
+        this backend/model, or of unknown origin (e.g. imported sidecars),
+        count as results of the given prompt. Images already cached are
+        skipped without fetching their shapes, so warming again is cheap.
+        """
+        key = (backend, model, prompt_hash(prompt))
+        with self.lock:
+            known = {row[0] for row in self.db.execute(
+                "SELECT sha FROM annotations WHERE backend=? AND model=? AND prompt_hash=?", key)}
+        shas = {}
+        for name in annotations.names(annotators=(annotator_name(backend, model), None)):
+            image_path = os.path.join(annotations.image_dir, name)
+            if not os.path.exists(image_path):
+                continue
+            sha, _, _ = self.store.add_file(image_path)
+            if sha not in known:
+                shas[name] = sha
+                known.add(sha)
+        rows = [(shas[name], *key, labelme['imageWidth'], labelme['imageHeight'], json.dumps(labelme), time.time())
+                for name, labelme in annotations.documents(shas)]
+        with self.lock:
+            self.db.executemany("INSERT OR REPLACE INTO annotations VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            self.db.commit()
+        return len(rows)
+
+    def compact(self, keep_prompts=None):
+        """
+        Drops entries whose image is no longer in the ImageStore (and, if given,
+        entries made with prompt hashes outside `keep_prompts`), then VACUUMs.
+        Returns the number of rows removed.
+        """
+        live = self.store.all_shas()
+        with self.lock:
+            rows = self.db.execute("SELECT rowid, sha, prompt_hash FROM annotations").fetchall()
+            dead = [(rowid,) for rowid, sha, ph in rows
+                    if sha not in live or (keep_prompts is not None and ph not in keep_prompts)]
+            self.db.executemany("DELETE FROM annotations WHERE rowid=?", dead)
+            self.db.commit()
+            self.db.execute("VACUUM")
+        return len(dead)
+
+    def report(self):
+        print(f"Annotation cache: {self.stats['hits']} hits, {self.stats['misses']} misses")
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Maintain the persistent annotation cache")
+    sub = parser.add_subparsers(dest='command', required=True)
+    warm = sub.add_parser('warm', help="Import an image directory's annotation store")
+    warm.add_argument('--dir', type=str, default='book_covers_mixed')
+    warm.add_argument('--backend', type=str, default='gemini')
+    warm.add_argument('--model', type=str, default='gemini-1.5-flash-latest')
+    warm.add_argument('--prompt-file', type=str, default=None, help='File holding the prompt the annotations were made with')
+    sub.add_parser('compact', help='Drop entries for images no longer in the image store and VACUUM')
+    args = parser.parse_args()
+
+    cache = AnnotationCache()
+    if args.command == 'warm':
+        prompt = open(args.prompt_file).read() if args.prompt_file else ""
+        annotations = AnnotationStore(args.dir)
+        print(f"Imported {cache.warm(annotations, args.backend, args.model, prompt)} annotations.")
+        annotations.close()
+    else:
+        print(f"Removed {cache.compact()} stale annotations.")
+    cache.close()
@@ -0,0 +1,143 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from fetcher import TokenBucket
+from gemini_client import is_retryable
+import metrics
+
+# --- Configuration ---
+DEFAULT_RPM = 60              # requests per minute allowed by the API quota
+DEFAULT_TPM = None            # tokens per minute (None = unlimited)
+DEFAULT_TOKENS_PER_REQUEST = 1500
+DEFAULT_MAX_IN_FLIGHT = 8
+DEFAULT_MAX_RETRIES = 5
+BACKOFF_BASE = 1.0            # seconds; retry n sleeps uniform(0, BACKOFF_BASE * 2**n)
+BACKOFF_CAP = 60.0
+
+
+class AnnotationScheduler:
+    """
+    Worker pool for remote annotation calls that tracks the API quota.
+
+    Requests are paced by a requests-per-minute token bucket (and optionally a
+    tokens-per-minute one). The number of calls in flight follows AIMD: it grows
+    by roughly one per window of successes and halves on a 429/5xx, never
+    exceeding `max_in_flight`; other errors leave it unchanged. Throttled or
+    transient failures are retried with full-jitter exponential backoff;
+    anything else fails the task immediately.
+    """
+
+    def __init__(self, rpm=DEFAULT_RPM, tpm=DEFAULT_TPM, tokens_per_request=DEFAULT_TOKENS_PER_REQUEST,
+                 max_in_flight=DEFAULT_MAX_IN_FLIGHT, max_retries=DEFAULT_MAX_RETRIES,
+                 retryable=is_retryable, sleep=time.sleep):
+        self.request_bucket = TokenBucket(rpm / 60.0, capacity=max(1, min(max_in_flight, rpm / 60.0 * 5)))
+        self.token_bucket = TokenBucket(tpm / 60.0, capacity=tpm / 6.0) if tpm else None
+        self.tokens_per_request = tokens_per_request
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.retryable = retryable
+        self.sleep = sleep
+
+        self.limit = 1.0
+        self.in_flight = 0
+        self.pending = 0  # submitted and not finished, whether queued, waiting for a slot or in flight
+        self.cond = threading.Condition()
+        self.pool = ThreadPoolExecutor(max_workers=max_in_flight)
+        self.stats = {"calls": 0, "succeeded": 0, "retries": 0, "throttled": 0, "failed": 0}
+
+    # --- AIMD concurrency window ---
+    def _enter(self):
+        with self.cond:
+            while self.in_flight >= int(self.limit):
+                self.cond.wait()
+            self.in_flight += 1
+            metrics.gauge("api_in_flight", self.in_flight)
+
+    def _leave(self, outcome="ok"):
+        """Frees a slot; "ok" grows the window, "throttled" halves it and "failed" leaves it as is."""
+        with self.cond:
+            self.in_flight -= 1
+            if outcome == "throttled":
+                self.limit = max(1.0, self.limit / 2)
+                self.stats["throttled"] += 1
+            elif outcome == "ok":
+                self.limit = min(float(self.max_in_flight), self.limit + 1.0 / self.limit)
+            metrics.gauge("api_in_flight", self.in_flight)
+            metrics.gauge("api_queue_depth", self.pending - self.in_flight)
+            metrics.gauge("api_concurrency_limit", int(self.limit))
+            self.cond.notify_all()
+
+    def _call(self, fn, args, kwargs, weight):
+        attempt = 0
+        while True:
+            self._enter()
+            self.request_bucket.acquire()
+            if self.token_bucket:
+                # A batched call spends tokens for each of its images, up to what the bucket can ever hold
+                self.token_bucket.acquire(min(self.tokens_per_request * weight, self.token_bucket.capacity))
+            start = time.perf_counter()
+            try:
+                with self.cond:
+                    self.stats["calls"] += 1
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                throttled = self.retryable(e)
+                # A non-retryable error (bad request, bad prompt) says nothing about capacity
+                self._leave("throttled" if throttled else "failed")
+                metrics.observe("api_call_seconds", time.perf_counter() - start, outcome="error")
+                if not throttled or attempt >= self.max_retries:
+                    with self.cond:
+                        self.stats["failed"] += 1
+                    metrics.inc("api_calls_total", outcome="failed")
+                    raise
+                with self.cond:
+                    self.stats["retries"] += 1
+                metrics.inc("api_calls_total", outcome="retried")
+                self.sleep(random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt)))
+                attempt += 1
+                continue
+            self._leave()
+            metrics.observe("api_call_seconds", time.perf_counter() - start, outcome="ok")
+            metrics.inc("api_calls_total", outcome="ok")
+            with self.cond:
+                self.stats["succeeded"] += 1
+            return result
+
+    def submit(self, fn, *args, weight=1, **kwargs):
+        """Schedules one call, costing `weight` requests' worth of tokens, and returns its Future."""
+        with self.cond:
+            self.pending += 1
+            metrics.gauge("api_queue_depth", self.pending - self.in_flight)
+        future = self.pool.submit(self._call, fn, args, kwargs, weight)
+        future.add_done_callback(self._finished)
+        return future
+
+    def _finished(self, future):
+        with self.cond:
+            self.pending -= 1
+            metrics.gauge("api_queue_depth", self.pending - self.in_flight)
+
+    def map(self, fn, items):
+        """Runs `fn(item)` for every item; yields `(item, result, error)` as calls complete."""
+        futures = {self.submit(fn, item): item for item in items}
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result(), None
+            except Exception as e:
+                yield futures[future], None, e
+
+    def report(self):
+        s = self.stats
+        print(f"Annotation calls: {s['calls']} ({s['succeeded']} ok, {s['retries']} retried, "
+              f"{s['throttled']} throttled, {s['failed']} failed); final concurrency {int(self.limit)}")
+
+    def close(self):
+        self.pool.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,259 @@
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# --- Configuration ---
+STORE_NAME = "annotations.sqlite3"  # one store per image directory, next to the covers
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+BATCH_SIZE = 500                    # rows per transaction on import, names per SELECT ... IN (...) on export
+
+
+def annotator_name(backend, model):
+    """'gemini:gemini-1.5-flash-latest', 'easyocr:en+hi', ..."""
+    return f"{backend}:{model}"
+
+
+def _labelme(shapes, filename, width, height):
+    """A stored row as the LabelMe document the annotation tool opens."""
+    return {
+        "version": "5.0.1", "flags": {},
+        "shapes": shapes,
+        "imagePath": filename, "imageData": None,
+        "imageHeight": height, "imageWidth": width,
+    }
+
+
+class AnnotationStore:
+    """
+    Every annotation of one image directory in a single SQLite file (WAL), in
+    place of a LabelMe JSON sidecar per image. Each row holds the image's
+    name, size, shapes, and where they came from (`source`: the site the
+    cover was scraped from, `annotator`: backend and model), plus created and
+    updated times. A digest of size and shapes lets builders spot changed
+    labels without reading them. Shape counts are indexed, so "covers with no
+    text found" is a query rather than a scan. LabelMe and YOLO files are
+    exports, written on demand.
+    """
+
+    def __init__(self, image_dir, import_legacy=True):
+        self.image_dir = image_dir
+        self.path = os.path.join(image_dir, STORE_NAME)
+        os.makedirs(image_dir, exist_ok=True)
+        is_new = not os.path.exists(self.path)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(self.path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")  # WAL stays consistent on crash; only the last commits can be lost
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS annotations (
+                name TEXT PRIMARY KEY, width INTEGER, height INTEGER, shapes TEXT, shape_count INTEGER,
+                digest TEXT, source TEXT, annotator TEXT, created REAL, updated REAL);
+            CREATE INDEX IF NOT EXISTS annotations_shape_count ON annotations(shape_count);
+            CREATE INDEX IF NOT EXISTS annotations_annotator ON annotations(annotator);
+        """)
+        self.db.commit()
+        if is_new and import_legacy:
+            # A directory annotated before the store existed keeps its annotations
+            count = self.import_sidecars()
+            if count:
+                print(f"Imported {count} LabelMe sidecars from '{image_dir}' into '{self.path}'.")
+
+    # --- Writing ---
+    def put(self, name, labelme, annotator=None, source=None):
+        """Stores (or replaces) the annotation of image `name`; a None annotator/source keeps the stored one."""
+        self.put_many([(name, labelme, annotator, source)])
+
+    def put_many(self, rows):
+        """Bulk `put` of `(name, labelme, annotator, source)` rows in one transaction."""
+        now = time.time()
+        values = []
+        for name, labelme, annotator, source in rows:
+            shapes = json.dumps(labelme['shapes'], ensure_ascii=False, separators=(',', ':'))
+            width, height = labelme['imageWidth'], labelme['imageHeight']
+            digest = hashlib.sha256(f"{width}x{height}|{shapes}".encode('utf-8')).hexdigest()[:16]
+            values.append((name, width, height, shapes, len(labelme['shapes']), digest, source, annotator, now, now))
+        with self.lock:
+            self.db.executemany("""
+                INSERT INTO annotations VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(name) DO UPDATE SET
+                    width=excluded.width, height=excluded.height, shapes=excluded.shapes,
+                    shape_count=excluded.shape_count, digest=excluded.digest,
+                    source=COALESCE(excluded.source, source), annotator=COALESCE(excluded.annotator, annotator),
+                    updated=excluded.updated""", values)
+            self.db.commit()
+        return len(values)
+
+    def delete(self, names):
+        with self.lock:
+            self.db.executemany("DELETE FROM annotations WHERE name=?", [(n,) for n in names])
+            self.db.commit()
+
+    # --- Reading ---
+    def __contains__(self, name):
+        with self.lock:
+            return self.db.execute("SELECT 1 FROM annotations WHERE name=?", (name,)).fetchone() is not None
+
+    def __len__(self):
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM annotations").fetchone()[0]
+
+    def get(self, name):
+        """The LabelMe dict of image `name`, or None."""
+        for _, labelme in self.documents([name]):
+            return labelme
+        return None
+
+    def names(self, annotators=None, min_shapes=None, max_shapes=None):
+        """
+        Annotated image names, optionally filtered by annotator and shape count
+        (both indexed). A None among `annotators` matches rows of unknown origin.
+        """
+        clauses, params = [], []
+        if annotators is not None:
+            known = [a for a in annotators if a is not None]
+            either = [f"annotator IN ({','.join('?' * len(known))})"] if known else []
+            either += ["annotator IS NULL"] if None in annotators else []
+            clauses.append("(" + " OR ".join(either) + ")" if either else "0")
+            params += known
+        for clause, value in (("shape_count>=?", min_shapes), ("shape_count<=?", max_shapes)):
+            if value is not None:
+                clauses.append(clause)
+                params.append(value)
+        where = " WHERE " + " AND ".join(clauses) if clauses else ""
+        with self.lock:
+            return [row[0] for row in self.db.execute(f"SELECT name FROM annotations{where} ORDER BY name", params)]
+
+    def digests(self):
+        """{name: digest} for every annotation; changes whenever the size or any shape does."""
+        with self.lock:
+            return dict(self.db.execute("SELECT name, digest FROM annotations"))
+
+    def documents(self, names=None):
+        """Yields `(name, labelme)` for `names` (default: all, by name), fetched a batch at a time."""
+        names = self.names() if names is None else list(names)
+        for start in range(0, len(names), BATCH_SIZE):
+            batch = names[start:start + BATCH_SIZE]
+            with self.lock:
+                rows = {row[0]: row[1:] for row in self.db.execute(
+                    f"SELECT name, width, height, shapes FROM annotations WHERE name IN ({','.join('?' * len(batch))})",
+                    batch)}
+            for name in batch:
+                if name in rows:
+                    width, height, shapes = rows[name]
+                    yield name, _labelme(json.loads(shapes), name, width, height)
+
+    def stats(self):
+        with self.lock:
+            total, empty, shapes = self.db.execute(
+                "SELECT COUNT(*), SUM(shape_count = 0), COALESCE(SUM(shape_count), 0) FROM annotations").fetchone()
+            by_annotator = dict(self.db.execute("SELECT COALESCE(annotator, '?'), COUNT(*) FROM annotations GROUP BY 1"))
+        return {"images": total, "empty": empty or 0, "shapes": shapes, "by_annotator": by_annotator}
+
+    # --- Import / export ---
+    def import_sidecars(self, sidecar_dir=None, annotator=None, source=None):
+        """
+        Imports the LabelMe JSON sidecars of `sidecar_dir` (default: this
+        store's directory, e.g. files exported for review and edited) for the
+        images of this directory. A sidecar older than the stored row is
+        skipped without being parsed, so re-running the import is cheap.
+        Returns the number of annotations imported.
+        """
+        with self.lock:
+            updated = dict(self.db.execute("SELECT name, updated FROM annotations"))
+        images = {os.path.splitext(entry.name)[0]: entry.name for entry in os.scandir(self.image_dir)
+                  if os.path.splitext(entry.name)[1].lower() in IMAGE_EXTENSIONS}
+        sidecars = {os.path.splitext(entry.name)[0]: entry for entry in os.scandir(sidecar_dir or self.image_dir)
+                    if entry.name.lower().endswith('.json')}
+        rows, count = [], 0
+        for base, entry in sidecars.items():
+            name = images.get(base)
+            if name is None or entry.stat().st_mtime <= updated.get(name, -1):
+                continue
+            with open(entry.path, 'r', encoding='utf-8') as f:
+                rows.append((name, json.load(f), annotator, source))
+            if len(rows) >= BATCH_SIZE:
+                count += self.put_many(rows)
+                rows = []
+        return count + self.put_many(rows)
+
+    def export_labelme(self, out_dir=None, names=None):
+        """Writes LabelMe sidecars (e.g. to correct them in the LabelMe tool); returns how many."""
+        out_dir = out_dir or self.image_dir
+        os.makedirs(out_dir, exist_ok=True)
+        count = 0
+        for name, labelme in self.documents(names):
+            with open(os.path.join(out_dir, os.path.splitext(name)[0] + '.json'), 'w', encoding='utf-8') as f:
+                json.dump(labelme, f, indent=2, ensure_ascii=False)
+            count += 1
+        return count
+
+    def export_yolo(self, out_dir, names=None, mode="bbox"):
+        """Writes one YOLO label file per annotated image (see yolo_convert); returns its stats."""
+        from yolo_convert import convert_documents
+        os.makedirs(out_dir, exist_ok=True)
+        documents = list(self.documents(names))
+        return convert_documents([labelme for _, labelme in documents],
+                                 [os.path.join(out_dir, os.path.splitext(name)[0] + '.txt') for name, _ in documents],
+                                 mode=mode)
+
+    def report(self):
+        s = self.stats()
+        print(f"Annotation store '{self.path}': {s['images']} images, {s['shapes']} shapes, "
+              f"{s['empty']} with no shapes")
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Query, import and export the annotation store of an image directory")
+    parser.add_argument('--dir', type=str, default='book_covers_mixed', help='Image directory (holds annotations.sqlite3)')
+    sub = parser.add_subparsers(dest='command', required=True)
+    importer = sub.add_parser('import', help='Import existing LabelMe JSON sidecars')
+    importer.add_argument('--from', dest='sidecar_dir', type=str, default=None, help='Sidecar directory (default: --dir)')
+    importer.add_argument('--annotator', type=str, default=None, help="e.g. 'gemini:gemini-pro-vision' or 'manual'")
+    importer.add_argument('--source', type=str, default=None, help="Where the covers came from, e.g. 'goodreads'")
+    importer.add_argument('--remove', action='store_true', help='Delete the sidecars once imported')
+    labelme = sub.add_parser('export-labelme', help='Write LabelMe JSON sidecars')
+    labelme.add_argument('--dst', type=str, default=None, help='Output directory (default: --dir)')
+    yolo = sub.add_parser('export-yolo', help='Write YOLO label files')
+    yolo.add_argument('--dst', type=str, required=True)
+    yolo.add_argument('--mode', choices=['bbox', 'seg'], default='bbox')
+    query = sub.add_parser('query', help='List annotated image names')
+    query.add_argument('--annotator', type=str, default=None)
+    query.add_argument('--min-shapes', type=int, default=None)
+    query.add_argument('--max-shapes', type=int, default=None, help='0 lists covers where no text was found')
+    sub.add_parser('stats', help='Counts per annotator')
+    args = parser.parse_args()
+
+    store = AnnotationStore(args.dir)
+    start = time.perf_counter()
+    if args.command == 'import':
+        count = store.import_sidecars(args.sidecar_dir, args.annotator, args.source)
+        print(f"Imported {count} annotations in {time.perf_counter() - start:.2f}s.")
+        if args.remove:
+            sidecar_dir = args.sidecar_dir or args.dir
+            stored = {os.path.splitext(n)[0] for n in store.names()}
+            removed = [f for f in os.listdir(sidecar_dir) if f.endswith('.json') and f[:-5] in stored]
+            for filename in removed:
+                os.remove(os.path.join(sidecar_dir, filename))
+            print(f"Removed {len(removed)} sidecars.")
+    elif args.command == 'export-labelme':
+        print(f"Wrote {store.export_labelme(args.dst)} LabelMe files in {time.perf_counter() - start:.2f}s.")
+    elif args.command == 'export-yolo':
+        stats = store.export_yolo(args.dst, mode=args.mode)
+        print(f"Wrote {stats['files']} label files ({stats['kept']} shapes kept, {stats['dropped']} dropped) "
+              f"in {time.perf_counter() - start:.2f}s.")
+    elif args.command == 'query':
+        for name in store.names(args.annotator and [args.annotator], args.min_shapes, args.max_shapes):
+            print(name)
+    else:
+        store.report()
+        for annotator, count in sorted(store.stats()["by_annotator"].items()):
+            print(f"  {annotator}: {count}")
+    store.close()
@@ -1,48 +1,186 @@
-import easyocr
-import json
 import os
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from tqdm import tqdm
+import numpy as np
 from PIL import Image
 
-def auto_annotate_images(image_dir):
-    """Uses EasyOCR to generate draft annotations in LabelMe JSON format."""
-    print("Loading EasyOCR model... (This will take time on first run)")
-    # Using gpu=False is crucial for Codespaces
-    reader = easyocr.Reader(['en', 'hi'], gpu=False) 
-    
+from annotation_cache import AnnotationCache
+from annotation_store import AnnotationStore, annotator_name
+from normalize import Normalizer
+import metrics
+
+# --- Configuration ---
+OCR_LANGUAGES = ['en', 'hi']
+BATCH_SIZE = 8                # images per detector forward pass
+BATCH_CANVAS_WH = (768, 1024)   # every image in a batch is resized to this (width, height)
+# 'auto' picks EasyOCR models from the filename prefix, so e.g. Kannada weights load only for Kannada covers
+LANGUAGES_BY_PREFIX = {
+    "hindi": ['hi', 'en'], "हिन्दी": ['hi', 'en'],
+    "marathi": ['mr', 'en'], "मराठी": ['mr', 'en'],
+    "kannada": ['kn', 'en'], "ಕನ್ನಡ": ['kn', 'en'],
+    "bengali": ['bn', 'en'], "বাংলা": ['bn', 'en'],
+    "tamil": ['ta', 'en'], "தமிழ்": ['ta', 'en'],
+}
+
+# --- Worker process state: one warm Reader per language set, loaded once ---
+_readers = {}
+
+def _init_worker(torch_threads):
+    """Pins PyTorch intra-op threads so N workers don't oversubscribe the cores."""
+    import torch
+    torch.set_num_threads(torch_threads)
+
+def _reader_for(languages):
+    import easyocr
+    key = tuple(languages)
+    if key not in _readers:
+        # Using gpu=False is crucial for Codespaces
+        _readers[key] = easyocr.Reader(list(languages), gpu=False, verbose=False)
+    return _readers[key]
+
+def ocr_batch(items, languages, batch_size=BATCH_SIZE):
+    """
+    Runs EasyOCR's batched API over `items` = [(read_path, orig_width, orig_height)]
+    in one call. `read_path` may be a downscaled copy; boxes are returned as
+    `[(points, text, prob), ...]` per item, in original-image pixels.
+    """
+    target_w, target_h = BATCH_CANVAS_WH
+    arrays = []
+    for read_path, _, _ in items:
+        with Image.open(read_path) as img:
+            arrays.append(np.asarray(img.convert('RGB')))
+
+    results = _reader_for(languages).readtext_batched(arrays, n_width=target_w, n_height=target_h, batch_size=batch_size)
+
+    output = []
+    for (_, w, h), result in zip(items, results):
+        sx, sy = w / target_w, h / target_h
+        output.append([([[float(x) * sx, float(y) * sy] for x, y in bbox], text, float(prob)) for bbox, text, prob in result])
+    return output
+
+def ocr_labelme(boxes, filename, width, height):
+    """OCR boxes as a LabelMe dict; each shape keeps its recognized text and EasyOCR's confidence (`score`)."""
+    return {
+        "version": "5.0.1", "flags": {},
+        "shapes": [{"label": "text", "points": points, "group_id": None, "shape_type": "polygon", "flags": {},
+                    "description": text, "score": round(prob, 4)} for points, text, prob in boxes],
+        "imagePath": filename, "imageData": None,
+        "imageHeight": height, "imageWidth": width,
+    }
+
+def run_ocr(batches, workers=1, torch_threads=None, batch_size=BATCH_SIZE, ocr=ocr_batch):
+    """
+    Runs `ocr` (default: EasyOCR's ocr_batch) over `batches` = [(entries, langs)]
+    in a pool of `workers` processes, where each entry is `(image_path,
+    read_path, width, height)`. Yields `(entries, langs, results, error)` as
+    batches complete; `results` holds each entry's `[(points, text, prob)]`.
+    """
+    torch_threads = torch_threads or max(1, (os.cpu_count() or 1) // workers)
+    # Only EasyOCR workers load PyTorch; another `ocr` (e.g. fakes.FakeOCR) runs in plain workers
+    initializer, initargs = (_init_worker, (torch_threads,)) if ocr is ocr_batch else (None, ())
+    with ProcessPoolExecutor(max_workers=workers, initializer=initializer, initargs=initargs) as pool:
+        futures = {pool.submit(ocr, [entry[1:] for entry in entries], langs, batch_size): (entries, langs)
+                   for entries, langs in batches}
+        for future in as_completed(futures):
+            entries, langs = futures[future]
+            try:
+                results = future.result()
+            except Exception as e:
+                metrics.inc("ocr_images_total", len(entries), outcome="failed")
+                yield entries, langs, None, e
+                continue
+            metrics.inc("ocr_images_total", len(entries), outcome="ok")
+            yield entries, langs, results, None
+
+def languages_for(filename, languages):
+    if languages != 'auto':
+        return languages
+    for prefix, langs in LANGUAGES_BY_PREFIX.items():
+        if filename.startswith(prefix):
+            return langs
+    return ['en']
+
+def auto_annotate_images(image_dir, languages=OCR_LANGUAGES, workers=1, torch_threads=None, batch_size=BATCH_SIZE):
+    """
+    Uses EasyOCR to generate draft annotations in LabelMe JSON format.
+    Images are grouped by language set and sent in batches to a pool of
+    `workers` processes, each holding its own warm Reader(s).
+    """
     image_files = [f for f in os.listdir(image_dir) if f.lower().endswith('.jpg')]
     print(f"Found {len(image_files)} images to annotate...")
 
-    for filename in tqdm(image_files, desc="Auto-Annotating"):
-        image_path = os.path.join(image_dir, filename)
-        json_path = os.path.join(image_dir, os.path.splitext(filename)[0] + '.json')
-
-        if os.path.exists(json_path): continue
-
-        try:
-            with Image.open(image_path) as img:
-                h, w = img.height, img.width
-            result = reader.readtext(image_path)
-
-            labelme_output = {
-                "version": "5.0.1", "flags": {}, "shapes": [],
-                "imagePath": filename, "imageData": None,
-                "imageHeight": h, "imageWidth": w,
-            }
-
-            for (bbox, text, prob) in result:
-                points = [list(map(float, p)) for p in bbox]
-                shape = {
-                    "label": "text", "points": points, "group_id": None,
-                    "shape_type": "polygon", "flags": {}
-                }
-                labelme_output["shapes"].append(shape)
-            
-            with open(json_path, 'w') as f:
-                json.dump(labelme_output, f, indent=2)
-        except Exception as e:
-            print(f"\nError on {filename}: {e}")
+    # Annotations live in one store per directory; it also seeds the cache (by image hash + language set)
+    annotations = AnnotationStore(image_dir)
+    annotated = set(annotations.names())
+    cache = AnnotationCache()
+    langs_of = {filename: tuple(languages_for(filename, languages)) for filename in image_files}
+    # Warmed under every language set looked up below, in languages_for's order ('auto' has several)
+    for langs in sorted(set(langs_of.values())):
+        cache.warm(annotations, "easyocr", "+".join(langs))
+    # Workers decode the size-capped copy; boxes are mapped back to original pixels
+    normalizer = Normalizer(store=cache.store)
+
+    batches_by_langs = {}
+    with metrics.stage("ocr_prepare"):
+        for filename in image_files:
+            image_path = os.path.join(image_dir, filename)
+            if filename in annotated: continue
+
+            langs = langs_of[filename]
+            # A copy of this cover (under any name) may already be annotated
+            if cache.reuse(image_path, annotations, "easyocr", "+".join(langs)): continue
+            read_path, _, (w, h) = normalizer.normalize(image_path)
+            batches_by_langs.setdefault(langs, []).append((image_path, read_path, w, h))
+
+    batches = [(entries[i:i + batch_size], langs)
+               for langs, entries in batches_by_langs.items()
+               for i in range(0, len(entries), batch_size)]
+    total = sum(len(entries) for entries, _ in batches)
+    if not total:
+        print("All images are already annotated.")
+        return
+
+    torch_threads = torch_threads or max(1, (os.cpu_count() or 1) // workers)
+    print(f"Loading EasyOCR model(s) in {workers} worker(s) x {torch_threads} thread(s)... (This will take time on first run)")
+    start = time.perf_counter()
+    done = 0
+    with metrics.stage("ocr", workers=workers), tqdm(total=total, desc="Auto-Annotating") as progress:
+        for entries, langs, results, error in run_ocr(batches, workers, torch_threads, batch_size):
+            progress.update(len(entries))
+            if error is not None:
+                print(f"\nError on batch starting {os.path.basename(entries[0][0])}: {error}")
+                continue
+
+            rows = []
+            for (image_path, _, w, h), boxes in zip(entries, results):
+                labelme_output = ocr_labelme(boxes, os.path.basename(image_path), w, h)
+                rows.append((os.path.basename(image_path), labelme_output,
+                             annotator_name("easyocr", "+".join(langs)), None))
+                cache.put(image_path, labelme_output, "easyocr", "+".join(langs))
+                done += 1
+            # One transaction per batch instead of one file per image
+            annotations.put_many(rows)
+
+    elapsed = time.perf_counter() - start
+    print(f"Annotated {done} images in {elapsed:.1f}s ({done / elapsed:.2f} images/sec, including model load)")
+    cache.report()
+    normalizer.report()
+    annotations.report()
 
 if __name__ == '__main__':
-    auto_annotate_images('book_covers_mixed')
+    parser = argparse.ArgumentParser(description="Draft text annotations with EasyOCR")
+    parser.add_argument('--dir', type=str, default='book_covers_mixed', help='Directory of images to annotate')
+    parser.add_argument('--langs', type=str, default=",".join(OCR_LANGUAGES),
+                        help="Comma-separated EasyOCR language codes, or 'auto' to choose per filename prefix")
+    parser.add_argument('--workers', type=int, default=1, help='OCR worker processes (one Reader each)')
+    parser.add_argument('--threads', type=int, default=None, help='PyTorch threads per worker (default: cores / workers)')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Images per batched detector call')
+    metrics.add_arguments(parser)
+    args = parser.parse_args()
+    metrics.configure_from_args(args, "auto_annotate")
+
+    languages = 'auto' if args.langs == 'auto' else args.langs.split(',')
+    auto_annotate_images(args.dir, languages, args.workers, args.threads, args.batch_size)
     print("\n✅ Auto-annotation complete!")
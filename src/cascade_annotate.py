@@ -0,0 +1,237 @@
+import os
+import time
+import argparse
+from concurrent.futures import as_completed
+from tqdm import tqdm
+
+from annotation_cache import AnnotationCache
+from annotation_scheduler import AnnotationScheduler, DEFAULT_RPM, DEFAULT_MAX_IN_FLIGHT
+from annotation_store import AnnotationStore, annotator_name
+from annotate_gemini import PROMPT
+from auto_annotate import BATCH_SIZE, OCR_LANGUAGES, languages_for, ocr_batch, ocr_labelme, run_ocr
+from gemini_client import BATCH_SIZE as GEMINI_BATCH_SIZE
+from gemini_client import GEMINI_MODEL_NAME, AnnotationBatcher, GeminiConfigError, gemini_model
+from normalize import Normalizer
+import metrics
+
+# --- Configuration ---
+THRESHOLD = 0.5        # covers whose OCR score is below this are sent to Gemini
+MIN_COVERAGE = 0.02    # share of a cover its text boxes span at the least; less suggests missed text
+MERGE_IOU = 0.3        # an OCR box overlapping a Gemini shape at least this much reads the same text
+MERGE_MIN_SCORE = 0.5  # OCR boxes Gemini missed are kept in a merge only above this confidence
+
+
+# --- Scoring and merging ---
+def _area(points):
+    """Shoelace area of a polygon."""
+    return abs(sum(x0 * y1 - x1 * y0 for (x0, y0), (x1, y1) in zip(points, points[1:] + points[:1]))) / 2
+
+def _bbox(points):
+    xs, ys = [p[0] for p in points], [p[1] for p in points]
+    return min(xs), min(ys), max(xs), max(ys)
+
+def _iou(a, b):
+    w = max(0.0, min(a[2], b[2]) - max(a[0], b[0]))
+    h = max(0.0, min(a[3], b[3]) - max(a[1], b[1]))
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - w * h
+    return w * h / union if union > 0 else 0.0
+
+def score_ocr(boxes, width, height):
+    """
+    How far EasyOCR's `[(points, text, prob)]` for one cover can be trusted, in
+    [0, 1]: the area-weighted mean box confidence, scaled down when the boxes
+    cover less than MIN_COVERAGE of the image. No boxes scores 0, since
+    every cover has at least a title.
+    """
+    areas = [_area(points) for points, _, _ in boxes]
+    total = sum(areas)
+    if total <= 0:
+        return 0.0
+    confidence = sum(area * prob for area, (_, _, prob) in zip(areas, boxes)) / total
+    coverage = total / (width * height)
+    return confidence * min(1.0, coverage / MIN_COVERAGE)
+
+def merge_shapes(gemini_shapes, ocr_shapes, iou=MERGE_IOU, min_score=MERGE_MIN_SCORE):
+    """
+    Gemini's shapes, each labelled with the text of an OCR box that overlaps
+    it, plus the confident OCR boxes Gemini missed.
+    """
+    merged = [dict(shape) for shape in gemini_shapes]
+    boxes = [_bbox(shape["points"]) for shape in merged]
+    for shape in ocr_shapes:
+        overlaps = [_iou(_bbox(shape["points"]), box) for box in boxes]
+        best = max(range(len(overlaps)), key=overlaps.__getitem__, default=None)
+        if best is not None and overlaps[best] >= iou:
+            merged[best].setdefault("description", shape.get("description"))
+        elif shape.get("score", 0) >= min_score:
+            merged.append(shape)
+    return merged
+
+
+def cascade_annotate(image_dir, threshold=THRESHOLD, merge=False, languages=OCR_LANGUAGES, workers=1,
+                     torch_threads=None, batch_size=BATCH_SIZE, gemini_batch_size=GEMINI_BATCH_SIZE,
+                     model=None, scheduler=None, ocr=ocr_batch):
+    """
+    Annotates covers with EasyOCR first and sends only the ones it is unsure
+    of to Gemini. Every cover's OCR result gets a score (see score_ocr); at or
+    above `threshold` it is kept, below it the cover is escalated and
+    Gemini's shapes are stored instead. With `merge`, they are merged with the
+    OCR boxes (see merge_shapes). Escalated covers go to Gemini in batches
+    while OCR carries on. The Gemini client is only set up once a cover
+    needs it. `threshold` 0 never escalates; above 1 escalates everything.
+    Returns the run's counts. If Gemini turns out not to be configured, the
+    OCR run still completes and stores its confident covers, and then the
+    GeminiConfigError is raised.
+    """
+    image_files = sorted(f for f in os.listdir(image_dir) if f.lower().endswith('.jpg'))
+    print(f"Found {len(image_files)} images to annotate...")
+
+    annotations = AnnotationStore(image_dir)
+    annotated = set(annotations.names())
+    cache = AnnotationCache()
+    cache.warm(annotations, "gemini", GEMINI_MODEL_NAME, PROMPT)
+    normalizer = Normalizer(store=cache.store)
+
+    batches_by_langs = {}
+    with metrics.stage("cascade_prepare"):
+        for filename in image_files:
+            image_path = os.path.join(image_dir, filename)
+            if filename in annotated: continue
+            # A copy of this cover (under any name) Gemini already annotated costs nothing
+            if cache.reuse(image_path, annotations, "gemini", GEMINI_MODEL_NAME, PROMPT): continue
+            langs = tuple(languages_for(filename, languages))
+            read_path, _, (w, h) = normalizer.normalize(image_path)
+            batches_by_langs.setdefault(langs, []).append((image_path, read_path, w, h))
+
+    batches = [(entries[i:i + batch_size], langs)
+               for langs, entries in batches_by_langs.items()
+               for i in range(0, len(entries), batch_size)]
+    total = sum(len(entries) for entries, _ in batches)
+    if not total:
+        print("All images are already annotated.")
+        return None
+
+    counts = {"images": total, "local": 0, "escalated": 0, "skipped": 0, "failed": 0, "gemini_calls": 0}
+    escalations = {}  # Future of the Gemini annotation -> (image path, OCR LabelMe, language set)
+    batcher = None
+    gemini_error = None  # GeminiConfigError from setting up the client; OCR carries on without escalating
+    own_scheduler = scheduler is None
+
+    def finish(future, progress):
+        image_path, ocr_result, langs = escalations.pop(future)
+        progress.update(1)
+        try:
+            labelme = future.result()
+        except Exception as e:
+            print(f"\nCould not process {os.path.basename(image_path)} with Gemini. Error: {e}")
+            counts["failed"] += 1
+            metrics.inc("cascade_images_total", outcome="failed")
+            return
+        cache.put(image_path, labelme, "gemini", GEMINI_MODEL_NAME, PROMPT)
+        annotator = annotator_name("gemini", GEMINI_MODEL_NAME)
+        if merge:
+            labelme = dict(labelme, shapes=merge_shapes(labelme["shapes"], ocr_result["shapes"]))
+            annotator = annotator_name("cascade", f"{GEMINI_MODEL_NAME}+easyocr:{'+'.join(langs)}")
+        annotations.put(os.path.basename(image_path), labelme, annotator)
+
+    start = time.perf_counter()
+    with metrics.stage("cascade", images=total), tqdm(total=total, desc="Cascade annotating") as progress:
+        for entries, langs, results, error in run_ocr(batches, workers, torch_threads, batch_size, ocr):
+            if error is not None:
+                print(f"\nError on batch starting {os.path.basename(entries[0][0])}: {error}")
+                counts["failed"] += len(entries)
+                progress.update(len(entries))
+                continue
+
+            rows = []
+            for (image_path, _, w, h), boxes in zip(entries, results):
+                labelme = ocr_labelme(boxes, os.path.basename(image_path), w, h)
+                if score_ocr(boxes, w, h) >= threshold:
+                    rows.append((os.path.basename(image_path), labelme, annotator_name("easyocr", "+".join(langs)), None))
+                    cache.put(image_path, labelme, "easyocr", "+".join(langs))
+                    continue
+                if batcher is None and gemini_error is None:
+                    try:
+                        model = model or gemini_model(GEMINI_MODEL_NAME)
+                    except GeminiConfigError as e:
+                        gemini_error = e
+                        print(f"\nCould not configure the Gemini API ({e}); low-confidence covers are left unannotated.")
+                    else:
+                        scheduler = scheduler or AnnotationScheduler()
+                        batcher = AnnotationBatcher(model, PROMPT, scheduler, gemini_batch_size, normalizer=normalizer)
+                if gemini_error is not None:
+                    # Not stored, so a re-run with a key picks the cover up again
+                    counts["skipped"] += 1
+                    metrics.inc("cascade_images_total", outcome="skipped")
+                    progress.update(1)
+                    continue
+                escalations[batcher.submit(image_path)] = (image_path, labelme, langs)
+                counts["escalated"] += 1
+                metrics.inc("cascade_images_total", outcome="escalated")
+            annotations.put_many(rows)
+            counts["local"] += len(rows)
+            metrics.inc("cascade_images_total", len(rows), outcome="local")
+            progress.update(len(rows))
+            # Store the Gemini answers that are in already, so a crash doesn't lose paid calls
+            for future in [f for f in escalations if f.done()]:
+                finish(future, progress)
+
+        for future in as_completed(list(escalations)):
+            finish(future, progress)
+
+    elapsed = time.perf_counter() - start
+    if batcher is not None:
+        batcher.close()
+        counts["gemini_calls"] = scheduler.stats["calls"]
+    all_gemini = -(-total // gemini_batch_size)
+    rate = (counts["escalated"] + counts["skipped"]) / total  # share scored below the threshold
+    annotated = total - counts["failed"] - counts["skipped"]
+    counts["images_per_hour"] = annotated / elapsed * 3600
+    print(f"Cascade: {counts['local']} kept from EasyOCR, {counts['escalated']} escalated to Gemini "
+          f"({rate:.0%} at threshold {threshold}), {counts['failed']} failed")
+    if counts["skipped"]:
+        print(f"Skipped {counts['skipped']} low-confidence covers: Gemini is not configured.")
+    else:
+        print(f"Gemini calls: {counts['gemini_calls']}, instead of {all_gemini} with Gemini on every image "
+              f"(saved {all_gemini - counts['gemini_calls']})")
+    print(f"Annotated {annotated} images in {elapsed:.1f}s "
+          f"({counts['images_per_hour']:.0f} images/hour end to end, including model load)")
+    if batcher is not None:
+        batcher.report()
+        scheduler.report()
+        if own_scheduler: scheduler.close()
+    cache.report()
+    normalizer.report()
+    annotations.report()
+    if gemini_error is not None:
+        raise gemini_error
+    return counts
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Annotate with EasyOCR; escalate low-confidence covers to Gemini")
+    parser.add_argument('--dir', type=str, default='book_covers_mixed', help='Directory of images to annotate')
+    parser.add_argument('--threshold', type=float, default=THRESHOLD,
+                        help='OCR score (0-1) below which a cover goes to Gemini; 0 never escalates')
+    parser.add_argument('--merge', action='store_true', help="Merge Gemini's shapes with the confident OCR boxes")
+    parser.add_argument('--langs', type=str, default=",".join(OCR_LANGUAGES),
+                        help="Comma-separated EasyOCR language codes, or 'auto' to choose per filename prefix")
+    parser.add_argument('--workers', type=int, default=1, help='OCR worker processes (one Reader each)')
+    parser.add_argument('--threads', type=int, default=None, help='PyTorch threads per worker (default: cores / workers)')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Images per batched detector call')
+    parser.add_argument('--gemini-batch-size', type=int, default=GEMINI_BATCH_SIZE, help='Covers per Gemini request')
+    parser.add_argument('--rpm', type=float, default=DEFAULT_RPM, help='Gemini requests-per-minute quota')
+    parser.add_argument('--max-in-flight', type=int, default=DEFAULT_MAX_IN_FLIGHT, help='Upper bound on concurrent Gemini calls')
+    metrics.add_arguments(parser)
+    args = parser.parse_args()
+    metrics.configure_from_args(args, "cascade_annotate")
+
+    languages = 'auto' if args.langs == 'auto' else args.langs.split(',')
+    try:
+        with AnnotationScheduler(rpm=args.rpm, max_in_flight=args.max_in_flight) as scheduler:
+            cascade_annotate(args.dir, args.threshold, args.merge, languages, args.workers, args.threads,
+                             args.batch_size, args.gemini_batch_size, scheduler=scheduler)
+    except GeminiConfigError as e:
+        print(f"ERROR: Could not configure the Gemini API. {e}")
+        print("Covers EasyOCR was sure of are saved; add GEMINI_API_KEY and re-run to annotate the rest.")
+        exit(1)
+    print("\n✅ Cascade annotation complete!")
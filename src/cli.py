@@ -0,0 +1,56 @@
+import argparse
+import runpy
+import sys
+
+# --- Commands ---
+# command -> (help, option choosing the script, {choice: script module}); the first choice is the default.
+# Every script keeps its own flags; nothing is imported until a command is chosen.
+COMMANDS = {
+    "scrape": ("Download covers from a store's search results", "--site",
+               {"goodreads": "scraper", "amazon": "scraper_indic", "flipkart": "scraper_flipkart"}),
+    "annotate": ("Draft text annotations for a folder of covers", "--backend",
+                 {"gemini": "annotate_gemini", "easyocr": "auto_annotate", "cascade": "cascade_annotate",
+                  "transcribe": "recognize"}),
+    "annotations": ("Query, import and export a directory's annotation store", None, {"": "annotation_store"}),
+    "build": ("Incrementally build the YOLO dataset from annotated covers", None, {"": "dataset_builder"}),
+    "pack": ("Pack the YOLO dataset into tar shards with a random-access index", None, {"": "shards"}),
+    "rename": ("Crash-safe bulk rename of dataset files", None, {"": "rename_engine"}),
+    "train": ("Train the text detector on CPU", None, {"": "train"}),
+    "serve": ("Serve /api/detect/ with micro-batching", None, {"": "inference_server"}),
+    "pipeline": ("Scrape, annotate and export as one resumable run", None, {"": "master_pipeline"}),
+    "prepare": ("Annotate missing covers with Gemini, then build the dataset", None, {"": "prepare_dataset"}),
+}
+
+
+def usage():
+    lines = ["usage: cli.py <command> [options]   (cli.py <command> --help for its options)", "", "commands:"]
+    for name, (text, option, scripts) in COMMANDS.items():
+        choices = f"  [{option} {'|'.join(scripts)}]" if option else ""
+        lines.append(f"  {name:<10} {text}{choices}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    """Runs `<command>`'s script as if it had been started directly, with the remaining arguments."""
+    argv = list(sys.argv[1:] if argv is None else argv)
+    if not argv or argv[0] in ('-h', '--help'):
+        print(usage())
+        return
+    command, rest = argv[0], argv[1:]
+    if command not in COMMANDS:
+        sys.exit(f"cli.py: unknown command '{command}'\n\n{usage()}")
+
+    _, option, scripts = COMMANDS[command]
+    choice = ""
+    if option:
+        selector = argparse.ArgumentParser(add_help=False)
+        selector.add_argument(option, choices=list(scripts), default=next(iter(scripts)))
+        known, rest = selector.parse_known_args(rest)
+        choice = getattr(known, option.lstrip('-'))
+
+    sys.argv = [scripts[choice] + ".py", *rest]
+    runpy.run_module(scripts[choice], run_name="__main__", alter_sys=True)
+
+
+if __name__ == '__main__':
+    main()
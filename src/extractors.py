@@ -0,0 +1,143 @@
+import json
+import os
+from html.parser import HTMLParser
+
+# --- Configuration ---
+SELECTORS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "site_selectors.json")
+SELECTORS_ENV = "SCRAPER_SELECTORS"  # point at an edited copy when a site renames its classes
+CHUNK_SIZE = 16 * 1024                # bytes fed per step; parsing stops at the first chunk that satisfies `limit`
+ENGINES = ("lxml", "stream", "strainer")
+
+
+def load_selectors(path=None):
+    """{site: {field: {"tag", "class", "attr", "skip"?}}} from JSON ($SCRAPER_SELECTORS overrides the default file)."""
+    with open(path or os.environ.get(SELECTORS_ENV) or SELECTORS_PATH, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def default_engine():
+    """lxml's C parser when installed, else the stdlib streaming parser."""
+    try:
+        import lxml.etree  # noqa: F401
+        return "lxml"
+    except ImportError:
+        return "stream"
+
+
+def _matches(rule, tag, get):
+    if tag != rule["tag"]:
+        return None
+    wanted = rule.get("class")
+    if wanted and wanted not in (get("class") or "").split():
+        return None
+    value = get(rule["attr"])
+    if not value or any(s in value for s in rule.get("skip", ())):
+        return None
+    return value
+
+
+class _StreamParser(HTMLParser):
+    """Start-tag callbacks only: nothing is kept but the matching attribute values."""
+
+    def __init__(self, rule, found):
+        super().__init__(convert_charrefs=False)
+        self.rule = rule
+        self.found = found
+
+    def handle_starttag(self, tag, attrs):
+        if tag == self.rule["tag"]:
+            value = _matches(self.rule, tag, dict(attrs).get)
+            if value is not None:
+                self.found.append(value)
+
+    handle_startendtag = handle_starttag
+
+
+class _LxmlTarget:
+    """lxml parser target: receives start events from the C parser, builds no tree."""
+
+    def __init__(self, rule, found):
+        self.rule = rule
+        self.found = found
+
+    def start(self, tag, attrib):
+        value = _matches(self.rule, tag, attrib.get)
+        if value is not None:
+            self.found.append(value)
+
+    def close(self):
+        return self.found
+
+
+class SiteExtractor:
+    """
+    Pulls attribute values (links, image URLs) for one site out of raw page
+    bytes without building a document tree. What to look for comes from
+    site_selectors.json, so a renamed CSS class is a data edit rather than a
+    code change. Pages are fed in chunks and parsing stops as soon as
+    `limit` values are found, so a book page is done once its cover <img>
+    has gone by.
+    """
+
+    def __init__(self, site, selectors=None, engine=None):
+        self.site = site
+        self.rules = (selectors or load_selectors())[site]
+        self.engine = engine or default_engine()
+        if self.engine not in ENGINES:
+            raise ValueError(f"Unknown extraction engine '{self.engine}' (choose from {', '.join(ENGINES)})")
+
+    def describe(self, field):
+        rule = self.rules[field]
+        return f"<{rule['tag']} class='{rule.get('class', '')}'>"
+
+    def extract(self, content, field, limit=None):
+        """Values of `field`'s attribute, in page order, at most `limit` of them."""
+        rule = self.rules[field]
+        if isinstance(content, str):
+            content = content.encode("utf-8")
+        found = []
+        if self.engine == "strainer":
+            found = self._strainer(content, rule)
+        elif self.engine == "lxml":
+            from lxml import etree
+            parser = etree.HTMLParser(target=_LxmlTarget(rule, found))
+            self._feed(parser, content, found, limit)
+        else:
+            parser = _StreamParser(rule, found)
+            self._feed(parser, content.decode("utf-8", errors="replace"), found, limit)
+        return found[:limit] if limit else found
+
+    @staticmethod
+    def _feed(parser, text, found, limit):
+        for start in range(0, len(text), CHUNK_SIZE):
+            parser.feed(text[start:start + CHUNK_SIZE])
+            if limit and len(found) >= limit:
+                return
+        parser.close()
+
+    @staticmethod
+    def _strainer(content, rule):
+        """BeautifulSoup restricted by a SoupStrainer: only matching tags enter the tree."""
+        from bs4 import BeautifulSoup, SoupStrainer
+        attrs = {rule["attr"]: True}
+        if rule.get("class"):
+            attrs["class"] = rule["class"]
+        soup = BeautifulSoup(content, "html.parser", parse_only=SoupStrainer(rule["tag"], attrs=attrs))
+        return [tag[rule["attr"]] for tag in soup.find_all(rule["tag"])
+                if not any(s in tag[rule["attr"]] for s in rule.get("skip", ()))]
+
+    def first(self, content, field):
+        """The first value of `field`, or None."""
+        values = self.extract(content, field, limit=1)
+        return values[0] if values else None
+
+
+_extractors = {}
+
+
+def extractor_for(site, engine=None):
+    """Shared SiteExtractor per (site, engine); selectors are read once per process."""
+    key = (site, engine)
+    if key not in _extractors:
+        _extractors[key] = SiteExtractor(site, engine=engine)
+    return _extractors[key]
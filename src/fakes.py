@@ -0,0 +1,136 @@
+import json
+import random
+import re
+import threading
+import time
+import zlib
+from collections import deque
+
+IMAGE_ID = re.compile(r"Image (\S+) \(")  # the label gemini_client.annotate_batch puts before each image
+
+
+class FakeAPIError(Exception):
+    """Stands in for google.api_core errors: carries an HTTP status in `.code`."""
+
+    def __init__(self, code, message=""):
+        super().__init__(message or f"fake API error {code}")
+        self.code = code
+
+
+class FakeResponse:
+    def __init__(self, text, tokens):
+        self.text = text
+        self.usage_metadata = type("UsageMetadata", (), {"total_token_count": tokens})()
+
+
+class FakeGenerativeModel:
+    """
+    Offline stand-in for `genai.GenerativeModel` used to exercise the annotation
+    scheduler. Each call sleeps `latency` seconds (plus up to `jitter`), fails
+    with a 5xx at `error_rate`, and returns 429 whenever more than `quota_rpm`
+    calls arrived in the last minute. Each image adds `per_image` seconds.
+    Replies contain one box per image; a multi-image request (gemini_client's
+    "Image <id> (...)" parts) gets one entry per id, of which `invalid_rate`
+    are dropped or pushed off the image.
+    """
+
+    def __init__(self, latency=0.2, jitter=0.0, error_rate=0.0, quota_rpm=None, seed=0, per_image=0.0,
+                 invalid_rate=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.per_image = per_image
+        self.invalid_rate = invalid_rate
+        self.quota_rpm = quota_rpm
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.recent = deque()
+        self.calls = 0
+
+    def generate_content(self, contents, generation_config=None):
+        images = [part for part in contents if hasattr(part, "size")]
+        ids = [m.group(1) for part in contents if isinstance(part, str) for m in [IMAGE_ID.match(part)] if m]
+        with self.lock:
+            self.calls += 1
+            now = time.monotonic()
+            while self.recent and now - self.recent[0] > 60:
+                self.recent.popleft()
+            self.recent.append(now)
+            over_quota = self.quota_rpm is not None and len(self.recent) > self.quota_rpm
+            fail = self.random.random() < self.error_rate
+            delay = self.latency + self.random.random() * self.jitter + self.per_image * len(images)
+            invalid = [self.random.random() < self.invalid_rate for _ in ids]
+        if over_quota:
+            raise FakeAPIError(429, "Resource has been exhausted (fake quota)")
+        time.sleep(delay)
+        if fail:
+            raise FakeAPIError(503, "Service unavailable (fake)")
+
+        tokens = 258 * max(1, len(images))
+        if ids and len(ids) == len(images):
+            entries = []
+            for image_id, img, bad in zip(ids, images, invalid):
+                if bad and self.random.random() < 0.5:
+                    continue  # the model skipped this image
+                w, h = img.size
+                shift = 2 * w if bad else 0  # ...or answered in the wrong coordinates
+                entries.append({"id": image_id, "shapes": [_box(w, h, shift)]})
+            return FakeResponse(json.dumps({"images": entries}), tokens=tokens)
+        shapes = [_box(*img.size) for img in images]
+        return FakeResponse("```json\n" + json.dumps({"shapes": shapes}) + "\n```", tokens=tokens)
+
+
+def _box(w, h, shift=0):
+    return {"label": "text",
+            "points": [[0.1 * w + shift, 0.1 * h], [0.9 * w + shift, 0.1 * h], [0.9 * w + shift, 0.3 * h], [0.1 * w + shift, 0.3 * h]]}
+
+
+class FakeTextPipeline:
+    """
+    Offline stand-in for the inference server's detector + OCR + language-id
+    pipeline. A batch costs `overhead` seconds plus `per_image` per image,
+    mimicking how batched CPU inference amortizes fixed per-call work.
+    """
+
+    def __init__(self, overhead=0.02, per_image=0.005):
+        self.overhead = overhead
+        self.per_image = per_image
+        self.batches = 0
+
+    def predict_batch(self, images):
+        self.batches += 1
+        time.sleep(self.overhead + self.per_image * len(images))
+        return [{"detected_text": f"fake text {img.size[0]}x{img.size[1]}", "language_code": "en",
+                 "language_name": "English"} for img in images]
+
+
+class FakeOCR:
+    """
+    Offline stand-in for auto_annotate.ocr_batch (same call signature, and
+    picklable for its process pool). A batch costs `overhead` seconds plus
+    `per_image` per image. Each image, picked by a hash of its path so the
+    choice holds across runs, is either read well (three confident title
+    and author lines) or, at `hard_rate`, badly (one small, unsure box).
+    """
+
+    def __init__(self, overhead=0.02, per_image=0.01, hard_rate=0.3):
+        self.overhead = overhead
+        self.per_image = per_image
+        self.hard_rate = hard_rate
+
+    def __call__(self, items, languages, batch_size=8):
+        time.sleep(self.overhead + self.per_image * len(items))
+        output = []
+        for read_path, w, h in items:
+            rng = random.Random(zlib.crc32(read_path.encode()))
+            if rng.random() < self.hard_rate:
+                lines = [(0.4, 0.45, 0.1, rng.uniform(0.1, 0.4))]
+            else:
+                lines = [(0.1, 0.1, 0.08, rng.uniform(0.8, 0.99)), (0.15, 0.2, 0.06, rng.uniform(0.7, 0.99)),
+                         (0.3, 0.85, 0.05, rng.uniform(0.6, 0.95))]
+            boxes = []
+            for x, y, line_h, prob in lines:
+                x0, y0, x1, y1 = x * w, y * h, (1 - x) * w, (y + line_h) * h
+                boxes.append(([[x0, y0], [x1, y0], [x1, y1], [x0, y1]], "fake", prob))
+            output.append(boxes)
+        return output
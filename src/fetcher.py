@@ -0,0 +1,139 @@
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import metrics
+
+# --- Configuration ---
+DEFAULT_HEADERS = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:99.0) Gecko/20100101 Firefox/99.0'}
+DEFAULT_RATE_PER_HOST = 2.0  # requests per second allowed against any single host
+DEFAULT_BURST = 2            # requests a host may receive back-to-back after being idle
+DEFAULT_WORKERS = 8
+DEFAULT_TIMEOUT = 30
+
+
+class TokenBucket:
+    """Thread-safe token bucket: refills `rate` tokens per second up to `capacity`."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens=1.0):
+        """Blocks until `tokens` are available, then consumes them."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class Fetcher:
+    """
+    Pooled keep-alive HTTP client with a per-host token-bucket rate limiter.
+    Work submitted with `submit` runs on a bounded thread pool, so independent
+    hops (book page, cover image) of different books overlap while every host
+    still sees at most `rate_per_host` requests per second.
+    """
+
+    def __init__(self, headers=None, rate_per_host=DEFAULT_RATE_PER_HOST, burst=DEFAULT_BURST,
+                 max_workers=DEFAULT_WORKERS, timeout=DEFAULT_TIMEOUT, cache=None):
+        self.headers = dict(headers or DEFAULT_HEADERS)
+        self.rate_per_host = rate_per_host
+        self.burst = burst
+        self.timeout = timeout
+        self.cache = cache
+
+        # requests is imported here: TokenBucket users (the annotation scheduler) never pay for it
+        import requests
+        from requests.adapters import HTTPAdapter
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=16, pool_maxsize=max_workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self.buckets = {}
+        self.buckets_lock = threading.Lock()
+        self.pool = ThreadPoolExecutor(max_workers=max_workers)
+
+    def _bucket(self, url):
+        host = urllib.parse.urlsplit(url).netloc
+        with self.buckets_lock:
+            if host not in self.buckets:
+                self.buckets[host] = TokenBucket(self.rate_per_host, self.burst)
+            return self.buckets[host]
+
+    def get(self, url, headers=None, timeout=None):
+        """
+        Rate-limited GET over the shared connection pool. With a cache attached,
+        fresh hits skip both the network and the rate limiter.
+        """
+        headers = headers or self.headers
+        timeout = timeout or self.timeout
+        bucket = self._bucket(url)
+        host = urllib.parse.urlsplit(url).netloc
+
+        def wait_for_slot():
+            with metrics.timer("http_ratelimit_wait_seconds", host=host):
+                bucket.acquire()
+
+        start = time.perf_counter()
+        if self.cache is not None:
+            response = self.cache.get(self.session, url, headers=headers, timeout=timeout, before_request=wait_for_slot)
+        else:
+            wait_for_slot()
+            response = self.session.get(url, headers=headers, timeout=timeout)
+        # Rate-limit waits are included here; http_ratelimit_wait_seconds separates them out
+        source = "cache" if getattr(response, "from_cache", False) else "network"
+        metrics.observe("http_request_seconds", time.perf_counter() - start, host=host, source=source)
+        metrics.inc("http_requests_total", host=host, status=response.status_code, source=source)
+        if source == "network":
+            metrics.inc("http_bytes_fetched_total", len(response.content), host=host)
+        return response
+
+    @contextmanager
+    def stream(self, url, headers=None, timeout=None):
+        """
+        Rate-limited GET whose body is read with `response.iter_content()`
+        instead of being held whole. It bypasses the cache; it is for bodies
+        that are kept elsewhere (covers go to the ImageStore). Leaving the
+        block early drops the connection, and the rest of the body is never read.
+        """
+        host = urllib.parse.urlsplit(url).netloc
+        with metrics.timer("http_ratelimit_wait_seconds", host=host):
+            self._bucket(url).acquire()
+        start = time.perf_counter()
+        response = self.session.get(url, headers=headers or self.headers, timeout=timeout or self.timeout, stream=True)
+        try:
+            yield response
+        finally:
+            response.close()
+            metrics.observe("http_request_seconds", time.perf_counter() - start, host=host, source="network")
+            metrics.inc("http_requests_total", host=host, status=response.status_code, source="network")
+
+    def submit(self, fn, *args, **kwargs):
+        """Runs `fn` on the fetch pool and returns its Future."""
+        return self.pool.submit(fn, *args, **kwargs)
+
+    def close(self):
+        self.pool.shutdown(wait=True)
+        self.session.close()
+        if self.cache is not None:
+            self.cache.report()
+            self.cache.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
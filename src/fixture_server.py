@@ -0,0 +1,58 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import urllib.parse
+
+
+class FixtureServer:
+    """
+    Local HTTP stand-in that replays canned responses, so scrapers can be run
+    offline. `routes` maps a URL path (query string ignored) to either
+    `(content_type, body_bytes)` or a callable `(path, query) -> (content_type, body_bytes)`.
+    Use it as a context manager and point the scraper at `server.url`.
+    """
+
+    def __init__(self, routes, host="127.0.0.1", port=0, latency=0.0):
+        self.routes = routes
+        self.latency = latency
+        self.hits = 0
+        self.hits_lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive, like the real sites
+            disable_nagle_algorithm = True  # headers and body go out as separate writes; don't stall ~40ms on ACKs
+
+            def do_GET(self):
+                parts = urllib.parse.urlsplit(self.path)
+                route = server.routes.get(parts.path)
+                if route is None:
+                    self.send_error(404)
+                    return
+                if callable(route):
+                    route = route(parts.path, urllib.parse.parse_qs(parts.query))
+                content_type, body = route
+                if server.latency:
+                    threading.Event().wait(server.latency)
+                with server.hits_lock:
+                    server.hits += 1
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.url = f"http://{host}:{self.httpd.server_address[1]}"
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
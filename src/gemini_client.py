@@ -0,0 +1,344 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future, as_completed
+
+from PIL import Image
+
+from annotation_store import annotator_name
+from normalize import back_project
+import metrics
+
+# --- Configuration ---
+GEMINI_MODEL_NAME = 'gemini-1.5-flash-latest'
+KEY_FILE_PATH = "src/api_key.txt"
+API_KEY_ENV = "GEMINI_API_KEY"
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+BATCH_SIZE = 4        # images per request; 1 sends every cover on its own
+BATCH_MAX_WAIT = 0.5  # seconds a partial batch waits for more images before it is sent anyway
+COORD_MARGIN = 0.1    # points may overshoot the image by this fraction before a reply counts as invalid
+BATCH_INSTRUCTIONS = """
+You are given {count} images. Each one comes right after a line "Image <id> (<width>x<height> px):".
+Annotate every image on its own, exactly as described above, with coordinates in that image's pixels.
+Instead of a single "shapes" object, respond with one JSON object with one key, "images": a list with
+exactly one entry per image, in order, each {{"id": "<id>", "shapes": [...]}}, where "shapes" is what
+you would return for that image alone. Ids: {ids}.
+"""
+BATCH_RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {"images": {"type": "array", "items": {
+        "type": "object",
+        "properties": {
+            "id": {"type": "string"},
+            "shapes": {"type": "array", "items": {
+                "type": "object",
+                "properties": {"label": {"type": "string"},
+                               "points": {"type": "array", "items": {"type": "array", "items": {"type": "number"}}}},
+                "required": ["label", "points"]}},
+        },
+        "required": ["id", "shapes"]}}},
+    "required": ["images"],
+}
+
+
+class GeminiConfigError(RuntimeError):
+    """No API key was found, or google-generativeai isn't installed."""
+
+
+def gemini_model(model_name=GEMINI_MODEL_NAME, key_file=KEY_FILE_PATH):
+    """
+    Configures the Gemini client and returns a `GenerativeModel`. The key comes
+    from $GEMINI_API_KEY, else `key_file`. Call it only once there is
+    something to annotate: the SDK import alone takes seconds, and local
+    steps have to run offline without a key.
+    """
+    api_key = os.environ.get(API_KEY_ENV)
+    if not api_key and key_file and os.path.exists(key_file):
+        with open(key_file, "r") as f:
+            api_key = f.read().strip()
+    if not api_key:
+        raise GeminiConfigError(f"No API key: set {API_KEY_ENV} or put it in '{key_file}'.")
+    try:
+        import google.generativeai as genai
+    except ImportError as e:
+        raise GeminiConfigError("google-generativeai is not installed (pip install google-generativeai).") from e
+    genai.configure(api_key=api_key)
+    return genai.GenerativeModel(model_name)
+
+
+def parse_reply(text):
+    """The JSON object in a model reply, tolerating ```json fences."""
+    cleaned = text.strip()
+    if cleaned.startswith("```"):
+        cleaned = cleaned.strip("`")
+        if cleaned.lower().startswith("json"):
+            cleaned = cleaned[4:]
+    return json.loads(cleaned)
+
+
+def parse_shapes(text):
+    """Extracts the "shapes" list from a model reply."""
+    return parse_reply(text).get("shapes", [])
+
+
+def validate_shapes(shapes, width, height):
+    """
+    Raises ValueError unless `shapes` is a list of polygons (3+ numeric [x, y]
+    points) lying within the `width` x `height` image, give or take
+    COORD_MARGIN. A batch reply that mixes up images or drifts into another
+    coordinate system fails here.
+    """
+    if not isinstance(shapes, list):
+        raise ValueError("shapes is not a list")
+    low_x, high_x = -COORD_MARGIN * width, (1 + COORD_MARGIN) * width
+    low_y, high_y = -COORD_MARGIN * height, (1 + COORD_MARGIN) * height
+    for shape in shapes:
+        points = shape.get("points") if isinstance(shape, dict) else None
+        if not isinstance(points, list) or len(points) < 3:
+            raise ValueError("shape without a polygon")
+        for point in points:
+            if not (isinstance(point, list) and len(point) == 2 and all(isinstance(v, (int, float)) for v in point)):
+                raise ValueError(f"malformed point {point!r}")
+            if not (low_x <= point[0] <= high_x and low_y <= point[1] <= high_y):
+                raise ValueError(f"point {point} outside the {width}x{height} image")
+    return shapes
+
+
+def to_labelme(shapes, filename, width, height):
+    """Wraps a list of {"label", "points"} shapes in a LabelMe 5.0.1 document."""
+    for shape in shapes:
+        shape.update({"group_id": None, "shape_type": "polygon", "flags": {}})
+    return {
+        "version": "5.0.1", "flags": {},
+        "shapes": shapes,
+        "imagePath": filename, "imageData": None,
+        "imageHeight": height, "imageWidth": width,
+    }
+
+
+def annotate_image(model, image_path, prompt, store=None, normalizer=None, source=None):
+    """
+    Sends one image to `model` (anything with a `generate_content([prompt, img])`
+    method, e.g. `genai.GenerativeModel` or a local fake) and, given a `store`,
+    saves its annotation there (see annotation_store.py). With a `normalizer`,
+    the downscaled copy is uploaded and the polygons are mapped back to
+    original-image pixels. Returns the LabelMe dict.
+    """
+    model_name = _model_name(model)
+    img, scale, (width, height) = _load(image_path, normalizer)
+
+    with metrics.timer("model_request_seconds", model=model_name):
+        response = model.generate_content([prompt, img])
+    shapes = back_project(parse_shapes(response.text), scale)
+    labelme_output = to_labelme(shapes, os.path.basename(image_path), width, height)
+
+    if store is not None:
+        store.put(os.path.basename(image_path), labelme_output, annotator_name("gemini", model_name), source)
+    return labelme_output
+
+
+def _model_name(model):
+    return getattr(model, "model_name", type(model).__name__).rpartition('/')[2]
+
+
+def _load(image_path, normalizer):
+    """(image to upload, its scale relative to the original, original (width, height))."""
+    with metrics.timer("image_decode_seconds", step="annotate"):
+        if normalizer is not None:
+            return normalizer.open(image_path)
+        with Image.open(image_path) as img:
+            img.load()
+        return img, 1.0, img.size
+
+
+def annotate_batch(model, image_paths, prompt, store=None, normalizer=None, source=None):
+    """
+    Sends several images in one request, each labelled with an id, and asks
+    for a reply per id (as JSON matching BATCH_RESPONSE_SCHEMA). Every
+    image's part of the reply is validated on its own. Returns `(results,
+    failures)`: `{image_path: labelme}` for the images that came back valid
+    (saved to `store` in one transaction), and `{image_path: reason}` for the
+    rest, which callers retry one at a time with `annotate_image`.
+    """
+    model_name = _model_name(model)
+    ids = [f"img{i + 1}" for i in range(len(image_paths))]
+    contents = [prompt + BATCH_INSTRUCTIONS.format(count=len(image_paths), ids=", ".join(ids))]
+    loaded, unreadable = {}, {}
+    for image_id, image_path in zip(ids, image_paths):
+        try:
+            img, scale, size = _load(image_path, normalizer)
+        except OSError as e:
+            # Only this cover fails; its single-image retry reports the error
+            unreadable[image_path] = str(e)
+            continue
+        loaded[image_id] = (image_path, img.size, scale, size)
+        contents += [f"Image {image_id} ({img.size[0]}x{img.size[1]} px):", img]
+    if not loaded:
+        return {}, unreadable
+
+    with metrics.timer("model_request_seconds", model=model_name):
+        response = model.generate_content(contents, generation_config={
+            "response_mime_type": "application/json", "response_schema": BATCH_RESPONSE_SCHEMA})
+    try:
+        entries = parse_reply(response.text)["images"]
+        replies = {}
+        for entry in entries:
+            replies.setdefault(str(entry.get("id")), []).append(entry.get("shapes"))
+    except (ValueError, KeyError, TypeError, AttributeError) as e:
+        return {}, {**unreadable, **{path: f"unreadable batch reply: {e}" for path, _, _, _ in loaded.values()}}
+
+    results, failures = {}, dict(unreadable)
+    for image_id, (image_path, sent_size, scale, (width, height)) in loaded.items():
+        shapes = replies.get(image_id, [])
+        try:
+            if len(shapes) != 1:
+                raise ValueError("no reply for this image" if not shapes else "several replies for this image")
+            shapes = back_project(validate_shapes(shapes[0], *sent_size), scale)
+        except ValueError as e:
+            failures[image_path] = str(e)
+            continue
+        results[image_path] = to_labelme(shapes, os.path.basename(image_path), width, height)
+    metrics.inc("annotation_batch_images_total", len(results), outcome="ok")
+    metrics.inc("annotation_batch_images_total", len(failures), outcome="invalid")
+
+    if store is not None and results:
+        store.put_many([(os.path.basename(path), labelme, annotator_name("gemini", model_name), source)
+                        for path, labelme in results.items()])
+    return results, failures
+
+
+class AnnotationBatcher:
+    """
+    Turns per-image annotation requests into multi-image Gemini calls made
+    through an AnnotationScheduler. `submit(path)` returns a Future for that
+    image's LabelMe dict and may be called from many threads (e.g. the
+    pipeline's annotate stage). A batch is sent once `batch_size` images are
+    waiting, or when the oldest has waited `max_wait`. Images whose part of a
+    reply fails validation are retried in single-image calls, so one bad
+    entry never costs the rest of the batch. With `batch_size` 1 every image
+    is its own call, as before.
+    """
+
+    def __init__(self, model, prompt, scheduler, batch_size=BATCH_SIZE, max_wait=BATCH_MAX_WAIT,
+                 store=None, normalizer=None, source=None):
+        self.model = model
+        self.prompt = prompt
+        self.scheduler = scheduler
+        self.batch_size = max(1, batch_size)
+        self.max_wait = max_wait
+        self.store = store
+        self.normalizer = normalizer
+        self.source = source
+        self.waiting = []  # (image_path, Future, time queued)
+        self.cond = threading.Condition()
+        self.closed = False
+        self.stats = {"batches": 0, "batched_images": 0, "invalid": 0, "single_calls": 0}
+        self.dispatcher = None
+        if self.batch_size > 1:
+            self.dispatcher = threading.Thread(target=self._dispatch_loop, daemon=True, name="annotation-batcher")
+            self.dispatcher.start()
+
+    def submit(self, image_path):
+        if self.batch_size == 1:
+            return self._single(image_path)
+        future = Future()
+        with self.cond:
+            self.waiting.append((image_path, future, time.monotonic()))
+            self.cond.notify_all()
+        return future
+
+    def annotate(self, image_path):
+        """Blocks until `image_path` is annotated; returns its LabelMe dict."""
+        return self.submit(image_path).result()
+
+    def map(self, image_paths):
+        """Yields `(image_path, labelme, error)` for every image as its annotation completes."""
+        futures = {self.submit(path): path for path in image_paths}
+        with self.cond:
+            self.cond.notify_all()
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result(), None
+            except Exception as e:
+                yield futures[future], None, e
+
+    def _single(self, image_path, future=None):
+        with self.cond:
+            self.stats["single_calls"] += 1
+        inner = self.scheduler.submit(annotate_image, self.model, image_path, self.prompt, self.store,
+                                      self.normalizer, self.source)
+        if future is None:
+            return inner
+        inner.add_done_callback(lambda done: _copy_result(done, future))
+        return future
+
+    def _dispatch_loop(self):
+        while True:
+            with self.cond:
+                while not self.waiting and not self.closed:
+                    self.cond.wait()
+                if not self.waiting:
+                    return
+                deadline = self.waiting[0][2] + self.max_wait
+                while len(self.waiting) < self.batch_size and not self.closed and time.monotonic() < deadline:
+                    self.cond.wait(deadline - time.monotonic())
+                batch, self.waiting = self.waiting[:self.batch_size], self.waiting[self.batch_size:]
+                self.stats["batches"] += 1
+                self.stats["batched_images"] += len(batch)
+            if len(batch) == 1:
+                self._single(batch[0][0], batch[0][1])
+                continue
+            paths = [path for path, _, _ in batch]
+            call = self.scheduler.submit(annotate_batch, self.model, paths, self.prompt, self.store, self.normalizer,
+                                         self.source, weight=len(paths))
+            call.add_done_callback(lambda done, batch=batch: self._batch_done(batch, done))
+
+    def _batch_done(self, batch, call):
+        try:
+            results, failures = call.result()
+        except Exception as e:
+            for _, future, _ in batch:
+                future.set_exception(e)
+            return
+        for image_path, future, _ in batch:
+            if image_path in results:
+                future.set_result(results[image_path])
+            else:
+                with self.cond:
+                    self.stats["invalid"] += 1
+                self._single(image_path, future)
+
+    def report(self):
+        s = self.stats
+        if self.batch_size > 1:
+            print(f"Annotation batches: {s['batches']} of up to {self.batch_size} ({s['batched_images']} images), "
+                  f"{s['invalid']} images retried alone after an invalid reply")
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+        if self.dispatcher is not None:
+            self.dispatcher.join()
+
+
+def _copy_result(source, target):
+    if source.exception() is not None:
+        target.set_exception(source.exception())
+    else:
+        target.set_result(source.result())
+
+
+def status_code(exc):
+    """HTTP status carried by an API exception (google.api_core errors expose `.code`), if any."""
+    for attr in ("code", "status_code"):
+        code = getattr(exc, attr, None)
+        if isinstance(code, int):
+            return code
+    return None
+
+
+def is_retryable(exc):
+    """True for rate limiting (429) and transient server errors (5xx)."""
+    return status_code(exc) in RETRYABLE_STATUS
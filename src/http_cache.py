@@ -0,0 +1,180 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+import metrics
+
+# --- Configuration ---
+CACHE_DIR = ".http_cache"
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3   # 2 GiB of response bodies
+DEFAULT_FRESH_FOR = 24 * 3600       # serve without contacting the server for this many seconds
+
+
+class CachedResponse:
+    """The small subset of `requests.Response` the scrapers use, backed by a cache entry."""
+
+    def __init__(self, url, status_code, content, headers, from_cache):
+        self.url = url
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers
+        self.from_cache = from_cache
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8', errors='replace')
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            import requests
+            raise requests.HTTPError(f"{self.status_code} for url: {self.url}", response=self)
+
+
+class HTTPCache:
+    """
+    Shared, size-bounded on-disk cache for GET responses.
+    Bodies live under `cache_dir/bodies/` named by the SHA-256 of the URL; a
+    SQLite index holds validators (ETag / Last-Modified), sizes and last-access
+    times for LRU eviction. Entries younger than `fresh_for` are served without
+    any request; older ones are revalidated with a conditional GET.
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES, fresh_for=DEFAULT_FRESH_FOR):
+        self.cache_dir = cache_dir
+        self.body_dir = os.path.join(cache_dir, "bodies")
+        self.max_bytes = max_bytes
+        self.fresh_for = fresh_for
+        os.makedirs(self.body_dir, exist_ok=True)
+
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(os.path.join(cache_dir, "index.sqlite3"), check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("""CREATE TABLE IF NOT EXISTS entries (
+            key TEXT PRIMARY KEY, url TEXT, etag TEXT, last_modified TEXT, content_type TEXT,
+            size INTEGER, stored_at REAL, last_access REAL)""")
+        self.db.execute("CREATE INDEX IF NOT EXISTS entries_lru ON entries(last_access)")
+        self.db.commit()
+        self.total_bytes = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+        self.stats = {"hits": 0, "revalidated": 0, "misses": 0, "bytes_fetched": 0, "bytes_saved": 0}
+
+    @staticmethod
+    def _key(url):
+        return hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+    def _body_path(self, key):
+        return os.path.join(self.body_dir, key[:2], key)
+
+    def _read_body(self, key):
+        try:
+            with open(self._body_path(key), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _count(self, name, amount=1):
+        with self.lock:
+            self.stats[name] += amount
+        metrics.inc(f"http_cache_{name}_total", amount)
+
+    def get(self, session, url, headers=None, timeout=None, before_request=None):
+        """
+        Cached GET through `session`. `before_request` (e.g. a rate limiter's
+        acquire) is only called when the network is actually used.
+        """
+        key = self._key(url)
+        with self.lock:
+            row = self.db.execute(
+                "SELECT etag, last_modified, content_type, size, stored_at FROM entries WHERE key=?", (key,)).fetchone()
+        body = self._read_body(key) if row else None
+
+        if body is not None:
+            etag, last_modified, content_type, size, stored_at = row
+            if time.time() - stored_at < self.fresh_for:
+                self._touch(key)
+                self._count("hits")
+                self._count("bytes_saved", size)
+                return CachedResponse(url, 200, body, {"Content-Type": content_type}, from_cache=True)
+
+            conditional = dict(headers or {})
+            if etag: conditional["If-None-Match"] = etag
+            if last_modified: conditional["If-Modified-Since"] = last_modified
+            if etag or last_modified:
+                if before_request: before_request()
+                res = session.get(url, headers=conditional, timeout=timeout)
+                if res.status_code == 304:
+                    with self.lock:
+                        self.db.execute("UPDATE entries SET stored_at=?, last_access=? WHERE key=?",
+                                        (time.time(), time.time(), key))
+                        self.db.commit()
+                    self._count("revalidated")
+                    self._count("bytes_saved", size)
+                    return CachedResponse(url, 200, body, {"Content-Type": content_type}, from_cache=True)
+                return self._store(url, key, res)
+
+        if before_request: before_request()
+        res = session.get(url, headers=headers, timeout=timeout)
+        return self._store(url, key, res)
+
+    def _store(self, url, key, res):
+        self._count("misses")
+        self._count("bytes_fetched", len(res.content))
+        if res.status_code != 200:
+            return res
+
+        path = self._body_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(res.content)
+        os.replace(tmp_path, path)
+
+        now = time.time()
+        with self.lock:
+            old = self.db.execute("SELECT size FROM entries WHERE key=?", (key,)).fetchone()
+            self.db.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?)", (
+                key, url, res.headers.get("ETag"), res.headers.get("Last-Modified"),
+                res.headers.get("Content-Type"), len(res.content), now, now))
+            self.db.commit()
+            self.total_bytes += len(res.content) - (old[0] if old else 0)
+        self.evict()
+        return res
+
+    def _touch(self, key):
+        with self.lock:
+            self.db.execute("UPDATE entries SET last_access=? WHERE key=?", (time.time(), key))
+            self.db.commit()
+
+    def evict(self):
+        """Drops least-recently-used entries until the cache fits in `max_bytes`."""
+        with self.lock:
+            if self.total_bytes <= self.max_bytes:
+                return
+            victims = []
+            for key, size in self.db.execute("SELECT key, size FROM entries ORDER BY last_access"):
+                if self.total_bytes <= self.max_bytes:
+                    break
+                victims.append((key,))
+                self.total_bytes -= size
+            self.db.executemany("DELETE FROM entries WHERE key=?", victims)
+            self.db.commit()
+        for (key,) in victims:
+            try:
+                os.remove(self._body_path(key))
+            except FileNotFoundError:
+                pass
+
+    def report(self):
+        """Prints the hit/miss/bytes-saved counters."""
+        s = self.stats
+        lookups = s["hits"] + s["revalidated"] + s["misses"]
+        hit_rate = (s["hits"] + s["revalidated"]) / lookups if lookups else 0.0
+        print(f"HTTP cache: {s['hits']} hits, {s['revalidated']} revalidated, {s['misses']} misses "
+              f"({hit_rate:.0%} hit rate), {s['bytes_fetched'] / 1e6:.1f} MB fetched, "
+              f"{s['bytes_saved'] / 1e6:.1f} MB saved")
+
+    def close(self):
+        with self.lock:
+            self.db.close()
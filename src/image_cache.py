@@ -0,0 +1,175 @@
+import hashlib
+import json
+import os
+import re
+import time
+from multiprocessing import Pool
+
+import numpy as np
+from PIL import Image
+
+from shards import ShardReader, is_packed, open_image
+
+# --- Configuration ---
+IMG_SIZE = 640
+PAD_VALUE = 114
+CACHE_DIR = ".train_cache"
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+
+def letterbox(img, size=IMG_SIZE):
+    """Fits `img` into a size x size uint8 RGB canvas, keeping aspect. Returns `(array, scale, (pad_x, pad_y))`."""
+    img = img.convert('RGB')
+    width, height = img.size
+    scale = min(size / width, size / height)
+    new_w, new_h = max(1, round(width * scale)), max(1, round(height * scale))
+    if (new_w, new_h) != (width, height):
+        img = img.resize((new_w, new_h), Image.BILINEAR)
+    pad_x, pad_y = (size - new_w) // 2, (size - new_h) // 2
+    canvas = np.full((size, size, 3), PAD_VALUE, dtype=np.uint8)
+    canvas[pad_y:pad_y + new_h, pad_x:pad_x + new_w] = np.asarray(img)
+    return canvas, scale, (pad_x, pad_y)
+
+
+def read_labels(label_path):
+    """YOLO labels as (N, 4) normalized xc, yc, w, h. Segmentation rows are reduced to their bounding box."""
+    try:
+        with open(label_path, 'r') as f:
+            return parse_labels(f.read())
+    except FileNotFoundError:
+        return np.zeros((0, 4), dtype=np.float32)
+
+
+def parse_labels(text):
+    """read_labels() for label text already in memory (e.g. from a packed dataset)."""
+    boxes = []
+    for line in text.splitlines():
+        values = line.split()
+        if len(values) == 5:
+            boxes.append([float(v) for v in values[1:]])
+        elif len(values) > 5:
+            xy = np.asarray(values[1:], dtype=np.float32).reshape(-1, 2)
+            (x0, y0), (x1, y1) = xy.min(axis=0), xy.max(axis=0)
+            boxes.append([(x0 + x1) / 2, (y0 + y1) / 2, x1 - x0, y1 - y0])
+    return np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+
+
+def _decode_into(args):
+    """Worker: decodes one image into slot `index` of the shared memmap."""
+    data_path, count, size, index, source = args
+    images = np.memmap(data_path, dtype=np.uint8, mode='r+', shape=(count, size, size, 3))
+    # source: an image path, or (pack_dir, sample) for a packed split
+    with (open_image(*source) if isinstance(source, tuple) else Image.open(source)) as img:
+        original = img.size
+        images[index], scale, pad = letterbox(img, size)
+    images.flush()
+    del images
+    return index, original, scale, pad
+
+
+def _cache_key(image_dir, names, size):
+    digest = hashlib.sha256(f"{os.path.abspath(image_dir)}|{size}".encode())
+    for name in names:
+        st = os.stat(os.path.join(image_dir, name))
+        digest.update(f"|{name}:{st.st_mtime_ns}:{st.st_size}".encode())
+    return digest.hexdigest()[:16]
+
+
+def _remove_stale(cache_dir, split_name, size, key):
+    """Deletes the files of every other cache of this split and size (left by earlier versions of the split)."""
+    pattern = re.compile(re.escape(f"{split_name}_{size}_") + r"([0-9a-f]{16})\.(u8|boxes\.npy|index\.npy|json(\.tmp)?)$")
+    removed = 0
+    for name in os.listdir(cache_dir):
+        match = pattern.match(name)
+        if match and match.group(1) != key:
+            try:
+                os.remove(os.path.join(cache_dir, name))
+                removed += 1
+            except FileNotFoundError:
+                pass
+    return removed
+
+
+def build_cache(image_dir, label_dir, size=IMG_SIZE, cache_dir=CACHE_DIR, workers=None):
+    """
+    Decodes and letterboxes every image of a split once into a uint8 memmap
+    `(N, size, size, 3)`, with all boxes (mapped into letterbox coordinates)
+    concatenated in one array plus an offsets index. The cache is keyed by the
+    split's file names, mtimes and sizes, so it's rebuilt only when images
+    change. `image_dir` may also be a packed split (see shards.py); its
+    samples are then decoded straight out of the shards. Returns the cache's
+    path prefix (see ImageCache).
+    """
+    if is_packed(image_dir):
+        reader = ShardReader(image_dir)
+        names = reader.names
+        split_name = os.path.basename(os.path.abspath(image_dir))
+        key = hashlib.sha256(f"{os.path.abspath(image_dir)}|{size}|{reader.key}".encode()).hexdigest()[:16]
+        sources = [(image_dir, i) for i in range(len(names))]
+        labels = lambda i: parse_labels(reader.label(i))
+    else:
+        names = sorted(f for f in os.listdir(image_dir) if f.lower().endswith(IMAGE_EXTENSIONS))
+        split_name = os.path.basename(os.path.dirname(os.path.abspath(image_dir)))
+        key = _cache_key(image_dir, names, size)
+        sources = [os.path.join(image_dir, name) for name in names]
+        labels = lambda i: read_labels(os.path.join(label_dir, os.path.splitext(names[i])[0] + '.txt'))
+    prefix = os.path.join(cache_dir, f"{split_name}_{size}_{key}")
+    if os.path.exists(prefix + ".json"):
+        return prefix
+
+    os.makedirs(cache_dir, exist_ok=True)
+    start = time.perf_counter()
+    data_path = prefix + ".u8"
+    # Allocated sparse; each worker writes its own slots, so nothing is pickled back but the geometry
+    images = np.memmap(data_path, dtype=np.uint8, mode='w+', shape=(max(1, len(names)), size, size, 3))
+    del images
+    geometry = [None] * len(names)
+    tasks = [(data_path, max(1, len(names)), size, i, source) for i, source in enumerate(sources)]
+    with Pool(workers or os.cpu_count()) as pool:
+        for index, original, scale, pad in pool.imap_unordered(_decode_into, tasks, chunksize=16):
+            geometry[index] = (original, scale, pad)
+
+    boxes, offsets = [], np.zeros(len(names) + 1, dtype=np.int64)
+    for i in range(len(names)):
+        (width, height), scale, (pad_x, pad_y) = geometry[i]
+        b = labels(i)
+        # normalized original -> normalized letterbox
+        b[:, 0] = (b[:, 0] * width * scale + pad_x) / size
+        b[:, 1] = (b[:, 1] * height * scale + pad_y) / size
+        b[:, 2] *= width * scale / size
+        b[:, 3] *= height * scale / size
+        boxes.append(b)
+        offsets[i + 1] = offsets[i] + len(b)
+    np.save(prefix + ".boxes.npy", np.concatenate(boxes) if boxes else np.zeros((0, 4), dtype=np.float32))
+    np.save(prefix + ".index.npy", offsets)
+
+    # Written last: its presence marks a complete cache
+    tmp_path = prefix + ".json.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump({"names": names, "size": size, "count": len(names)}, f)
+    os.replace(tmp_path, prefix + ".json")
+    stale = _remove_stale(cache_dir, split_name, size, key)
+    mb = len(names) * size * size * 3 / 1e6
+    print(f"Cached {len(names)} images from '{image_dir}' ({mb:.0f} MB) in {time.perf_counter() - start:.1f}s"
+          + (f"; removed {stale} stale cache file(s)" if stale else ""))
+    return prefix
+
+
+class ImageCache:
+    """Read-only view of a cache from `build_cache`: `cache[i] -> (uint8 HxWx3 memmap view, (K, 4) boxes)`."""
+
+    def __init__(self, prefix):
+        with open(prefix + ".json", 'r') as f:
+            meta = json.load(f)
+        self.names = meta["names"]
+        self.size = meta["size"]
+        self.images = np.memmap(prefix + ".u8", dtype=np.uint8, mode='r',
+                                shape=(max(1, meta["count"]), self.size, self.size, 3))
+        self.boxes = np.load(prefix + ".boxes.npy")
+        self.offsets = np.load(prefix + ".index.npy")
+
+    def __len__(self):
+        return len(self.names)
+
+    def __getitem__(self, index):
+        return self.images[index], self.boxes[self.offsets[index]:self.offsets[index + 1]]
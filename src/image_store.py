@@ -0,0 +1,256 @@
+import hashlib
+import os
+import shutil
+import sqlite3
+import threading
+
+from PIL import Image, ImageStat
+
+# --- Configuration ---
+STORE_DIR = "image_store"
+NEAR_DUPLICATE_DISTANCE = 3  # max differing dHash bits for two covers to count as the same
+HASH_BANDS = 4               # 64-bit dHash split into 4 x 16-bit bands for indexed lookup
+MIN_HASH_BITS = 8            # flat images hash to (almost) no set bits and would all match each other
+MIN_STDDEV = 8.0             # greyscale standard deviation below which an image is too flat to fingerprint
+MAX_ASPECT_DIFF = 0.05       # near-duplicates' width/height ratios differ by at most this fraction
+
+
+def dhash(img, size=8):
+    """64-bit difference hash of a PIL image (robust to resizing and re-encoding)."""
+    small = img.convert('L').resize((size + 1, size), Image.LANCZOS)
+    pixels = list(small.getdata())
+    value = 0
+    for row in range(size):
+        for col in range(size):
+            left = pixels[row * (size + 1) + col]
+            right = pixels[row * (size + 1) + col + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+
+def _popcount(value):
+    return bin(value & 0xFFFFFFFFFFFFFFFF).count("1")
+
+
+def is_distinctive(img, value):
+    """
+    Whether dHash `value` of `img` says enough to group the image with others:
+    plain covers (mostly one colour, a little text) hash to few set bits and
+    land within NEAR_DUPLICATE_DISTANCE of each other however different they are.
+    """
+    if _popcount(value) < MIN_HASH_BITS:
+        return False
+    return ImageStat.Stat(img.convert('L').resize((64, 64))).stddev[0] >= MIN_STDDEV
+
+
+def is_image_valid(image_bytes):
+    """Uses Pillow to verify if the downloaded data is a valid image."""
+    try:
+        img = Image.open(image_bytes)
+        img.verify()
+        return True
+    except Exception:
+        return False
+
+
+def _signed64(value):
+    # SQLite integers are signed 64-bit
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def _bands(value):
+    return [(value >> (16 * i)) & 0xFFFF for i in range(HASH_BANDS)]
+
+
+class ImageStore:
+    """
+    Content-addressed store for cover images.
+    Every object is kept once under `objects/<sha[:2]>/<sha><ext>`, keyed by
+    the SHA-256 of its bytes. A SQLite index maps source file names to
+    objects and groups near-duplicates (dHash distance <= NEAR_DUPLICATE_DISTANCE,
+    same aspect ratio) under one canonical object. Flat images (see
+    is_distinctive) are left out of the band index, so they are never grouped.
+    Near-duplicate search uses the pigeonhole trick: two hashes within 3 bits must share at least one of the 4 16-bit bands, so
+    each lookup is a handful of indexed queries rather than a scan.
+    """
+
+    def __init__(self, root=STORE_DIR):
+        self.root = root
+        os.makedirs(os.path.join(root, "objects"), exist_ok=True)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(os.path.join(root, "index.sqlite3"), check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS objects (
+                sha TEXT PRIMARY KEY, ext TEXT, size INTEGER, width INTEGER, height INTEGER,
+                dhash INTEGER, b0 INTEGER, b1 INTEGER, b2 INTEGER, b3 INTEGER, canonical TEXT);
+            CREATE INDEX IF NOT EXISTS objects_b0 ON objects(b0);
+            CREATE INDEX IF NOT EXISTS objects_b1 ON objects(b1);
+            CREATE INDEX IF NOT EXISTS objects_b2 ON objects(b2);
+            CREATE INDEX IF NOT EXISTS objects_b3 ON objects(b3);
+            CREATE INDEX IF NOT EXISTS objects_canonical ON objects(canonical);
+            CREATE TABLE IF NOT EXISTS names (name TEXT PRIMARY KEY, sha TEXT, size INTEGER, mtime REAL);
+            CREATE TABLE IF NOT EXISTS sources (url TEXT PRIMARY KEY, sha TEXT);
+        """)
+        self.db.commit()
+
+    def object_path(self, sha, ext=None):
+        if ext is None:
+            ext = self.db.execute("SELECT ext FROM objects WHERE sha=?", (sha,)).fetchone()[0]
+        return os.path.join(self.root, "objects", sha[:2], sha + ext)
+
+    def _find_near(self, value, width, height):
+        bands = _bands(value)
+        query = " OR ".join(f"b{i}=?" for i in range(HASH_BANDS))
+        aspect = width / height
+        best = None
+        for sha, other, canonical, w, h in self.db.execute(
+                f"SELECT sha, dhash, canonical, width, height FROM objects WHERE {query}", bands):
+            # Objects stored before the flatness check may still carry a near-empty hash
+            if _popcount(other) < MIN_HASH_BITS or abs(w / h - aspect) > MAX_ASPECT_DIFF * aspect:
+                continue
+            distance = _popcount(value ^ other)
+            if distance <= NEAR_DUPLICATE_DISTANCE and (best is None or distance < best[0]):
+                best = (distance, canonical)
+        return best[1] if best else None
+
+    def add_file(self, path, name=None):
+        """
+        Registers an image file and returns `(sha, canonical_sha, is_new)`.
+        New objects are hard-linked into the store (copied if linking fails),
+        so registering a scraped file costs no extra disk space. A name whose
+        size and mtime are unchanged is answered from the index without rehashing.
+        """
+        name = name or os.path.abspath(path)
+        stat = os.stat(path)
+        with self.lock:
+            row = self.db.execute(
+                "SELECT n.sha, o.canonical FROM names n JOIN objects o ON o.sha = n.sha "
+                "WHERE n.name=? AND n.size=? AND n.mtime=?", (name, stat.st_size, stat.st_mtime)).fetchone()
+        if row:
+            return row[0], row[1], False
+
+        with open(path, 'rb') as f:
+            sha = hashlib.sha256(f.read()).hexdigest()
+        return self._register(path, name, stat, sha)
+
+    def add_decoded(self, path, sha, img, name=None):
+        """
+        add_file() for a file whose SHA-256 is already known and that is already
+        decoded as `img` (see ingest.Ingestor), so it is neither read nor opened again.
+        """
+        return self._register(path, name or os.path.abspath(path), os.stat(path), sha, img)
+
+    def _known(self, name, stat, sha):
+        """Records `name` for an already stored object; returns its canonical, or None if `sha` is new. Lock held."""
+        row = self.db.execute("SELECT canonical FROM objects WHERE sha=?", (sha,)).fetchone()
+        if row:
+            self.db.execute("INSERT OR REPLACE INTO names VALUES (?, ?, ?, ?)", (name, sha, stat.st_size, stat.st_mtime))
+            self.db.commit()
+        return row[0] if row else None
+
+    def _register(self, path, name, stat, sha, img=None):
+        with self.lock:
+            canonical = self._known(name, stat, sha)
+        if canonical is not None:
+            return sha, canonical, False
+
+        # Decoding and hashing run outside the lock, so concurrent registrations don't queue behind them
+        if img is None:
+            with Image.open(path) as img:
+                width, height = img.size
+                value = dhash(img)
+                distinctive = is_distinctive(img, value)
+        else:
+            width, height = img.size
+            value = dhash(img)
+            distinctive = is_distinctive(img, value)
+
+        with self.lock:
+            # Another thread may have stored the same bytes meanwhile
+            canonical = self._known(name, stat, sha)
+            if canonical is not None:
+                return sha, canonical, False
+            canonical = (distinctive and self._find_near(value, width, height)) or sha
+            ext = os.path.splitext(path)[1].lower() or ".jpg"
+
+            object_path = self.object_path(sha, ext)
+            os.makedirs(os.path.dirname(object_path), exist_ok=True)
+            try:
+                os.link(path, object_path)
+            except OSError:
+                shutil.copyfile(path, object_path)
+
+            self.db.execute("INSERT INTO objects VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                            (sha, ext, stat.st_size, width, height, _signed64(value),
+                             *(_bands(value) if distinctive else [None] * HASH_BANDS), canonical))
+            self.db.execute("INSERT OR REPLACE INTO names VALUES (?, ?, ?, ?)", (name, sha, stat.st_size, stat.st_mtime))
+            self.db.commit()
+        return sha, canonical, True
+
+    def add_bytes(self, data, path, name=None):
+        """
+        Writes downloaded bytes to `path` and registers them. Returns `(sha, canonical_sha, is_new)`.
+        The file is replaced rather than rewritten in place, so an older object
+        hard-linked to the same path is never clobbered.
+        An exact duplicate of a stored object is linked to it instead of written again.
+        """
+        sha = hashlib.sha256(data).hexdigest()
+        with self.lock:
+            row = self.db.execute("SELECT ext FROM objects WHERE sha=?", (sha,)).fetchone()
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            if not row:
+                raise OSError("not stored yet")
+            os.link(self.object_path(sha, row[0]), tmp_path)
+        except OSError:
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+        os.replace(tmp_path, path)
+        return self.add_file(path, name)
+
+    def add_source(self, url, sha):
+        """Remembers that `url` served object `sha`, so a later run can skip the download."""
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO sources VALUES (?, ?)", (url, sha))
+            self.db.commit()
+
+    def source(self, url):
+        """The sha of the object `url` served, if it is still stored; else None."""
+        with self.lock:
+            row = self.db.execute("SELECT s.sha, o.ext FROM sources s JOIN objects o ON o.sha = s.sha WHERE s.url=?",
+                                  (url,)).fetchone()
+        if row and os.path.exists(self.object_path(*row)):
+            return row[0]
+        return None
+
+    def canonical(self, sha):
+        with self.lock:
+            row = self.db.execute("SELECT canonical FROM objects WHERE sha=?", (sha,)).fetchone()
+        return row[0] if row else None
+
+    def size(self, sha):
+        """(width, height) of a stored object."""
+        with self.lock:
+            return self.db.execute("SELECT width, height FROM objects WHERE sha=?", (sha,)).fetchone()
+
+    def group(self, canonical):
+        """Every stored sha in the near-duplicate group of `canonical`."""
+        with self.lock:
+            return [row[0] for row in self.db.execute("SELECT sha FROM objects WHERE canonical=?", (canonical,))]
+
+    def all_shas(self):
+        with self.lock:
+            return {row[0] for row in self.db.execute("SELECT sha FROM objects")}
+
+    def group_by_canonical(self, paths):
+        """Maps each canonical sha to the given paths that are copies of it, in input order."""
+        groups = {}
+        for path in paths:
+            _, canonical, _ = self.add_file(path)
+            groups.setdefault(canonical, []).append(path)
+        return groups
+
+    def close(self):
+        with self.lock:
+            self.db.close()
@@ -0,0 +1,322 @@
+import argparse
+import asyncio
+import io
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from image_cache import IMG_SIZE, letterbox
+from langid import LanguageIdentifier
+from recognize import recognize_regions
+
+# --- Configuration ---
+HOST = "127.0.0.1"
+PORT = 8000
+MAX_BATCH = 16
+MAX_LATENCY_MS = 10        # longest a request waits for others to share its batch
+INFERENCE_WORKERS = 2      # batches running at once (each on cores / workers torch threads)
+MAX_BODY_BYTES = 20 * 1024 * 1024
+STATS_WINDOW = 100000     # recent requests kept for latency percentiles
+SCORE_THRESHOLD = 0.5
+NMS_IOU = 0.3
+WEIGHTS_PATH = "runs/text_detector.pt"
+OCR_LANGUAGES = ['en', 'hi']
+LANGUAGE_NAMES = {
+    "en": "English", "hi": "Hindi", "mr": "Marathi", "kn": "Kannada", "bn": "Bengali", "ta": "Tamil",
+    "te": "Telugu", "gu": "Gujarati", "pa": "Punjabi", "ml": "Malayalam", "ur": "Urdu", "ne": "Nepali",
+}
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 411: "Length Required", 413: "Payload Too Large",
+           500: "Internal Server Error"}
+
+
+class TextLanguagePipeline:
+    """
+    Detector + OCR recognizer + language identifier, loaded once. Batches
+    are letterboxed and run through the detector in one forward pass; the
+    detected regions of all images are cropped and read together by EasyOCR's
+    recognizer (its own detector is not loaded), and the batch's texts are
+    language-identified together.
+    """
+
+    def __init__(self, weights=WEIGHTS_PATH, languages=OCR_LANGUAGES, torch_threads=None):
+        import torch
+        import easyocr
+        from train import TextDetector
+
+        self.torch = torch
+        if torch_threads: torch.set_num_threads(torch_threads)
+        checkpoint = torch.load(weights, map_location='cpu')
+        self.imgsz = checkpoint.get("imgsz", IMG_SIZE)
+        self.detector = TextDetector()
+        self.detector.load_state_dict(checkpoint["model"])
+        self.detector.eval()
+        self.reader = easyocr.Reader(languages, gpu=False, detector=False, verbose=False)
+        # Script histogram first; langdetect only for ambiguous Devanagari / mixed-script text
+        self.langid = LanguageIdentifier()
+
+    def detect(self, images):
+        """Text boxes `[[x_min, x_max, y_min, y_max], ...]` in original pixels, per image."""
+        from torchvision.ops import nms
+        torch = self.torch
+        letterboxed = [letterbox(img, self.imgsz) for img in images]
+        batch = torch.from_numpy(np.stack([arr for arr, _, _ in letterboxed])).permute(0, 3, 1, 2).float().div_(255)
+        with torch.inference_mode():
+            logits, ltrb = self.detector(batch)
+        grid = logits.shape[-1]
+        centres = (torch.arange(grid, dtype=torch.float32) + 0.5) / grid
+        cy, cx = torch.meshgrid(centres, centres, indexing='ij')
+
+        results = []
+        for i, (_, scale, (pad_x, pad_y)) in enumerate(letterboxed):
+            scores = torch.sigmoid(logits[i, 0])
+            keep = scores > SCORE_THRESHOLD
+            l, t, r, b = (ltrb[i, k][keep] for k in range(4))
+            boxes = torch.stack([cx[keep] - l, cy[keep] - t, cx[keep] + r, cy[keep] + b], dim=1) * self.imgsz
+            boxes = boxes[nms(boxes, scores[keep], NMS_IOU)]
+            # letterbox pixels -> original pixels
+            boxes[:, [0, 2]] = (boxes[:, [0, 2]] - pad_x) / scale
+            boxes[:, [1, 3]] = (boxes[:, [1, 3]] - pad_y) / scale
+            width, height = images[i].size
+            results.append([[max(0, int(x0)), min(width, int(x1)), max(0, int(y0)), min(height, int(y1))]
+                            for x0, y0, x1, y1 in boxes.tolist() if x1 - x0 >= 2 and y1 - y0 >= 2])
+        return results
+
+    def predict_batch(self, images):
+        items = []
+        for img, boxes in zip(images, self.detect(images)):
+            # Top-to-bottom, left-to-right reading order
+            boxes.sort(key=lambda b: (b[2], b[0]))
+            items.append((img, [[[x0, y0], [x1, y0], [x1, y1], [x0, y1]] for x0, x1, y0, y1 in boxes]))
+        # Crops of the whole batch share recognizer calls; the detector has already run on these pixels
+        texts = [" ".join(text for text, _ in regions if text)
+                 for regions in recognize_regions(items, reader=self.reader)]
+        return [{"detected_text": text, "language_code": code, "language_name": LANGUAGE_NAMES.get(code, code)}
+                for text, (code, _, _) in zip(texts, self.langid.identify_batch(texts))]
+
+
+class MicroBatcher:
+    """
+    Gathers concurrent requests into batches of up to `max_batch`, waiting at
+    most `max_latency_ms` after the first one, and runs each batch (decode +
+    inference) on a pool of `workers` threads so the event loop stays free.
+    While all workers are busy, requests keep queueing and form the next,
+    larger batch.
+    """
+
+    def __init__(self, model, max_batch=MAX_BATCH, max_latency_ms=MAX_LATENCY_MS, workers=INFERENCE_WORKERS):
+        self.model = model
+        self.max_batch = max_batch
+        self.max_latency = max_latency_ms / 1000.0
+        self.workers = workers
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.queue = None
+        self.slots = None
+        self.stats = {"requests": 0, "batches": 0, "errors": 0,
+                      "latencies": deque(maxlen=STATS_WINDOW), "batch_sizes": deque(maxlen=STATS_WINDOW)}
+
+    async def submit(self, data):
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((data, future, time.perf_counter()))
+        return await future
+
+    async def run(self):
+        self.queue = asyncio.Queue()
+        self.slots = asyncio.Semaphore(self.workers)
+        loop = asyncio.get_running_loop()
+        while True:
+            first = await self.queue.get()
+            batch = [first]
+            deadline = loop.time() + self.max_latency
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            await self.slots.acquire()
+            # Requests that arrived while waiting for a free worker ride along
+            while len(batch) < self.max_batch and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            asyncio.create_task(self._run_batch(batch))
+
+    def _process(self, blobs):
+        """Runs in the pool: decodes what it can and infers on those, so one bad upload doesn't fail the batch."""
+        images, results = [], [None] * len(blobs)
+        for i, data in enumerate(blobs):
+            try:
+                img = Image.open(io.BytesIO(data))
+                img.load()
+                images.append((i, img.convert('RGB')))
+            except Exception as e:
+                results[i] = {"error": f"Could not decode image: {e}"}
+        if images:
+            for (i, _), output in zip(images, self.model.predict_batch([img for _, img in images])):
+                results[i] = output
+        return results
+
+    async def _run_batch(self, batch):
+        try:
+            results = await asyncio.get_running_loop().run_in_executor(self.pool, self._process, [b[0] for b in batch])
+        except Exception as e:
+            results = [e] * len(batch)
+        finally:
+            self.slots.release()
+        now = time.perf_counter()
+        self.stats["batches"] += 1
+        self.stats["batch_sizes"].append(len(batch))
+        for (_, future, start), result in zip(batch, results):
+            self.stats["requests"] += 1
+            self.stats["latencies"].append(now - start)
+            if isinstance(result, Exception):
+                self.stats["errors"] += 1
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def report(self):
+        s = self.stats
+        if not s["requests"]:
+            return {}
+        latencies = np.asarray(s["latencies"]) * 1000
+        return {"requests": s["requests"], "batches": s["batches"], "errors": s["errors"],
+                "mean_batch": round(float(np.mean(s["batch_sizes"])), 2),
+                "p50_ms": round(float(np.percentile(latencies, 50)), 1),
+                "p95_ms": round(float(np.percentile(latencies, 95)), 1),
+                "p99_ms": round(float(np.percentile(latencies, 99)), 1)}
+
+    def close(self):
+        self.pool.shutdown(wait=True)
+
+
+# --- Minimal HTTP/1.1 front end (keep-alive, multipart uploads) ---
+def parse_multipart(content_type, body):
+    """{field name: bytes} from a multipart/form-data body."""
+    boundary = None
+    for param in content_type.split(';')[1:]:
+        key, _, value = param.strip().partition('=')
+        if key.lower() == 'boundary':
+            boundary = value.strip('"')
+    if not boundary:
+        return {}
+    fields = {}
+    for part in body.split(b"--" + boundary.encode())[1:]:
+        if part.startswith(b"--"):
+            break
+        head, _, content = part.partition(b"\r\n\r\n")
+        for line in head.decode('utf-8', 'replace').split("\r\n"):
+            if line.lower().startswith("content-disposition"):
+                for param in line.split(';')[1:]:
+                    key, _, value = param.strip().partition('=')
+                    if key == 'name':
+                        fields[value.strip('"')] = content[:-2] if content.endswith(b"\r\n") else content
+    return fields
+
+
+class InferenceServer:
+    """Serves `POST /api/detect/` (multipart `image`) and `GET /api/stats/` on asyncio streams."""
+
+    def __init__(self, batcher, host=HOST, port=PORT):
+        self.batcher = batcher
+        self.host = host
+        self.port = port
+
+    async def route(self, method, path, headers, body):
+        path = path.split('?')[0]
+        if path in ('/api/detect/', '/api/detect') and method == 'POST':
+            image = parse_multipart(headers.get('content-type', ''), body).get('image')
+            if not image:
+                return 400, {"error": "No image file provided."}
+            result = await self.batcher.submit(image)
+            return (400 if "error" in result else 200), result
+        if path in ('/api/stats/', '/api/stats') and method == 'GET':
+            return 200, self.batcher.report()
+        return 404, {"error": "Not found."}
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                    break
+                lines = head.decode('latin-1').split("\r\n")
+                method, path, _ = (lines[0].split(' ') + ['', ''])[:3]
+                headers = {}
+                for line in lines[1:]:
+                    key, _, value = line.partition(':')
+                    if key:
+                        headers[key.strip().lower()] = value.strip()
+                # Errors found before the body is read leave it unread: body=None closes the connection
+                length = headers.get('content-length') or '0'
+                if 'transfer-encoding' in headers:
+                    status, payload, body = 411, {"error": "Chunked bodies are not supported; send Content-Length."}, None
+                elif not (length.isascii() and length.isdigit()):
+                    status, payload, body = 400, {"error": "Invalid Content-Length."}, None
+                elif int(length) > MAX_BODY_BYTES:
+                    status, payload, body = 413, {"error": "Image too large."}, None
+                else:
+                    body = await reader.readexactly(int(length)) if int(length) else b""
+                    try:
+                        status, payload = await self.route(method, path, headers, body)
+                    except Exception as e:
+                        status, payload = 500, {"error": str(e)}
+                data = json.dumps(payload).encode()
+                keep_alive = headers.get('connection', '').lower() != 'close' and body is not None
+                writer.write(f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\nContent-Type: application/json\r\n"
+                             f"Content-Length: {len(data)}\r\nConnection: {'keep-alive' if keep_alive else 'close'}"
+                             f"\r\n\r\n".encode() + data)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, ready=None):
+        batch_task = asyncio.create_task(self.batcher.run())
+        server = await asyncio.start_server(self.handle, self.host, self.port, limit=64 * 1024)
+        self.port = server.sockets[0].getsockname()[1]
+        print(f"Serving POST http://{self.host}:{self.port}/api/detect/ "
+              f"(batches of <= {self.batcher.max_batch}, <= {self.batcher.max_latency * 1000:.0f} ms wait, "
+              f"{self.batcher.workers} worker(s))")
+        if ready: ready.set()
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batch_task.cancel()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Text detection + language identification API with micro-batching")
+    parser.add_argument('--host', type=str, default=HOST)
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--weights', type=str, default=WEIGHTS_PATH, help='Detector checkpoint from train.py')
+    parser.add_argument('--langs', type=str, default=",".join(OCR_LANGUAGES), help='EasyOCR recognizer languages')
+    parser.add_argument('--max-batch', type=int, default=MAX_BATCH)
+    parser.add_argument('--max-latency-ms', type=float, default=MAX_LATENCY_MS)
+    parser.add_argument('--workers', type=int, default=INFERENCE_WORKERS, help='Batches inferred concurrently')
+    parser.add_argument('--fake', action='store_true', help='Serve a FakeTextPipeline (no models), e.g. to test loadgen')
+    args = parser.parse_args()
+
+    if args.fake:
+        from fakes import FakeTextPipeline
+        model = FakeTextPipeline()
+    else:
+        print("Loading detector, recognizer and language identifier...")
+        model = TextLanguagePipeline(args.weights, args.langs.split(','), max(1, (os.cpu_count() or 1) // args.workers))
+    batcher = MicroBatcher(model, args.max_batch, args.max_latency_ms, args.workers)
+    try:
+        asyncio.run(InferenceServer(batcher, args.host, args.port).serve())
+    except KeyboardInterrupt:
+        print(f"\nStats: {batcher.report()}")
+    finally:
+        batcher.close()
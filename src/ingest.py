@@ -0,0 +1,276 @@
+import hashlib
+import os
+import shutil
+import struct
+import threading
+import time
+import urllib.parse
+
+from PIL import Image
+
+import metrics
+
+# --- Configuration ---
+INCOMING_DIR = ".incoming"   # downloads land here (named by hash) until a stage accepts them
+CHUNK_SIZE = 64 * 1024
+SNIFF_BYTES = 128 * 1024     # header bytes searched for the frame size (JPEG EXIF/ICC segments come first)
+TAIL_BYTES = 1024            # end of the body checked for the format's trailer
+MIN_SIDE = 100               # px; "no cover" placeholders and tracking pixels are smaller
+MIN_BYTES = 2 * 1024         # no real cover is this small
+MAX_BYTES = 20 * 1024 * 1024
+PLACEHOLDER_MARKERS = ("nophoto", "no-image", "no_image", "noimage", "placeholder", "default-cover")
+FORMATS = {"jpeg": ".jpg", "png": ".png", "gif": ".gif", "webp": ".webp"}
+MAGIC = (b"\xff\xd8", b"\x89PNG\r\n\x1a\n", b"GIF87a", b"GIF89a", b"RIFF")
+STEPS = ("download", "decode", "store", "normalize")
+
+
+class Rejected(ValueError):
+    """A download that is no usable cover; `reason` is e.g. 'placeholder', 'truncated', 'corrupt'."""
+
+    def __init__(self, reason, detail=""):
+        super().__init__(f"{reason}: {detail}" if detail else reason)
+        self.reason = reason
+
+
+def sniff(header):
+    """
+    `(format, width, height)` read from the first bytes of a JPEG, PNG, GIF or
+    WebP file without decoding it, or None when `header` doesn't reach the
+    frame size yet (or isn't one of those formats).
+    """
+    if header.startswith(b"\x89PNG\r\n\x1a\n"):
+        if len(header) >= 24 and header[12:16] == b"IHDR":
+            return ("png", *struct.unpack(">II", header[16:24]))
+        return None
+    if header[:6] in (b"GIF87a", b"GIF89a"):
+        return ("gif", *struct.unpack("<HH", header[6:10])) if len(header) >= 10 else None
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP" and len(header) >= 30:
+        chunk = header[12:16]
+        if chunk == b"VP8 ":
+            width, height = struct.unpack("<HH", header[26:30])
+            return "webp", width & 0x3FFF, height & 0x3FFF
+        if chunk == b"VP8L":
+            bits = int.from_bytes(header[21:25], "little")
+            return "webp", (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+        if chunk == b"VP8X":
+            return "webp", int.from_bytes(header[24:27], "little") + 1, int.from_bytes(header[27:30], "little") + 1
+        return None
+    if header[:2] == b"\xff\xd8":
+        # Walk the marker segments up to the start of frame, which holds the size
+        i = 2
+        while i + 9 <= len(header):
+            if header[i] != 0xFF:
+                return None
+            marker = header[i + 1]
+            if marker == 0xFF:
+                i += 1
+            elif marker == 0x01 or 0xD0 <= marker <= 0xD8:
+                i += 2
+            elif 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+                height, width = struct.unpack(">HH", header[i + 5:i + 9])
+                return "jpeg", width, height
+            else:
+                i += 2 + struct.unpack(">H", header[i + 2:i + 4])[0]
+    return None
+
+
+def is_complete(fmt, header, tail, size):
+    """Whether a body ends the way a whole file of `fmt` does; a cut-off download doesn't."""
+    if fmt == "jpeg":
+        # Entropy-coded data never contains FF D9, so it can only be the end-of-image marker
+        return b"\xff\xd9" in tail
+    if fmt == "png":
+        return tail.endswith(b"IEND\xaeB`\x82")
+    if fmt == "gif":
+        return tail.endswith(b";")
+    return int.from_bytes(header[4:8], "little") + 8 <= size
+
+
+class Ingestor:
+    """
+    One pass per cover from the network to the ImageStore. `download` streams
+    the body to a file under `incoming_dir` while hashing it. It never holds
+    the whole body in memory, and it reads the format and dimensions off the
+    first bytes. Wrong content types, placeholders (tiny or marked in the URL)
+    and truncated bodies are rejected before anything is decoded. `accept`
+    then decodes the file once, registers it under the hash it already has,
+    and moves it into place. `share` normalizes that decoded image for the
+    later stages, and the normalizer keeps it in memory for them. A URL
+    downloaded on an earlier run is linked from the store, not fetched again.
+    Every step is timed per cover.
+    """
+
+    def __init__(self, fetcher, store, incoming_dir=INCOMING_DIR, normalizer=None, min_side=MIN_SIDE,
+                 min_bytes=MIN_BYTES, max_bytes=MAX_BYTES):
+        self.fetcher = fetcher
+        self.store = store
+        self.incoming_dir = incoming_dir
+        self.normalizer = normalizer
+        self.min_side = min_side
+        self.min_bytes = min_bytes
+        self.max_bytes = max_bytes
+        os.makedirs(incoming_dir, exist_ok=True)
+        for entry in os.scandir(incoming_dir):
+            if entry.name.endswith(".part"):
+                os.remove(entry.path)  # cut short by a killed run
+        self.lock = threading.Lock()
+        self.stats = {"downloaded": 0, "reused": 0, "accepted": 0, "bytes": 0, "rejected": {}}
+        self.timings = {step: [0, 0.0] for step in STEPS}  # step -> [covers, total ms]
+
+    def _reject(self, reason, url, detail=""):
+        with self.lock:
+            self.stats["rejected"][reason] = self.stats["rejected"].get(reason, 0) + 1
+        metrics.inc("ingest_rejected_total", reason=reason)
+        metrics.event("image_rejected", url=url, reason=reason, detail=detail)
+        return Rejected(reason, detail)
+
+    def _time(self, fetched, step, start):
+        ms = (time.perf_counter() - start) * 1000
+        fetched.setdefault("_timings", {})[f"{step}_ms"] = round(ms, 2)
+        metrics.observe("ingest_seconds", ms / 1000, step=step)
+        with self.lock:
+            self.timings[step][0] += 1
+            self.timings[step][1] += ms
+
+    def _check_header(self, header, url):
+        """The header's (format, width, height); None while more bytes are needed. Raises Rejected."""
+        if len(header) >= 12 and not header.startswith(MAGIC):
+            raise self._reject("not_an_image", url, repr(header[:12]))
+        info = sniff(header)
+        if info is None:
+            if len(header) >= SNIFF_BYTES:
+                raise self._reject("unrecognized", url)
+            return None
+        _, width, height = info
+        if min(width, height) < self.min_side:
+            raise self._reject("placeholder", url, f"{width}x{height}")
+        return info
+
+    # --- Steps ---
+    def download(self, url):
+        """
+        Fetches `url` to `<incoming_dir>/<sha><ext>`. Returns `{"incoming",
+        "sha", "format", "width", "height", "size"}`; raises Rejected for
+        anything that is no cover, and the usual HTTP errors on failure.
+        """
+        start = time.perf_counter()
+        if any(marker in url.lower() for marker in PLACEHOLDER_MARKERS):
+            raise self._reject("placeholder", url, "placeholder URL")
+        sha = self.store.source(url)
+        if sha is not None:
+            return self._link(url, sha, start)
+
+        tmp_path = os.path.join(self.incoming_dir, f"{threading.get_ident()}-{time.monotonic_ns()}.part")
+        digest, header, tail, size, info = hashlib.sha256(), b"", b"", 0, None
+        try:
+            with self.fetcher.stream(url) as res, open(tmp_path, 'wb') as f:
+                # Timed from the request going out (to its headers) on; a rate-limit wait isn't download time
+                start = time.perf_counter() - res.elapsed.total_seconds()
+                res.raise_for_status()
+                content_type = res.headers.get("Content-Type", "")
+                if not content_type.startswith(("image/", "application/octet-stream")):
+                    raise self._reject("not_an_image", url, content_type)
+                # A compressed transfer's Content-Length counts encoded bytes; only the format's trailer is checked then
+                expected = 0 if res.headers.get("Content-Encoding") else int(res.headers.get("Content-Length") or 0)
+                if expected > self.max_bytes:
+                    raise self._reject("too_large", url, f"{expected} bytes")
+                for chunk in res.iter_content(CHUNK_SIZE):
+                    digest.update(chunk)
+                    f.write(chunk)
+                    size += len(chunk)
+                    tail = (tail + chunk)[-TAIL_BYTES:]
+                    if info is None:
+                        header += chunk
+                        info = self._check_header(header, url)
+                    if size > self.max_bytes:
+                        raise self._reject("too_large", url, f"over {self.max_bytes} bytes")
+            metrics.inc("http_bytes_fetched_total", size, host=urllib.parse.urlsplit(url).netloc)
+            if info is None:
+                raise self._reject("unrecognized", url, f"{size} bytes")
+            if (expected and size != expected) or not is_complete(info[0], header, tail, size):
+                raise self._reject("truncated", url, f"{size} of {expected or '?'} bytes")
+            if size < self.min_bytes:
+                raise self._reject("placeholder", url, f"{size} bytes")
+            fetched = {"incoming": os.path.join(self.incoming_dir, digest.hexdigest() + FORMATS[info[0]]),
+                       "sha": digest.hexdigest(), "format": info[0], "width": info[1], "height": info[2], "size": size}
+            os.replace(tmp_path, fetched["incoming"])
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        self.store.add_source(url, fetched["sha"])
+        with self.lock:
+            self.stats["downloaded"] += 1
+            self.stats["bytes"] += size
+        self._time(fetched, "download", start)
+        return fetched
+
+    def _link(self, url, sha, start):
+        """download() of a URL whose body is already stored: hard-linked into incoming, header re-read from disk."""
+        path = self.store.object_path(sha)
+        with open(path, 'rb') as f:
+            fmt, width, height = sniff(f.read(SNIFF_BYTES)) or (None, 0, 0)
+        fetched = {"incoming": os.path.join(self.incoming_dir, sha + FORMATS.get(fmt, os.path.splitext(path)[1])),
+                   "sha": sha, "format": fmt, "width": width, "height": height, "size": os.path.getsize(path)}
+        if not os.path.exists(fetched["incoming"]):
+            try:
+                os.link(path, fetched["incoming"])
+            except FileExistsError:
+                pass  # another worker linked the same cover
+            except OSError:
+                shutil.copyfile(path, fetched["incoming"])
+        with self.lock:
+            self.stats["reused"] += 1
+        self._time(fetched, "download", start)
+        return fetched
+
+    def accept(self, fetched, path):
+        """
+        Decodes a download (the only full decode it gets), moves it to `path`
+        and registers it in the store under its known hash. Returns
+        `(canonical sha, decoded image)`; raises Rejected if it doesn't decode.
+        """
+        start = time.perf_counter()
+        try:
+            with Image.open(fetched["incoming"]) as img:
+                img.load()
+        except FileNotFoundError:
+            # The same bytes arrived twice at once, and the other copy was accepted first
+            raise self._reject("duplicate", fetched["incoming"])
+        except (OSError, SyntaxError, ValueError, Image.DecompressionBombError) as e:
+            self.discard(fetched)
+            raise self._reject("corrupt", fetched["incoming"], str(e))
+        self._time(fetched, "decode", start)
+
+        start = time.perf_counter()
+        os.replace(fetched["incoming"], path)
+        _, canonical, _ = self.store.add_decoded(path, fetched["sha"], img)
+        self._time(fetched, "store", start)
+        with self.lock:
+            self.stats["accepted"] += 1
+        return canonical, img
+
+    def share(self, fetched, path, img):
+        """Normalizes the decoded cover at `path` for annotation and export, which then skip decoding it again."""
+        if self.normalizer is not None:
+            start = time.perf_counter()
+            self.normalizer.normalize(path, img=img)
+            self._time(fetched, "normalize", start)
+        metrics.event("image_ingested", path=path, sha=fetched["sha"], bytes=fetched["size"],
+                      width=fetched["width"], height=fetched["height"], **fetched.get("_timings", {}))
+
+    def discard(self, fetched):
+        """Drops a download that won't be kept (a duplicate, or over quota)."""
+        try:
+            os.remove(fetched["incoming"])
+        except FileNotFoundError:
+            pass
+
+    def report(self):
+        s = self.stats
+        rejected = sum(s["rejected"].values())
+        reasons = ", ".join(f"{reason} {n}" for reason, n in sorted(s["rejected"].items()))
+        print(f"Ingested {s['accepted']} covers ({s['downloaded']} downloaded, {s['bytes'] / 1e6:.1f} MB; "
+              f"{s['reused']} already stored), rejected {rejected}" + (f" ({reasons})" if reasons else ""))
+        per_step = ", ".join(f"{step} {ms / n:.1f} ms" for step, (n, ms) in self.timings.items() if n)
+        if per_step:
+            print(f"  per cover: {per_step}")
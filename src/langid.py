@@ -0,0 +1,236 @@
+import argparse
+import os
+import time
+
+import numpy as np
+
+from annotation_store import AnnotationStore
+
+# --- Configuration ---
+# (script, first code point, last code point, language it implies or None if shared)
+SCRIPT_RANGES = [
+    ("latin", 0x0041, 0x005A, "en"), ("latin", 0x0061, 0x007A, "en"), ("latin", 0x00C0, 0x024F, "en"),
+    ("arabic", 0x0600, 0x06FF, "ur"),
+    ("devanagari", 0x0900, 0x097F, None),  # Hindi, Marathi, Nepali, ...
+    ("bengali", 0x0980, 0x09FF, "bn"),
+    ("gurmukhi", 0x0A00, 0x0A7F, "pa"),
+    ("gujarati", 0x0A80, 0x0AFF, "gu"),
+    ("tamil", 0x0B80, 0x0BFF, "ta"),
+    ("telugu", 0x0C00, 0x0C7F, "te"),
+    ("kannada", 0x0C80, 0x0CFF, "kn"),
+    ("malayalam", 0x0D00, 0x0D7F, "ml"),
+]
+SCRIPTS = sorted({name for name, _, _, _ in SCRIPT_RANGES}, key=[r[0] for r in SCRIPT_RANGES].index)
+DOMINANCE = 0.8   # share of letters one script needs before the string counts as single-script
+# Frequent function words / letters that separate Marathi from Hindi in Devanagari text
+MARATHI_MARKERS = ['ळ', 'ऱ', 'ॲ', 'आहे', 'आणि', 'नाही', 'झाल', 'माझ', 'तुझ', 'आम्ही', 'तुम्ही', 'मराठी']
+MARATHI_SUFFIXES = ('ची', 'चा', 'चे', 'च्या')   # possessive endings attached to the word
+HINDI_MARKERS = ['है', 'और', 'में', 'नहीं', 'हिन्दी', 'हिंदी', 'ों']
+HINDI_WORDS = {'का', 'की', 'के', 'से', 'ने', 'को', 'यह', 'वह', 'एक'}   # postpositions written as separate words
+# Filename prefixes used across the scrapers -> expected language, for the benchmark
+LANGUAGE_BY_PREFIX = {
+    "hindi": "hi", "हिन्दी": "hi", "marathi": "mr", "मराठी": "mr", "kannada": "kn", "ಕನ್ನಡ": "kn",
+    "bengali": "bn", "বাংলা": "bn", "tamil": "ta", "தமிழ்": "ta", "english": "en", "classicfiction": "en",
+}
+# Built-in benchmark corpus (cover titles / blurbs) for when no OCR text has been annotated yet
+SAMPLE_TEXTS = [
+    ("hi", "गोदान"), ("hi", "गुनाहों का देवता"), ("hi", "प्रेमचंद की सर्वश्रेष्ठ कहानियाँ"), ("hi", "राग दरबारी"),
+    ("hi", "यह उपन्यास गाँव के जीवन की कहानी है"), ("hi", "मैला आँचल"), ("hi", "हिंदी साहित्य के महान उपन्यास"),
+    ("hi", "निर्मला और अन्य कहानियाँ"),
+    ("mr", "श्यामची आई"), ("mr", "ययाति"), ("mr", "बटाट्याची चाळ"), ("mr", "माझे विद्यापीठ"),
+    ("mr", "ही कादंबरी मराठी साहित्यातील एक महत्त्वाची कलाकृती आहे"), ("mr", "आमचा बाप आन् आम्ही"),
+    ("mr", "पु. ल. देशपांडे यांच्या कथा आणि व्यक्तिचित्रे"), ("mr", "मृत्युंजय"),
+    ("kn", "ಮಲೆಗಳಲ್ಲಿ ಮದುಮಗಳು"), ("kn", "ಪರ್ವ"), ("kn", "ಚೋಮನ ದುಡಿ"), ("kn", "ಕನ್ನಡ ಸಾಹಿತ್ಯ"),
+    ("bn", "পথের পাঁচালী"), ("bn", "গীতাঞ্জলি"), ("bn", "দেবদাস"), ("bn", "চোখের বালি"),
+    ("ta", "பொன்னியின் செல்வன்"), ("ta", "திருக்குறள்"), ("ta", "சிலப்பதிகாரம்"), ("ta", "தமிழ் இலக்கியம்"),
+    ("en", "The Wandering Earth"), ("en", "Pride and Prejudice"), ("en", "A Tale of Two Cities"),
+    ("en", "The Philip K. Dick Megapack"), ("en", "Classic Fiction"),
+    ("hi", "Premchand की कहानियाँ"), ("en", "Harry Potter और पारस पत्थर Harry Potter and the Philosopher's Stone"),
+]
+
+# Sorted boundaries for a single searchsorted lookup: code point -> script index (or -1)
+_starts = np.array([lo for _, lo, _, _ in sorted(SCRIPT_RANGES, key=lambda r: r[1])], dtype=np.uint32)
+_ends = np.array([hi for _, _, hi, _ in sorted(SCRIPT_RANGES, key=lambda r: r[1])], dtype=np.uint32)
+_script_of_range = np.array([SCRIPTS.index(name) for name, _, _, _ in sorted(SCRIPT_RANGES, key=lambda r: r[1])])
+_language_of_script = [next(lang for name, _, _, lang in SCRIPT_RANGES if name == script) for script in SCRIPTS]
+
+
+def script_histogram(texts):
+    """
+    Letter counts per script for every string, in one vectorized pass over
+    the whole batch: returns an int array of shape (len(texts), len(SCRIPTS)).
+    Digits, punctuation and unlisted scripts aren't counted.
+    """
+    if not texts:
+        return np.zeros((0, len(SCRIPTS)), dtype=np.int64)
+    codes = np.frombuffer("".join(texts).encode('utf-32-le'), dtype=np.uint32)
+    owner = np.repeat(np.arange(len(texts)), [len(t) for t in texts])
+    slot = np.searchsorted(_starts, codes, side='right') - 1
+    inside = (slot >= 0) & (codes <= _ends[np.maximum(slot, 0)])
+    flat = owner[inside] * len(SCRIPTS) + _script_of_range[slot[inside]]
+    return np.bincount(flat, minlength=len(texts) * len(SCRIPTS)).reshape(len(texts), len(SCRIPTS))
+
+
+def devanagari_language(text):
+    """Hindi vs Marathi from marker words/letters. Returns `(code, margin)`; margin 0 means undecided."""
+    words = text.split()
+    marathi = sum(text.count(m) for m in MARATHI_MARKERS) + sum(w.endswith(MARATHI_SUFFIXES) for w in words)
+    hindi = sum(text.count(m) for m in HINDI_MARKERS) + sum(w in HINDI_WORDS for w in words)
+    if marathi == hindi:
+        return None, 0
+    return ("mr" if marathi > hindi else "hi"), abs(marathi - hindi)
+
+
+class LanguageIdentifier:
+    """
+    Batch language ID tuned for cover OCR. Most strings are settled by their
+    Unicode script alone (Kannada, Bengali, Tamil, Latin, ...). Devanagari is
+    split into Hindi/Marathi by marker words, and only what remains ambiguous
+    (undecided Devanagari, mixed scripts) goes to a statistical `fallback`
+    (langdetect, if installed). Results are `(code, confidence, method)`.
+    """
+
+    def __init__(self, fallback="langdetect", default_devanagari="hi"):
+        self.default_devanagari = default_devanagari
+        self.fallback = None
+        if fallback == "langdetect":
+            try:
+                from langdetect import DetectorFactory, detect_langs
+                DetectorFactory.seed = 0  # deterministic
+                self.fallback = detect_langs
+            except ImportError:
+                pass
+        elif callable(fallback):
+            self.fallback = fallback
+        self.stats = {"script": 0, "heuristic": 0, "fallback": 0, "default": 0, "empty": 0, "seconds": 0.0}
+
+    def _fallback(self, text, allowed=None):
+        if self.fallback is None:
+            return None
+        try:
+            for guess in self.fallback(text):
+                if allowed is None or guess.lang in allowed:
+                    return guess.lang, round(float(guess.prob), 3)
+        except Exception:
+            pass
+        return None
+
+    def identify_batch(self, texts):
+        start = time.perf_counter()
+        counts = script_histogram(texts)
+        letters = counts.sum(axis=1)
+        dominant = counts.argmax(axis=1)
+        share = counts[np.arange(len(texts)), dominant] / np.maximum(letters, 1)
+        devanagari = SCRIPTS.index("devanagari")
+
+        results, methods = [], []
+        for i, text in enumerate(texts):
+            if letters[i] == 0:
+                result, method = (None, 0.0), "empty"
+            elif share[i] >= DOMINANCE and dominant[i] != devanagari:
+                result, method = (_language_of_script[dominant[i]], round(float(share[i]), 3)), "script"
+            else:
+                result, method = None, None
+                if share[i] >= DOMINANCE:
+                    code, margin = devanagari_language(text)
+                    if code:
+                        result, method = (code, round(min(1.0, 0.6 + 0.1 * margin), 3)), "heuristic"
+                if result is None:
+                    allowed = {"hi", "mr", "ne"} if share[i] >= DOMINANCE else None
+                    result = self._fallback(text, allowed)
+                    method = "fallback" if result else None
+                if result is None:
+                    # No model: the dominant script still names a language (Devanagari -> the default)
+                    code = _language_of_script[dominant[i]] or self.default_devanagari
+                    result, method = (code, round(float(share[i]) * 0.5, 3)), "default"
+            results.append((result[0], result[1], method))
+            methods.append(method)
+        for method in methods:
+            self.stats[method] += 1
+        self.stats["seconds"] += time.perf_counter() - start
+        return results
+
+    def identify(self, text):
+        return self.identify_batch([text])[0]
+
+    def report(self):
+        s = self.stats
+        total = sum(s[m] for m in ("script", "heuristic", "fallback", "default", "empty"))
+        if not total:
+            return
+        print(f"Language ID: {total} strings in {s['seconds']:.3f}s ({total / max(s['seconds'], 1e-9):,.0f}/s); "
+              f"{s['script']} by script, {s['heuristic']} by Devanagari markers, {s['fallback']} by fallback model, "
+              f"{s['default']} defaulted, {s['empty']} empty")
+
+
+def annotation_texts(image_dir):
+    """`(expected_code, text)` from the shape `description`s in an annotation store, labelled by filename prefix."""
+    samples = []
+    annotations = AnnotationStore(image_dir)
+    for filename, labelme in annotations.documents(annotations.names(min_shapes=1)):
+        expected = next((code for prefix, code in LANGUAGE_BY_PREFIX.items() if filename.startswith(prefix)), None)
+        shapes = labelme['shapes']
+        text = " ".join(s.get('description') or '' for s in shapes).strip()
+        if text:
+            samples.append((expected, text))
+    return samples
+
+
+def benchmark(samples, repeat=1000):
+    """Accuracy per expected language and strings/sec, for the fast path alone and (if installed) langdetect."""
+    texts = [text for _, text in samples] * repeat
+    expected = [code for code, _ in samples] * repeat
+
+    results = {}
+    for name, identifier in (("fast path, no fallback", LanguageIdentifier(fallback=None)),
+                             ("fast path + langdetect", LanguageIdentifier())):
+        if name.endswith("langdetect") and identifier.fallback is None:
+            continue
+        start = time.perf_counter()
+        predicted = identifier.identify_batch(texts)
+        elapsed = time.perf_counter() - start
+        results[name] = (predicted, elapsed, identifier)
+
+    try:
+        from langdetect import DetectorFactory, detect
+        DetectorFactory.seed = 0
+        sample = texts[:min(len(texts), 2000)]
+        start = time.perf_counter()
+        plain = []
+        for text in sample:
+            try:
+                plain.append((detect(text), 0.0, "langdetect"))
+            except Exception:
+                plain.append((None, 0.0, "langdetect"))
+        results["langdetect only"] = (plain, (time.perf_counter() - start) * len(texts) / len(sample), None)
+    except ImportError:
+        print("(langdetect not installed: comparing the fast path alone)")
+
+    for name, (predicted, elapsed, identifier) in results.items():
+        pairs = list(zip(expected, predicted))
+        correct = sum(code == p[0] for code, p in pairs if code)
+        labelled = sum(1 for code, _ in pairs if code)
+        per_language = {}
+        for code, p in pairs:
+            if code:
+                hit, total = per_language.get(code, (0, 0))
+                per_language[code] = (hit + (code == p[0]), total + 1)
+        breakdown = ", ".join(f"{code} {100 * hit / total:.0f}%" for code, (hit, total) in sorted(per_language.items()))
+        print(f"{name:<24} {len(texts) / elapsed:>12,.0f} strings/sec | accuracy {100 * correct / max(1, labelled):.1f}% "
+              f"({breakdown})")
+        if identifier: identifier.report()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark script-based language identification on annotation text")
+    parser.add_argument('--dir', type=str, default='book_covers_mixed', help='Annotated covers with OCR text in `description`')
+    parser.add_argument('--repeat', type=int, default=1000, help='Times the corpus is repeated for timing')
+    args = parser.parse_args()
+
+    samples = annotation_texts(args.dir) if os.path.isdir(args.dir) else []
+    if samples:
+        print(f"Benchmarking on {len(samples)} annotated covers from '{args.dir}'")
+    else:
+        print(f"No OCR text in '{args.dir}' annotations (run auto_annotate.py first); using the built-in sample")
+        samples = SAMPLE_TEXTS
+    benchmark(samples, args.repeat)
@@ -0,0 +1,108 @@
+import argparse
+import http.client
+import io
+import json
+import os
+import threading
+import time
+import urllib.parse
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+# --- Configuration ---
+DEFAULT_URL = "http://127.0.0.1:8000/api/detect/"
+DEFAULT_CONCURRENCY = 16
+DEFAULT_REQUESTS = 500
+
+
+def multipart_body(image_bytes, filename="cover.jpg"):
+    """`(content_type, body)` for a form upload with one `image` field."""
+    boundary = uuid.uuid4().hex
+    body = (f"--{boundary}\r\nContent-Disposition: form-data; name=\"image\"; filename=\"{filename}\"\r\n"
+            f"Content-Type: image/jpeg\r\n\r\n").encode() + image_bytes + f"\r\n--{boundary}--\r\n".encode()
+    return f"multipart/form-data; boundary={boundary}", body
+
+
+def sample_images(path=None, count=8):
+    """JPEG payloads: the images in `path` (file or directory), or synthetic covers if none is given."""
+    if path and os.path.isdir(path):
+        names = sorted(f for f in os.listdir(path) if f.lower().endswith(('.jpg', '.jpeg', '.png')))[:count]
+        return [open(os.path.join(path, n), 'rb').read() for n in names]
+    if path:
+        return [open(path, 'rb').read()]
+    payloads = []
+    for i in range(count):
+        buffer = io.BytesIO()
+        Image.new('RGB', (400 + 40 * i, 600), (30 * i % 255, 90, 160)).save(buffer, 'JPEG', quality=85)
+        payloads.append(buffer.getvalue())
+    return payloads
+
+
+def run_load(url=DEFAULT_URL, images=None, concurrency=DEFAULT_CONCURRENCY, requests=DEFAULT_REQUESTS):
+    """
+    Sends `requests` uploads from `concurrency` keep-alive connections and
+    returns latency percentiles (ms), throughput and the status breakdown.
+    """
+    parts = urllib.parse.urlsplit(url)
+    bodies = [multipart_body(data) for data in (images or sample_images())]
+    counter = iter(range(requests))
+    counter_lock = threading.Lock()
+    latencies, statuses = [], {}
+    results_lock = threading.Lock()
+
+    def client(_):
+        conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=60)
+        while True:
+            with counter_lock:
+                i = next(counter, None)
+            if i is None:
+                break
+            content_type, body = bodies[i % len(bodies)]
+            start = time.perf_counter()
+            try:
+                conn.request('POST', parts.path or '/', body=body, headers={'Content-Type': content_type})
+                response = conn.getresponse()
+                response.read()
+                status = response.status
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=60)
+                status = 'error'
+            elapsed = time.perf_counter() - start
+            with results_lock:
+                latencies.append(elapsed)
+                statuses[status] = statuses.get(status, 0) + 1
+        conn.close()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(client, range(concurrency)))
+    wall = time.perf_counter() - start
+
+    ms = np.asarray(latencies) * 1000
+    return {"requests": len(latencies), "concurrency": concurrency, "seconds": round(wall, 2),
+            "throughput_rps": round(len(latencies) / wall, 1),
+            "p50_ms": round(float(np.percentile(ms, 50)), 1), "p95_ms": round(float(np.percentile(ms, 95)), 1),
+            "p99_ms": round(float(np.percentile(ms, 99)), 1), "max_ms": round(float(ms.max()), 1),
+            "statuses": {str(k): v for k, v in statuses.items()}}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Load-test the /api/detect/ endpoint")
+    parser.add_argument('--url', type=str, default=DEFAULT_URL)
+    parser.add_argument('--images', type=str, default=None, help='Image file or directory to upload (default: synthetic)')
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY, help='Parallel keep-alive connections')
+    parser.add_argument('--requests', type=int, default=DEFAULT_REQUESTS, help='Total requests to send')
+    parser.add_argument('--json', action='store_true', help='Print the result as JSON')
+    args = parser.parse_args()
+
+    result = run_load(args.url, sample_images(args.images), args.concurrency, args.requests)
+    if args.json:
+        print(json.dumps(result))
+    else:
+        print(f"{result['requests']} requests at concurrency {result['concurrency']} in {result['seconds']}s: "
+              f"{result['throughput_rps']} req/s | p50 {result['p50_ms']} ms, p95 {result['p95_ms']} ms, "
+              f"p99 {result['p99_ms']} ms (max {result['max_ms']} ms) | statuses {result['statuses']}")
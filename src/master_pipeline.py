@@ -1,23 +1,37 @@
-import google.generativeai as genai
 import os
-import json
-from PIL import Image
 from tqdm import tqdm
-import time
 import shutil
-from sklearn.model_selection import train_test_split
-import numpy as np
-import requests
-from bs4 import BeautifulSoup
 import urllib.parse
 from collections import defaultdict
-import io
+import threading
+import argparse
+
+from fetcher import Fetcher
+from http_cache import HTTPCache
+from image_store import ImageStore
+from ingest import Ingestor, Rejected
+from annotation_cache import AnnotationCache
+from annotation_store import AnnotationStore
+from normalize import Normalizer
+from dataset_builder import build_dataset
+from gemini_client import BATCH_SIZE, AnnotationBatcher, GeminiConfigError, gemini_model
+from annotation_scheduler import AnnotationScheduler
+from stage_graph import Journal, Stage, StageGraph
+from extractors import extractor_for
+import metrics
 
 # --- Configuration ---
 KEY_FILE_PATH = "src/api_key.txt"
 FINAL_DATASET_DIR = "dataset"
+RAW_DIR = "temp_raw_data"
+JOURNAL_NAME = ".pipeline_journal.sqlite3"
+INCOMING_DIR = ".incoming"    # inside the raw dir, so accepting a download is a rename
+SHARED_IMAGES = 32            # validated covers kept decoded in memory until annotation picks them up
+STAGE_NAMES = ("discover", "download", "validate", "annotate", "export")
+GOODREADS_BASE_URL = "https://www.goodreads.com"
 TRAIN_TEST_SPLIT_RATIO = 0.2
 IMAGES_PER_QUERY = 20
+GEMINI_MODEL_NAME = 'gemini-pro-vision'  # the standard, stable vision model
 
 # --- Better Search Queries ---
 QUERIES = {
@@ -29,130 +43,243 @@ QUERIES = {
     "english": "classic fiction book covers"
 }
 
-# --- 1. Configure Gemini API ---
-try:
-    with open(KEY_FILE_PATH, "r") as f:
-        API_KEY = f.read().strip()
-    genai.configure(api_key=API_KEY)
-    # Use the standard, stable vision model
-    GEMINI_MODEL = genai.GenerativeModel('gemini-pro-vision')
-except Exception as e:
-    print(f"ERROR: Could not configure Gemini API. Check 'src/api_key.txt'. Details: {e}")
-    exit()
-
-def is_image_valid(image_bytes):
-    """Uses Pillow to verify if the downloaded data is a valid image."""
-    try:
-        img = Image.open(image_bytes)
-        img.verify()
-        return True
-    except Exception:
-        return False
-
-def run_pipeline():
-    """The main function to scrape, verify, annotate, and prepare the dataset."""
-    print("🚀 Starting the Master Data Preparation Pipeline...")
-    
-    RAW_DIR = "temp_raw_data"
-    if os.path.exists(RAW_DIR): shutil.rmtree(RAW_DIR)
-    os.makedirs(RAW_DIR)
-    
-    counters = defaultdict(int)
-    headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'}
+PROMPT = """Analyze this image. Your response MUST be a single, valid JSON object and nothing else. The JSON should have one key: "shapes". The value of "shapes" is a list of objects, each with a "label" ('text') and a "points" list of [x, y] polygon coordinates. Example: {"shapes": [{"label": "text", "points": [[x1,y1],[x2,y2],[x3,y3],[x4,y4]]}]}"""
 
-    print("\n--- Phase 1: Scraping, Verifying, and Annotating ---")
-    for lang_key, query in QUERIES.items():
-        print(f"\nProcessing query: '{query}'")
-        encoded_query = urllib.parse.quote_plus(query)
-        search_url = f"https://www.goodreads.com/search?q={encoded_query}"
-        
+def _pipeline_stages(raw_dir, fetcher, store, ingestor, annotations, cache, normalizer, batcher, base_url,
+                     reserve=True):
+    """
+    Builds the discover -> download -> validate -> annotate -> export stage functions.
+    With `reserve` (validate runs in the same graph), download reserves a
+    slot of its language's quota that validate settles, so no book page or
+    cover is fetched for a quota already covered by covers in flight.
+    """
+    extractor = extractor_for("goodreads")
+    counters_lock = threading.Condition()
+    # Resume state comes from what's on disk: numbering continues, saved covers stay claimed
+    counters, next_index, seen_covers = defaultdict(int), defaultdict(int), set()
+    in_flight = defaultdict(int)  # covers reserved by download and not yet settled by validate, per language
+    saved = {}  # duplicate group -> a cover file an earlier run kept
+    for entry in os.scandir(raw_dir):
+        lang_key, _, number = os.path.splitext(entry.name)[0].rpartition('_')
+        if entry.name.endswith('.jpg') and number.isdigit():
+            counters[lang_key] += 1
+            next_index[lang_key] = max(next_index[lang_key], int(number))
+            canonical = store.add_file(entry.path)[1]
+            seen_covers.add(canonical)
+            saved.setdefault(canonical, entry.path)
+
+    def claimed_by_earlier_run(canonical):
+        """
+        The earlier run's file of a cover, as validate's output. A run killed
+        between accepting a cover and journaling it left the file with no
+        annotate entry; the journal ignores this output for covers that have one.
+        """
+        path = saved.get(canonical)
+        return [(os.path.splitext(os.path.basename(path))[0], {"img_path": path})] if path else ()
+
+    def discover(item):
+        search_url = f"{base_url}/search?q={urllib.parse.quote_plus(item['query'])}"
+        # A 429/5xx page has no links; raising fails the item so resume and --retry-failed redo it
+        search_response = fetcher.get(search_url)
+        search_response.raise_for_status()
+        for href in extractor.extract(search_response.content, "book_links"):
+            book_url = urllib.parse.urljoin(base_url, href)
+            yield book_url, {"lang": item["lang"], "book_url": book_url}
+
+    def settle(item):
+        """Ends the reservation of a download (counters_lock held): validate has kept, counted or dropped it."""
+        if item.get("_reserved"):
+            in_flight[item["lang"]] -= 1
+            counters_lock.notify_all()
+
+    def fetch_cover(book_url):
+        book_response = fetcher.get(book_url)
+        book_response.raise_for_status()
+        src = extractor.first(book_response.content, "cover")
+        if not src:
+            return None
+        img_url = urllib.parse.urljoin(book_url, src)
+        # Streamed to disk and checked from its header; placeholders and cut-off bodies stop here
         try:
-            res = requests.get(search_url, headers=headers)
-            soup = BeautifulSoup(res.content, 'html.parser')
-            book_links = ["https://www.goodreads.com" + a['href'] for a in soup.find_all('a', class_='bookTitle', href=True)]
-        except Exception as e:
-            print(f"  Could not fetch search results. Skipping. Error: {e}")
-            continue
-
-        for book_url in tqdm(book_links, desc=f"  -> {lang_key}"):
-            if counters[lang_key] >= IMAGES_PER_QUERY: break
-            try:
-                book_res = requests.get(book_url, headers=headers)
-                book_soup = BeautifulSoup(book_res.content, 'html.parser')
-                img_tag = book_soup.find('img', class_='ResponsiveImage')
-                if not (img_tag and img_tag.get('src')): continue
+            return img_url, ingestor.download(img_url)
+        except Rejected:
+            return None
 
-                img_data_res = requests.get(img_tag['src'], headers=headers)
-                
-                if not is_image_valid(io.BytesIO(img_data_res.content)):
-                    continue
+    def download(item):
+        lang_key = item["lang"]
+        with counters_lock:
+            # While covers in flight would fill the quota, wait for validate to settle one instead of
+            # fetching past it; a duplicate or rejected cover gives its slot back
+            while reserve and counters[lang_key] < IMAGES_PER_QUERY <= counters[lang_key] + in_flight[lang_key]:
+                counters_lock.wait()
+            if counters[lang_key] >= IMAGES_PER_QUERY:
+                return
+            if reserve: in_flight[lang_key] += 1
+        cover = None
+        try:
+            cover = fetch_cover(item["book_url"])
+        finally:
+            if cover is None and reserve:
+                # No cover, rejected or failed: the slot goes back
+                with counters_lock: settle({"lang": lang_key, "_reserved": True})
+        if cover is None:
+            return
+        img_url, fetched = cover
+        yield img_url, {"lang": lang_key, "img_url": img_url, **fetched, "_reserved": reserve}
 
+    def validate(item):
+        if not os.path.exists(item.get("incoming", "")):
+            # Resumed after the download was cleared away
+            try:
+                item = {**item, **ingestor.download(item["img_url"])}
+            except Rejected:
+                with counters_lock: settle(item)
+                return
+            except Exception:
+                # The item fails, but its slot must not stay taken
+                with counters_lock: settle(item)
+                raise
+        lang_key = item["lang"]
+        with counters_lock:
+            settle(item)
+            # An exact copy of a cover already kept is dropped without decoding it
+            canonical = store.canonical(item["sha"])
+            keep = counters[lang_key] < IMAGES_PER_QUERY and canonical not in seen_covers
+            if keep:
+                next_index[lang_key] += 1
+                base_name = f"{lang_key}_{next_index[lang_key]:03d}"
                 counters[lang_key] += 1
-                count_str = f"{counters[lang_key]:03d}"
-                base_name = f"{lang_key}_{count_str}"
-                img_path = os.path.join(RAW_DIR, base_name + '.jpg')
-                json_path = os.path.join(RAW_DIR, base_name + '.json')
-
-                with open(img_path, 'wb') as f:
-                    f.write(img_data_res.content)
-                
-                img_for_api = Image.open(img_path)
-                prompt = """Analyze this image. Your response MUST be a single, valid JSON object and nothing else. The JSON should have one key: "shapes". The value of "shapes" is a list of objects, each with a "label" ('text') and a "points" list of [x, y] polygon coordinates. Example: {"shapes": [{"label": "text", "points": [[x1,y1],[x2,y2],[x3,y3],[x4,y4]]}]}"""
-                response = GEMINI_MODEL.generate_content([prompt, img_for_api])
-                cleaned_response = response.text.strip().replace("json", "").replace("", "")
-                data = json.loads(cleaned_response)
-
-                labelme_output = {"version": "5.0.1", "flags": {}, "shapes": data.get("shapes", []), "imagePath": base_name + '.jpg', "imageData": None, "imageHeight": img_for_api.height, "imageWidth": img_for_api.width}
-                for shape in labelme_output["shapes"]:
-                    shape.update({"group_id": None, "shape_type": "polygon", "flags": {}})
-                with open(json_path, 'w') as f:
-                    json.dump(labelme_output, f, indent=2)
-
-                time.sleep(1.5)
-            except Exception as e:
-                print(f"  An error occurred processing {book_url}. Details: {e}")
-                time.sleep(3)
+        if not keep:
+            ingestor.discard(item)
+            yield from claimed_by_earlier_run(canonical)
+            return
+        img_path = os.path.join(raw_dir, base_name + '.jpg')
+        try:
+            canonical, img = ingestor.accept(item, img_path)
+        except Rejected:
+            canonical = img = None
+        with counters_lock:
+            duplicate = canonical is None or canonical in seen_covers
+            if duplicate:
+                counters[lang_key] -= 1
+                counters_lock.notify_all()
+            else: seen_covers.add(canonical)
+        if duplicate:
+            if canonical is not None: os.remove(img_path)
+            yield from claimed_by_earlier_run(canonical)
+            return
+        # The one decode is handed on: annotation gets the normalized image from memory
+        ingestor.share(item, img_path, img)
+        yield base_name, {"img_path": img_path}
 
-    print("\n--- Phase 2: Finalizing dataset for training ---")
-    if os.path.exists(FINAL_DATASET_DIR): shutil.rmtree(FINAL_DATASET_DIR)
+    def annotate(item):
+        img_path = item["img_path"]
+        # Covers annotated on an earlier run (under any name) skip the API call
+        if os.path.basename(img_path) not in annotations and \
+                not cache.reuse(img_path, annotations, "gemini", GEMINI_MODEL_NAME, PROMPT):
+            labelme = batcher.annotate(img_path)
+            cache.put(img_path, labelme, "gemini", GEMINI_MODEL_NAME, PROMPT)
+        yield os.path.basename(img_path), item
 
-    all_files = [os.path.splitext(f)[0] for f in os.listdir(RAW_DIR) if f.endswith('.jpg')]
-    if not all_files:
+    def export(item):
+        # Normally already done in validate; a resumed run may still have to decode and resize here.
+        # build_dataset then only links files and writes labels
+        normalizer.normalize(item["img_path"])
+        return ()
+
+    return [Stage("discover", discover, workers=2),
+            Stage("download", download, workers=8),
+            Stage("validate", validate, workers=2),
+            # Enough covers waiting on their annotation to fill a batch for every call in flight
+            Stage("annotate", annotate, workers=batcher.scheduler.max_in_flight * batcher.batch_size),
+            Stage("export", export, workers=2)]
+
+def run_pipeline(stages=None, fresh=False, retry_failed=False, model=None, base_url=GOODREADS_BASE_URL, raw_dir=RAW_DIR,
+                 batch_size=BATCH_SIZE):
+    """
+    Scrapes, verifies, annotates and exports covers as a streaming stage graph.
+    Progress is journaled in `raw_dir`, so a killed run picks up where it stopped;
+    `stages` limits the run to some stages (their inputs come from the journal).
+    """
+    print("🚀 Starting the Master Data Preparation Pipeline...")
+    if model is None and (stages is None or "annotate" in stages):
+        # Configured only when annotating, so other stages run offline and without a key
+        model = gemini_model(GEMINI_MODEL_NAME, KEY_FILE_PATH)
+    if fresh and os.path.exists(raw_dir): shutil.rmtree(raw_dir)
+    os.makedirs(raw_dir, exist_ok=True)
+
+    headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'}
+    # Cached fetches make a re-run after a crash or a prompt tweak almost free on the network
+    fetcher = Fetcher(headers=headers, cache=HTTPCache())
+    store = ImageStore()
+    annotations = AnnotationStore(raw_dir)
+    cache = AnnotationCache(store=store)
+    normalizer = Normalizer(store=store, keep=SHARED_IMAGES)
+    ingestor = Ingestor(fetcher, store, os.path.join(raw_dir, INCOMING_DIR), normalizer)
+    # Gemini calls are paced to the API quota and carry `batch_size` covers each
+    scheduler = AnnotationScheduler()
+    batcher = AnnotationBatcher(model, PROMPT, scheduler, batch_size, store=annotations, normalizer=normalizer,
+                                source="goodreads")
+    journal = Journal(os.path.join(raw_dir, JOURNAL_NAME))
+    journal.seed("discover", [(query, {"lang": lang_key, "query": query}) for lang_key, query in QUERIES.items()])
+    if retry_failed:
+        print(f"Retrying {journal.retry_failed(stages)} failed item(s).")
+
+    reserve = stages is None or "validate" in stages
+    graph = StageGraph(_pipeline_stages(raw_dir, fetcher, store, ingestor, annotations, cache, normalizer, batcher, base_url,
+                                        reserve), journal)
+    print("\n--- Phase 1: Scraping, Verifying, and Annotating ---")
+    with tqdm(desc="  Items") as progress, metrics.stage("stage_graph"):
+        def on_item(stage, key, error):
+            progress.update(1)
+            if error:
+                tqdm.write(f"  {stage} failed for {key}: {error}")
+                metrics.event("item_failed", stage=stage, key=key, error=error)
+        graph.run(only=stages, progress=on_item)
+    graph.report()
+    ingestor.report()
+    batcher.close()
+    batcher.report()
+    scheduler.report()
+    cache.report()
+    scheduler.close()
+    fetcher.close()
+    journal.close()
+
+    if stages is not None and "export" not in stages:
+        return
+    print("\n--- Phase 2: Finalizing dataset for training ---")
+    if not any(f.endswith('.jpg') for f in os.listdir(raw_dir)):
         print("No images were successfully processed. Exiting.")
         return
-        
-    train_files, test_files = train_test_split(all_files, test_size=TRAIN_TEST_SPLIT_RATIO, random_state=42)
-
-    for split, files in [('train', train_files), ('test', test_files)]:
-        img_dest, lbl_dest = os.path.join(FINAL_DATASET_DIR, split, 'images'), os.path.join(FINAL_DATASET_DIR, split, 'labels')
-        os.makedirs(img_dest, exist_ok=True)
-        os.makedirs(lbl_dest, exist_ok=True)
-
-        for basename in tqdm(files, desc=f"  Creating {split} set"):
-            shutil.copy(os.path.join(RAW_DIR, basename + '.jpg'), img_dest)
-            with open(os.path.join(RAW_DIR, basename + '.json'), 'r') as f:
-                data = json.load(f)
-            
-            yolo_annotations = []
-            img_w, img_h = data['imageWidth'], data['imageHeight']
-            for shape in data['shapes']:
-                points = np.array(shape['points'])
-                x_min, y_min = np.min(points, axis=0)
-                x_max, y_max = np.max(points, axis=0)
-                x_center, y_center = ((x_min + x_max)/2)/img_w, ((y_min + y_max)/2)/img_h
-                width, height = (x_max - x_min)/img_w, (y_max - y_min)/img_h
-                yolo_annotations.append(f"0 {x_center:.6f} {y_center:.6f} {width:.6f} {height:.6f}")
-            
-            with open(os.path.join(lbl_dest, basename + '.txt'), 'w') as f:
-                f.write('\n'.join(yolo_annotations))
-
-    print("\n--- Phase 3: Create YAML Config ---")
-    yaml_content = f"path: ../{FINAL_DATASET_DIR}\ntrain: train/images\nval: test/images\ntest: test/images\nnames:\n  0: text"
-    with open(os.path.join(FINAL_DATASET_DIR, 'dataset.yaml'), 'w') as f:
-        f.write(yaml_content)
-    
-    shutil.rmtree(RAW_DIR)
+
+    # Also writes dataset.yaml; unchanged covers keep their split and aren't rewritten.
+    # Only annotated images are exported, so failed annotations can be retried later.
+    with metrics.stage("build_dataset"):
+        build_dataset(raw_dir, FINAL_DATASET_DIR, TRAIN_TEST_SPLIT_RATIO, store=store, normalizer=normalizer,
+                      annotations=annotations)
+
+    normalizer.report()
+    annotations.report()
     print(f"\n Pipeline complete! Your training-ready dataset is in the '{FINAL_DATASET_DIR}' folder.")
 
 if __name__ == '__main__':
-    run_pipeline()
+    parser = argparse.ArgumentParser(description="Scrape, annotate and export book covers as a resumable pipeline")
+    parser.add_argument('--stages', type=str, default=None,
+                        help=f"Comma-separated subset of stages to run ({','.join(STAGE_NAMES)}); default all")
+    parser.add_argument('--fresh', action='store_true', help=f"Discard '{RAW_DIR}' and its journal and start over")
+    parser.add_argument('--retry-failed', action='store_true', help='Re-queue items that failed on an earlier run')
+    parser.add_argument('--base-url', type=str, default=GOODREADS_BASE_URL, help='Site root (e.g. a FixtureServer URL)')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Covers per Gemini request (1 = one each)')
+    metrics.add_arguments(parser)
+    args = parser.parse_args()
+    metrics.configure_from_args(args, "master_pipeline")
+
+    stages = args.stages.split(',') if args.stages else None
+    unknown = set(stages or ()) - set(STAGE_NAMES)
+    if unknown: parser.error(f"unknown stage(s): {', '.join(sorted(unknown))}")
+    try:
+        run_pipeline(stages, args.fresh, args.retry_failed, base_url=args.base_url, batch_size=args.batch_size)
+    except GeminiConfigError as e:
+        print(f"ERROR: Could not configure Gemini API. {e}")
+        exit(1)
@@ -0,0 +1,128 @@
+import argparse
+import errno
+import fcntl
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# --- Configuration ---
+DEFAULT_WORKERS = 8
+STRATEGIES = ("hardlink", "reflink", "copy_file_range", "copy")
+FICLONE = 0x40049409  # ioctl(dest_fd, FICLONE, src_fd): share extents on btrfs/XFS/bcachefs
+COPY_CHUNK = 1 << 20
+# errnos meaning "this strategy can't work between these two filesystems", not "this file is bad"
+UNSUPPORTED = {errno.EXDEV, errno.EPERM, errno.EOPNOTSUPP, errno.ENOTTY, errno.EINVAL, errno.ENOSYS, errno.EMLINK}
+
+
+class Materializer:
+    """
+    Places files at dataset paths without duplicating their bytes where the
+    filesystem allows it. Per file it tries, in order: a hardlink, a reflink,
+    an in-kernel `copy_file_range`, then a plain buffered copy. A strategy
+    that fails as unsupported for a (source device, destination device) pair
+    isn't retried for that pair.
+
+    Sources must be treated as immutable (the image store and normalizer
+    replace files rather than rewrite them), since a hardlinked dataset image
+    *is* the source file.
+    """
+
+    def __init__(self, workers=DEFAULT_WORKERS, strategies=STRATEGIES):
+        self.workers = workers
+        self.strategies = tuple(strategies)
+        self.lock = threading.Lock()
+        self.unsupported = {}  # (src_dev, dest_dev) -> set of strategies
+        self.stats = {s: 0 for s in STRATEGIES}
+        self.stats.update({"bytes_avoided": 0, "bytes_copied": 0, "seconds": 0.0})
+
+    # --- Strategies: each writes `dest` (a fresh temp path) or raises OSError ---
+    @staticmethod
+    def _hardlink(src, dest):
+        os.link(src, dest)
+
+    @staticmethod
+    def _reflink(src, dest):
+        with open(src, 'rb') as fsrc, open(dest, 'wb') as fdst:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+
+    @staticmethod
+    def _copy_file_range(src, dest):
+        if not hasattr(os, "copy_file_range"):
+            raise OSError(errno.ENOSYS, "copy_file_range unavailable")
+        with open(src, 'rb') as fsrc, open(dest, 'wb') as fdst:
+            remaining = os.fstat(fsrc.fileno()).st_size
+            while remaining > 0:
+                sent = os.copy_file_range(fsrc.fileno(), fdst.fileno(), remaining)
+                if sent == 0:
+                    break
+                remaining -= sent
+
+    @staticmethod
+    def _copy(src, dest):
+        with open(src, 'rb') as fsrc, open(dest, 'wb') as fdst:
+            shutil.copyfileobj(fsrc, fdst, COPY_CHUNK)
+
+    def materialize(self, src, dest):
+        """Makes `dest` a copy of `src` (replacing any existing file). Returns the strategy used."""
+        size = os.path.getsize(src)
+        dest_dir = os.path.dirname(dest) or '.'
+        devices = (os.stat(src).st_dev, os.stat(dest_dir).st_dev)
+        tmp_path = f"{dest}.{threading.get_ident()}.tmp"
+        for strategy in self.strategies:
+            if strategy in self.unsupported.get(devices, ()):
+                continue
+            try:
+                getattr(self, f"_{strategy}")(src, tmp_path)
+            except OSError as e:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                if e.errno not in UNSUPPORTED or strategy == "copy":
+                    raise
+                with self.lock:
+                    self.unsupported.setdefault(devices, set()).add(strategy)
+                continue
+            os.replace(tmp_path, dest)
+            with self.lock:
+                self.stats[strategy] += 1
+                # copy_file_range stays in the kernel, but only a link or reflink avoids writing the bytes
+                self.stats["bytes_avoided" if strategy in ("hardlink", "reflink") else "bytes_copied"] += size
+            return strategy
+        raise OSError(errno.ENOTSUP, f"no materialization strategy worked for {src}")
+
+    def materialize_many(self, pairs):
+        """Materializes `(src, dest)` pairs in parallel. Returns the strategies used, in order."""
+        pairs = list(pairs)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            strategies = list(pool.map(lambda pair: self.materialize(*pair), pairs))
+        with self.lock:
+            self.stats["seconds"] += time.perf_counter() - start
+        return strategies
+
+    def report(self):
+        s = self.stats
+        files = sum(s[name] for name in STRATEGIES)
+        if not files:
+            return
+        used = ", ".join(f"{s[name]} {name}" for name in STRATEGIES if s[name])
+        print(f"Materialized {files} files ({used}): {s['bytes_avoided'] / 1e6:.1f} MB not copied, "
+              f"{s['bytes_copied'] / 1e6:.1f} MB copied")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Materialize a directory's files into another without copying where possible")
+    parser.add_argument('--src', type=str, required=True)
+    parser.add_argument('--dst', type=str, required=True)
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS)
+    parser.add_argument('--strategy', choices=STRATEGIES, default=None, help='Force one strategy (default: best available)')
+    args = parser.parse_args()
+
+    os.makedirs(args.dst, exist_ok=True)
+    names = [entry.name for entry in os.scandir(args.src) if entry.is_file()]
+    materializer = Materializer(args.workers, [args.strategy] if args.strategy else STRATEGIES)
+    start = time.perf_counter()
+    materializer.materialize_many((os.path.join(args.src, n), os.path.join(args.dst, n)) for n in names)
+    print(f"{len(names)} files in {time.perf_counter() - start:.2f}s")
+    materializer.report()
@@ -0,0 +1,231 @@
+import atexit
+import cProfile
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# --- Configuration ---
+METRICS_DIR = "metrics"
+PREFIX = "covers_"
+FLUSH_INTERVAL = 15.0  # seconds between textfile/snapshot writes while a run is going
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels_text(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}" if pairs else ""
+
+
+class Registry:
+    """
+    In-process counters, gauges and latency histograms, keyed by name plus
+    labels. Recording is a dict update under a lock, so instrumented code pays
+    next to nothing when nobody reads the numbers. After `configure()`, the
+    registry also appends events and periodic snapshots to `<name>.jsonl`,
+    and rewrites `<name>.prom` for node_exporter's textfile collector.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.jsonl = None
+        self.prom_path = None
+        self.profile_stages = set()
+        self.profile_dir = None
+        self.flusher = None
+        self.stop = threading.Event()
+
+    def configure(self, directory=METRICS_DIR, name="pipeline", profile=(), interval=FLUSH_INTERVAL):
+        """
+        Starts writing metrics under `directory`. `profile` names the stages to
+        run under cProfile (one `<stage>.<thread>.prof` per thread, readable
+        with snakeviz or `python -m pstats`); "all" profiles every stage.
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.jsonl = open(os.path.join(directory, name + ".jsonl"), 'a', buffering=1)
+        self.prom_path = os.path.join(directory, name + ".prom")
+        self.profile_stages = set(profile)
+        self.profile_dir = os.path.join(directory, "profiles")
+        self.event("run_start", pid=os.getpid(), name=name)
+        if interval and self.flusher is None:
+            self.flusher = threading.Thread(target=self._flush_loop, args=(interval,), daemon=True, name="metrics-flush")
+            self.flusher.start()
+        atexit.register(self.close)
+
+    # --- Recording ---
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def gauge(self, name, value, **labels):
+        with self.lock:
+            self.gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            hist = self.histograms.get(key)
+            if hist is None:
+                hist = self.histograms[key] = [[0] * len(LATENCY_BUCKETS), 0.0, 0]
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    hist[0][i] += 1
+                    break
+            hist[1] += seconds
+            hist[2] += 1
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Observes the duration of the `with` block in histogram `name`."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def event(self, kind, **fields):
+        """Appends one JSON line (no-op until configured)."""
+        if self.jsonl is not None:
+            line = json.dumps({"ts": round(time.time(), 3), "kind": kind, **fields}, default=str)
+            with self.lock:
+                self.jsonl.write(line + "\n")
+
+    # --- Stages and profiling ---
+    def profiling(self, stage):
+        return stage in self.profile_stages or "all" in self.profile_stages
+
+    @contextmanager
+    def profiled(self, stage, tag=None):
+        """cProfile for the current thread while `stage` runs, if that stage was asked for."""
+        if not self.profiling(stage):
+            yield
+            return
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            os.makedirs(self.profile_dir, exist_ok=True)
+            profiler.dump_stats(os.path.join(self.profile_dir, f"{stage}.{threading.get_ident() if tag is None else tag}.prof"))
+
+    @contextmanager
+    def stage(self, name, **fields):
+        """
+        Times a pipeline phase: `stage_seconds{stage}`, start/end events, and
+        (opt-in) a cProfile dump. The thread is renamed to `stage:<name>` for
+        the duration, so `py-spy dump`/`py-spy top` show which phase it is in.
+        """
+        thread = threading.current_thread()
+        previous = thread.name
+        thread.name = f"stage:{name}"
+        self.event("stage_start", stage=name, **fields)
+        start = time.perf_counter()
+        status = "ok"
+        try:
+            with self.profiled(name, tag="main"):
+                yield
+        except BaseException:
+            status = "error"
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            thread.name = previous
+            self.observe("stage_seconds", elapsed, stage=name)
+            self.inc("stage_runs_total", stage=name, status=status)
+            self.event("stage_end", stage=name, status=status, seconds=round(elapsed, 4), **fields)
+
+    # --- Output ---
+    def snapshot(self):
+        """Plain-dict copy of every metric, keyed `name{label="value",...}`."""
+        with self.lock:
+            counters = {name + _labels_text(labels): v for (name, labels), v in self.counters.items()}
+            gauges = {name + _labels_text(labels): v for (name, labels), v in self.gauges.items()}
+            histograms = {name + _labels_text(labels): {"count": h[2], "sum": round(h[1], 6),
+                                                        "buckets": dict(zip(map(str, LATENCY_BUCKETS), h[0]))}
+                          for (name, labels), h in self.histograms.items()}
+        return {"counters": counters, "gauges": gauges, "histograms": histograms}
+
+    def prometheus_text(self):
+        """The registry in Prometheus text exposition format."""
+        lines = []
+        with self.lock:
+            for kind, metrics in (("counter", self.counters), ("gauge", self.gauges)):
+                for name in sorted({n for n, _ in metrics}):
+                    lines.append(f"# TYPE {PREFIX}{name} {kind}")
+                    lines += [f"{PREFIX}{name}{_labels_text(labels)} {value}"
+                              for (n, labels), value in sorted(metrics.items()) if n == name]
+            for name in sorted({n for n, _ in self.histograms}):
+                lines.append(f"# TYPE {PREFIX}{name} histogram")
+                for (n, labels), (buckets, total, count) in sorted(self.histograms.items()):
+                    if n != name:
+                        continue
+                    cumulative = 0
+                    for bound, c in zip(LATENCY_BUCKETS, buckets):
+                        cumulative += c
+                        lines.append(f"{PREFIX}{name}_bucket{_labels_text(labels, [('le', bound)])} {cumulative}")
+                    lines.append(f"{PREFIX}{name}_bucket{_labels_text(labels, [('le', '+Inf')])} {count}")
+                    lines.append(f"{PREFIX}{name}_sum{_labels_text(labels)} {total:.6f}")
+                    lines.append(f"{PREFIX}{name}_count{_labels_text(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def flush(self):
+        """Rewrites the textfile (atomically, as the collector requires) and appends a snapshot line."""
+        if self.prom_path is None:
+            return
+        tmp_path = f"{self.prom_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp_path, self.prom_path)
+        self.event("snapshot", **self.snapshot())
+
+    def _flush_loop(self, interval):
+        while not self.stop.wait(interval):
+            self.flush()
+
+    def close(self):
+        if self.jsonl is None:
+            return
+        self.stop.set()
+        self.flush()
+        self.event("run_end", pid=os.getpid())
+        self.jsonl.close()
+        self.jsonl = None
+
+
+# One registry per process; modules record through these module-level helpers
+REGISTRY = Registry()
+configure = REGISTRY.configure
+inc = REGISTRY.inc
+gauge = REGISTRY.gauge
+observe = REGISTRY.observe
+timer = REGISTRY.timer
+event = REGISTRY.event
+stage = REGISTRY.stage
+profiled = REGISTRY.profiled
+profiling = REGISTRY.profiling
+snapshot = REGISTRY.snapshot
+flush = REGISTRY.flush
+close = REGISTRY.close
+
+
+def add_arguments(parser):
+    """The --metrics-dir/--profile flags every pipeline entry point shares."""
+    parser.add_argument('--metrics-dir', type=str, default=None,
+                        help=f"Write metrics (JSON lines + Prometheus textfile) here, e.g. '{METRICS_DIR}'")
+    parser.add_argument('--profile', type=str, default='',
+                        help="Comma-separated stages to run under cProfile ('all' for every stage); needs --metrics-dir")
+
+
+def configure_from_args(args, name):
+    if args.metrics_dir:
+        configure(args.metrics_dir, name, [s for s in args.profile.split(',') if s])
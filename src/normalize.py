@@ -0,0 +1,154 @@
+import io
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from PIL import Image
+
+from image_store import ImageStore
+from materialize import Materializer
+import metrics
+
+# --- Configuration ---
+NORMALIZED_DIR = ".normalized"
+MAX_LONG_SIDE = 1280   # px; covers above this are downscaled before annotation and training
+JPEG_QUALITY = 85
+MAX_BYTES_PER_PIXEL = 0.5  # JPEGs heavier than this (metadata, near-lossless encodes) are re-encoded too
+
+
+def back_project(shapes, scale):
+    """Maps shape points from a normalized image (scaled by `scale`) back to original pixels."""
+    if scale == 1.0:
+        return shapes
+    for shape in shapes:
+        shape['points'] = [[x / scale, y / scale] for x, y in shape['points']]
+    return shapes
+
+
+class Normalizer:
+    """
+    Decodes each image once, caps its long side at `max_side` and re-encodes it
+    as JPEG at `quality`. Normalized copies are cached by the original's
+    SHA-256, so every later consumer (Gemini upload, OCR, dataset export)
+    reads the small file. Reasonably compressed JPEGs already within bounds are
+    used as-is. With `keep`, the last `keep` images normalized from an image
+    already in memory (see ingest.Ingestor) stay decoded for `open`.
+    """
+
+    def __init__(self, max_side=MAX_LONG_SIDE, quality=JPEG_QUALITY, cache_dir=NORMALIZED_DIR, store=None, materializer=None,
+                 keep=0):
+        self.max_side = max_side
+        self.quality = quality
+        self.cache_dir = cache_dir
+        self.store = store or ImageStore()
+        self.materializer = materializer or Materializer()
+        os.makedirs(cache_dir, exist_ok=True)
+        self.lock = threading.Lock()
+        self.keep = keep
+        self.kept = OrderedDict()  # image_path -> (normalized PIL image, scale, original size), oldest first
+        self.stats = {"images": 0, "resized": 0, "bytes_in": 0, "bytes_out": 0, "decode_ms_in": 0.0, "decode_ms_out": 0.0}
+
+    def normalize(self, image_path, img=None):
+        """
+        Returns `(normalized_path, scale, (orig_width, orig_height))`, where
+        scale = normalized size / original size. `img` is the image already
+        decoded, if the caller has it.
+        """
+        sha, _, _ = self.store.add_file(image_path)
+        width, height = self.store.size(sha)
+        long_side = max(width, height)
+        is_jpeg = os.path.splitext(image_path)[1].lower() in ('.jpg', '.jpeg')
+        size_in = os.path.getsize(image_path)
+        if long_side <= self.max_side and is_jpeg and size_in <= MAX_BYTES_PER_PIXEL * width * height:
+            self._keep(image_path, img, 1.0, (width, height))
+            return image_path, 1.0, (width, height)
+
+        scale = min(1.0, self.max_side / long_side)
+        out_path = os.path.join(self.cache_dir, f"{sha}_{self.max_side}_q{self.quality}.jpg")
+        if os.path.exists(out_path):
+            return out_path, scale, (width, height)
+        # Marks a JPEG that re-encoding didn't shrink, so later calls skip straight to the original
+        keep_path = os.path.join(self.cache_dir, f"{sha}_{self.max_side}_q{self.quality}.keep")
+        if is_jpeg and scale == 1.0 and os.path.exists(keep_path):
+            self._keep(image_path, img, 1.0, (width, height))
+            return image_path, 1.0, (width, height)
+
+        start = time.perf_counter()
+        if img is None:
+            with Image.open(image_path) as img:
+                img = img.convert('RGB')
+            decode_in = (time.perf_counter() - start) * 1000
+            metrics.observe("image_decode_seconds", decode_in / 1000, step="normalize")
+        else:
+            img, decode_in = img.convert('RGB'), 0.0
+        if scale < 1.0:
+            img = img.resize((max(1, round(width * scale)), max(1, round(height * scale))), Image.LANCZOS)
+        buffer = io.BytesIO()
+        img.save(buffer, 'JPEG', quality=self.quality, optimize=True)
+        data = buffer.getvalue()
+        if scale == 1.0 and is_jpeg and len(data) >= size_in:
+            open(keep_path, 'wb').close()
+            self._keep(image_path, img, 1.0, (width, height))
+            return image_path, 1.0, (width, height)
+        self._keep(image_path, img, scale, (width, height))
+
+        start = time.perf_counter()
+        Image.open(io.BytesIO(data)).load()
+        decode_out = (time.perf_counter() - start) * 1000
+
+        tmp_path = f"{out_path}.{threading.get_ident()}.tmp"
+        with metrics.timer("disk_write_seconds", step="normalize"):
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, out_path)
+
+        with self.lock:
+            s = self.stats
+            s["images"] += 1
+            s["resized"] += scale < 1.0
+            s["bytes_in"] += size_in
+            s["bytes_out"] += len(data)
+            s["decode_ms_in"] += decode_in
+            s["decode_ms_out"] += decode_out
+        return out_path, scale, (width, height)
+
+    def _keep(self, image_path, img, scale, original_size):
+        if img is None or not self.keep:
+            return
+        with self.lock:
+            self.kept[image_path] = (img, scale, original_size)
+            while len(self.kept) > self.keep:
+                self.kept.popitem(last=False)
+
+    def open(self, image_path):
+        """Loads the normalized image. Returns `(PIL image, scale, (orig_width, orig_height))`."""
+        with self.lock:
+            kept = self.kept.pop(image_path, None)
+        if kept is not None:
+            metrics.inc("normalized_images_shared_total")
+            return kept
+        path, scale, original_size = self.normalize(image_path)
+        with Image.open(path) as img:
+            img.load()
+        return img, scale, original_size
+
+    def export(self, image_path, dest_path):
+        """Places the normalized version of `image_path` at `dest_path` (hardlinked where possible)."""
+        path, _, _ = self.normalize(image_path)
+        return self.materializer.materialize(path, dest_path)
+
+    def export_many(self, pairs):
+        """Normalizes each `(image_path, dest_path)` pair, then materializes them all in parallel."""
+        return self.materializer.materialize_many((self.normalize(src)[0], dest) for src, dest in pairs)
+
+    def report(self):
+        self.materializer.report()
+        s = self.stats
+        if not s["images"]:
+            return
+        saved_mb = (s["bytes_in"] - s["bytes_out"]) / 1e6
+        print(f"Normalized {s['images']} images ({s['resized']} downscaled): "
+              f"{s['bytes_in'] / 1e6:.1f} MB -> {s['bytes_out'] / 1e6:.1f} MB (saved {saved_mb:.1f} MB); "
+              f"decode {s['decode_ms_in']:.0f} ms -> {s['decode_ms_out']:.0f} ms per pass "
+              f"(saved {s['decode_ms_in'] - s['decode_ms_out']:.0f} ms)")
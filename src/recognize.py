@@ -0,0 +1,163 @@
+import argparse
+import os
+import time
+
+import numpy as np
+from PIL import Image
+from tqdm import tqdm
+
+from annotation_store import AnnotationStore
+
+# --- Configuration ---
+OCR_LANGUAGES = ['en', 'hi']
+CROP_HEIGHT = 64          # EasyOCR's recognizer input height, so crops aren't resized again
+CROP_GAP = 8              # blank rows between stacked crops
+MAX_CROP_WIDTH = 1600
+CROPS_PER_CALL = 256      # crops stacked per recognize() call
+VERTICAL_ASPECT = 1.5     # crops taller than this x their width are rotated to horizontal
+
+_readers = {}
+
+
+def _reader_for(languages):
+    """A recognizer-only EasyOCR Reader: boxes come from annotations or our detector, never from CRAFT."""
+    import easyocr
+    key = tuple(languages)
+    if key not in _readers:
+        _readers[key] = easyocr.Reader(list(languages), gpu=False, detector=False, verbose=False)
+    return _readers[key]
+
+
+def order_quad(points):
+    """Four polygon points as top-left, top-right, bottom-right, bottom-left; other polygons use their bounding box."""
+    pts = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    if len(pts) != 4:
+        (x0, y0), (x1, y1) = pts.min(axis=0), pts.max(axis=0)
+        return np.array([[x0, y0], [x1, y0], [x1, y1], [x0, y1]])
+    sums, diffs = pts.sum(axis=1), pts[:, 1] - pts[:, 0]
+    return np.array([pts[sums.argmin()], pts[diffs.argmin()], pts[sums.argmax()], pts[diffs.argmax()]])
+
+
+def _perspective_coeffs(src_quad, width, height):
+    """PIL PERSPECTIVE coefficients mapping the output rectangle back onto `src_quad`."""
+    dst = [(0, 0), (width, 0), (width, height), (0, height)]
+    rows, rhs = [], []
+    for (x, y), (u, v) in zip(src_quad, dst):
+        rows.append([u, v, 1, 0, 0, 0, -x * u, -x * v])
+        rows.append([0, 0, 0, u, v, 1, -y * u, -y * v])
+        rhs += [x, y]
+    return np.linalg.solve(np.asarray(rows), np.asarray(rhs))
+
+
+def rectify(gray, points, height=CROP_HEIGHT):
+    """
+    Cuts the region `points` out of the grayscale PIL image and warps it to an
+    upright `height`-pixel-tall strip (perspective-corrected for 4-point polygons).
+    """
+    quad = order_quad(points)
+    top, bottom = np.linalg.norm(quad[1] - quad[0]), np.linalg.norm(quad[2] - quad[3])
+    left, right = np.linalg.norm(quad[3] - quad[0]), np.linalg.norm(quad[2] - quad[1])
+    src_w, src_h = max(top, bottom, 1.0), max(left, right, 1.0)
+    if src_h > VERTICAL_ASPECT * src_w:
+        quad = np.roll(quad, -1, axis=0)  # read top-to-bottom text as a rotated line
+        src_w, src_h = src_h, src_w
+    width = int(min(MAX_CROP_WIDTH, max(1, round(src_w * height / src_h))))
+    coeffs = _perspective_coeffs(quad, width, height)
+    return np.asarray(gray.transform((width, height), Image.PERSPECTIVE, tuple(coeffs), Image.BILINEAR))
+
+
+def crops_from_image(image, polygons):
+    """All rectified crops of one image, from a single decode. `image` is a path or a PIL image."""
+    if isinstance(image, str):
+        with Image.open(image) as img:
+            gray = img.convert('L')
+    else:
+        gray = image.convert('L')
+    return [rectify(gray, points) for points in polygons]
+
+
+def stack_crops(crops):
+    """Stacks crops top-to-bottom on one canvas. Returns `(canvas, horizontal_list)` for reader.recognize."""
+    width = max(c.shape[1] for c in crops)
+    canvas = np.full((len(crops) * (CROP_HEIGHT + CROP_GAP), width), 255, dtype=np.uint8)
+    boxes = []
+    for i, crop in enumerate(crops):
+        y = i * (CROP_HEIGHT + CROP_GAP)
+        canvas[y:y + crop.shape[0], :crop.shape[1]] = crop
+        boxes.append([0, crop.shape[1], y, y + crop.shape[0]])
+    return canvas, boxes
+
+
+def recognize_crops(crops, languages=OCR_LANGUAGES, reader=None):
+    """`[(text, prob)]` for each crop, via one recognizer call per CROPS_PER_CALL crops."""
+    reader = reader or _reader_for(languages)
+    results = []
+    for start in range(0, len(crops), CROPS_PER_CALL):
+        chunk = crops[start:start + CROPS_PER_CALL]
+        canvas, boxes = stack_crops(chunk)
+        found = {}
+        for box, text, prob in reader.recognize(canvas, horizontal_list=boxes, free_list=[], batch_size=len(chunk)):
+            # EasyOCR sorts regions by top edge; map each back to its crop by position
+            found[int(round(box[0][1])) // (CROP_HEIGHT + CROP_GAP)] = (text, float(prob))
+        results.extend(found.get(i, ("", 0.0)) for i in range(len(chunk)))
+    return results
+
+
+def recognize_regions(items, languages=OCR_LANGUAGES, reader=None):
+    """
+    `items` = [(image path or PIL image, [polygon, ...])]. Every crop of
+    every item is batched through the recognizer together; returns
+    `[(text, prob), ...]` per item, in polygon order.
+    """
+    crops, owners = [], []
+    for index, (image, polygons) in enumerate(items):
+        if polygons:
+            crops.extend(crops_from_image(image, polygons))
+            owners.extend([index] * len(polygons))
+    results = [[] for _ in items]
+    for owner, result in zip(owners, recognize_crops(crops, languages, reader) if crops else []):
+        results[owner].append(result)
+    return results
+
+
+def transcribe_annotations(image_dir, languages=OCR_LANGUAGES, images_per_batch=32, overwrite=False):
+    """
+    Fills each stored shape's `description` with the text read from its
+    polygon, skipping EasyOCR's detector entirely. Shapes that already have
+    text are kept unless `overwrite`.
+    """
+    annotations = AnnotationStore(image_dir)
+    jobs = []
+    for name, labelme in annotations.documents(annotations.names(min_shapes=1)):
+        pending = [s for s in labelme['shapes'] if s.get('points') and (overwrite or not s.get('description'))]
+        image_path = os.path.join(image_dir, name)
+        if pending and os.path.exists(image_path):
+            jobs.append((name, image_path, labelme, pending))
+    if not jobs:
+        print("All annotated shapes already have text.")
+        return
+
+    start = time.perf_counter()
+    shapes = 0
+    for i in tqdm(range(0, len(jobs), images_per_batch), desc="Recognizing"):
+        batch = jobs[i:i + images_per_batch]
+        results = recognize_regions([(image_path, [s['points'] for s in pending]) for _, image_path, _, pending in batch],
+                                    languages)
+        for (_, _, labelme, pending), texts in zip(batch, results):
+            for shape, (text, _) in zip(pending, texts):
+                shape['description'] = text
+            shapes += len(pending)
+        annotations.put_many([(name, labelme, None, None) for name, _, labelme, _ in batch])
+    elapsed = time.perf_counter() - start
+    print(f"Recognized {shapes} regions in {len(jobs)} images in {elapsed:.1f}s "
+          f"({shapes / elapsed:.1f} regions/sec, including model load)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Read the text inside annotated regions (no text detection pass)")
+    parser.add_argument('--dir', type=str, default='book_covers_mixed', help='Directory of annotated images')
+    parser.add_argument('--langs', type=str, default=",".join(OCR_LANGUAGES), help='EasyOCR recognizer languages')
+    parser.add_argument('--batch-images', type=int, default=32, help='Images whose crops share recognizer calls')
+    parser.add_argument('--overwrite', action='store_true', help='Re-read shapes that already have text')
+    args = parser.parse_args()
+    transcribe_annotations(args.dir, args.langs.split(','), args.batch_images, args.overwrite)
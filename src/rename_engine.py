@@ -0,0 +1,300 @@
+import argparse
+import json
+import os
+import re
+import time
+from collections import defaultdict
+
+# --- Configuration ---
+SPLITS = ("train", "test")
+IMAGE_EXTENSIONS = ('.jpg', '.png')
+JOURNAL_NAME = ".rename_journal"
+TMP_PREFIX = ".renaming."
+MANIFEST_NAME = "manifest.pkl"  # dataset_builder's; imported only when a dataset has one
+
+
+class RenameConflict(Exception):
+    """The plan would overwrite a file or send two files to one name; nothing was renamed."""
+
+
+# --- Naming rules ---
+def sanitize(filename):
+    """Drops URL query residue: 'cover.jpg?from_search=true' -> 'cover.jpg'."""
+    if '?' not in filename:
+        return filename
+    clean_base = filename.split('?')[0]
+    extension = os.path.splitext(filename)[1].split('?')[0]
+    return clean_base if clean_base.endswith(extension) else clean_base + extension
+
+
+def underscore_prefix(filename):
+    """'हिन्दी_long_messy_name.jpg' -> 'हिन्दी'"""
+    return filename.split('_')[0]
+
+
+def language_prefix(filename):
+    """Initial non-numeric part, e.g. 'classicfiction18160995-...' -> 'classicfiction'."""
+    match = re.match(r'([^\d_]+)', filename)
+    return match.group(1).replace('-', '_') if match else None
+
+
+# --- Planning: one scandir per directory, everything else in memory ---
+def scan(directory):
+    """File names in `directory` (empty if it doesn't exist)."""
+    try:
+        with os.scandir(directory) as entries:
+            return [entry.name for entry in entries if entry.is_file(follow_symlinks=False)]
+    except FileNotFoundError:
+        return []
+
+
+def walk(root_dir):
+    """{directory: [file names]} for the whole tree, one scandir per directory."""
+    listing, stack = {}, [root_dir]
+    while stack:
+        directory = stack.pop()
+        names = []
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                else:
+                    names.append(entry.name)
+        listing[directory] = names
+    return listing
+
+
+def plan_sanitize(listing):
+    """Moves that strip URL residue from every file in `listing`."""
+    moves = []
+    for directory, names in listing.items():
+        prefix = os.path.join(directory, '')
+        for name in names:
+            clean = sanitize(name)
+            if clean != name:
+                moves.append((prefix + name, prefix + clean))
+    return moves
+
+
+def plan_standardize(root_dir, prefix_of=underscore_prefix, sanitize_names=False, listing=None):
+    """
+    Moves that rename every image in `root_dir/{train,test}/images` to
+    `<prefix>_<NNN><ext>` (numbered per prefix across both splits, in sorted
+    order) and its label alongside it. With `sanitize_names`, URL residue is
+    stripped from every file in the tree first (folded into the same plan).
+    """
+    listing = listing if listing is not None else {}
+    moves = {}
+    if sanitize_names:
+        for src, dst in plan_sanitize(listing):
+            moves[src] = dst
+
+    counters = defaultdict(int)
+    for split in SPLITS:
+        image_dir = os.path.join(root_dir, split, "images")
+        label_dir = os.path.join(root_dir, split, "labels")
+        # Plain concatenation: os.path.join dominates planning time at 100k+ files
+        image_prefix, label_prefix = os.path.join(image_dir, ''), os.path.join(label_dir, '')
+        images = listing.get(image_dir)
+        images = images if images is not None else scan(image_dir)
+        labels = listing.get(label_dir)
+        labels = set(labels if labels is not None else scan(label_dir))
+
+        # (name after sanitizing, name on disk): two names that sanitize alike are still two images
+        current = sorted((sanitize(name) if sanitize_names else name, name) for name in images)
+        label_names = defaultdict(list)  # name after sanitizing -> names on disk
+        for name in sorted(labels):
+            label_names[sanitize(name) if sanitize_names else name].append(name)
+
+        for filename, name in current:
+            if not filename.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            prefix = prefix_of(filename)
+            if not prefix:
+                continue
+            counters[prefix] += 1
+            base, extension = os.path.splitext(filename)
+            new_base = f"{prefix}_{counters[prefix]:03d}"
+            # Replaces the image's sanitize-only move, if any
+            moves[image_prefix + name] = image_prefix + new_base + extension
+            candidates = label_names.get(base + ".txt")
+            if candidates:
+                moves[label_prefix + candidates.pop(0)] = label_prefix + new_base + ".txt"
+    return [(src, dst) for src, dst in moves.items() if src != dst]
+
+
+def check_plan(moves, listing):
+    """
+    Raises RenameConflict if two files map to one name, or a target is
+    occupied by a file that isn't moving away. Returns the number of rename
+    cycles (a -> b -> a), which two-phase application handles.
+    """
+    occupied = {prefix + name for prefix, names in ((os.path.join(d, ''), names) for d, names in listing.items())
+                for name in names}
+    sources = {src for src, _ in moves}
+    targets = defaultdict(list)
+    for src, dst in moves:
+        targets[dst].append(src)
+    problems = [f"{', '.join(srcs)} -> {dst}" for dst, srcs in targets.items() if len(srcs) > 1]
+    problems += [f"{srcs[0]} -> {dst} (exists)" for dst, srcs in targets.items()
+                 if len(srcs) == 1 and dst in occupied and dst not in sources]
+    if problems:
+        raise RenameConflict(f"{len(problems)} conflicting rename(s), e.g. {problems[0]}")
+
+    # Only chains where a target is itself a source can close into a cycle
+    following = {src: dst for src, dst in moves if dst in sources}
+    cycles, seen = 0, set()
+    for start in following:
+        node = start
+        path = set()
+        while node in following and node not in seen:
+            seen.add(node)
+            path.add(node)
+            node = following[node]
+        if node in path:
+            cycles += 1
+    return cycles
+
+
+# --- Applying: two phases through temp names, journaled for rollback ---
+def _fsync_dirs(directories):
+    for directory in directories:
+        fd = os.open(directory, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+def _mark(journal, phase):
+    journal.write(f"{phase}\n")
+    journal.flush()
+    os.fsync(journal.fileno())
+
+
+def _read_journal(journal_path):
+    """(steps, phase), or None if the run stopped before phase 1 was marked (nothing was renamed)."""
+    # A plan line cut short can end mid-character
+    with open(journal_path, 'r', encoding='utf-8', errors='replace') as f:
+        lines = f.read().splitlines()
+    if len(lines) < 2:
+        return None
+    try:
+        return json.loads(lines[0]), int(lines[-1])
+    except ValueError:  # json.JSONDecodeError included: the plan line was cut short
+        return None
+
+
+def apply_plan(moves, journal_path):
+    """
+    Applies `moves` as src -> temp for every file, then temp -> dst, so no
+    rename ever lands on a name still in use. The plan and phase boundaries
+    are journaled (fsynced) first; on any error the renames are rolled back.
+    """
+    if not moves:
+        return 0
+    token = f"{TMP_PREFIX}{os.getpid()}.{int(time.time())}."
+    steps = []
+    for i, (src, dst) in enumerate(moves):
+        head, sep, _ = src.rpartition(os.sep)
+        steps.append((src, f"{head}{sep}{token}{i}", dst))
+    directories = {src.rpartition(os.sep)[0] or '.' for src, _ in moves} | {dst.rpartition(os.sep)[0] or '.' for _, dst in moves}
+    with open(journal_path, 'w', encoding='utf-8') as journal:
+        journal.write(json.dumps(steps, ensure_ascii=False) + "\n")
+        _mark(journal, 1)
+        try:
+            for src, tmp, _ in steps:
+                os.rename(src, tmp)
+            _fsync_dirs(directories)
+            _mark(journal, 2)
+            for _, tmp, dst in steps:
+                os.rename(tmp, dst)
+            _fsync_dirs(directories)
+        except BaseException:
+            journal.close()
+            rollback(journal_path)
+            raise
+    os.remove(journal_path)
+    return len(steps)
+
+
+def rollback(journal_path):
+    """Restores every file named in an interrupted journal to its original name."""
+    journaled = _read_journal(journal_path)
+    if journaled is None:
+        os.remove(journal_path)
+        print("Removed an incomplete rename journal (the run stopped before renaming anything).")
+        return 0
+    steps, phase = journaled
+    if phase >= 2:
+        # Anything already at its target goes back to its temp name first, so all files sit at temp names
+        for _, tmp, dst in steps:
+            if not os.path.exists(tmp) and os.path.exists(dst):
+                os.rename(dst, tmp)
+    restored = 0
+    for src, tmp, _ in steps:
+        if os.path.exists(tmp):
+            os.rename(tmp, src)
+            restored += 1
+    os.remove(journal_path)
+    print(f"Rolled back an interrupted rename ({restored} of {len(steps)} files restored from temp names).")
+    return restored
+
+
+def rename(root_dir, prefix_of=underscore_prefix, sanitize_names=False, standardize=True, dry_run=False):
+    """
+    Plans, checks and applies a bulk rename of `root_dir`. An interrupted
+    earlier run is rolled back first. Returns the plan as `[(src, dst)]`.
+    """
+    start = time.perf_counter()
+    journal_path = os.path.join(root_dir, JOURNAL_NAME)
+    if os.path.exists(journal_path):
+        rollback(journal_path)
+
+    listing = walk(root_dir) if sanitize_names else {
+        os.path.join(root_dir, split, kind): scan(os.path.join(root_dir, split, kind))
+        for split in SPLITS for kind in ("images", "labels")}
+    if standardize:
+        moves = plan_standardize(root_dir, prefix_of, sanitize_names, listing)
+    else:
+        moves = plan_sanitize(listing)
+    cycles = check_plan(moves, listing)
+    planned = time.perf_counter() - start
+    if dry_run:
+        for src, dst in moves:
+            print(f"{src} -> {dst}")
+        print(f"{len(moves)} renames planned ({cycles} cycles) in {planned:.2f}s; nothing changed (dry run).")
+        return moves
+
+    apply_plan(moves, journal_path)
+    print(f"Renamed {len(moves)} files ({cycles} cycles) in {time.perf_counter() - start:.2f}s "
+          f"(planning {planned:.2f}s).")
+    if moves and os.path.exists(os.path.join(root_dir, MANIFEST_NAME)):
+        # A built dataset: the next incremental build must know the new names
+        from dataset_builder import rename_outputs
+        print(f"Updated {rename_outputs(root_dir, moves)} dataset manifest entries.")
+    return moves
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Crash-safe bulk rename of dataset files")
+    parser.add_argument('--root', type=str, default='dataset', help='Dataset root (with train/ and test/)')
+    parser.add_argument('--mode', choices=['finalize', 'clean', 'sanitize'], default='clean',
+                        help="finalize: '<prefix>_NNN' by first '_' part; clean: strip URL residue, then "
+                             "'<prefix>_NNN' by leading non-digits; sanitize: only strip URL residue")
+    parser.add_argument('--dry-run', action='store_true', help='Print the plan without renaming')
+    parser.add_argument('--rollback', action='store_true', help='Only roll back an interrupted run, if any')
+    args = parser.parse_args()
+
+    if args.rollback:
+        journal_path = os.path.join(args.root, JOURNAL_NAME)
+        if os.path.exists(journal_path):
+            rollback(journal_path)
+        else:
+            print("No interrupted rename to roll back.")
+    elif args.mode == 'finalize':
+        rename(args.root, underscore_prefix, dry_run=args.dry_run)
+    elif args.mode == 'clean':
+        rename(args.root, language_prefix, sanitize_names=True, dry_run=args.dry_run)
+    else:
+        rename(args.root, sanitize_names=True, standardize=False, dry_run=args.dry_run)
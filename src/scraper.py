@@ -1,56 +1,96 @@
-import requests
-from bs4 import BeautifulSoup
 import os
-import time
 from tqdm import tqdm
 import urllib.parse
+import argparse
+from concurrent.futures import as_completed
+
+from fetcher import Fetcher, DEFAULT_RATE_PER_HOST, DEFAULT_WORKERS
+from http_cache import HTTPCache, CACHE_DIR
+from image_store import ImageStore
+from extractors import extractor_for
+import metrics
+
+GOODREADS_BASE_URL = "https://www.goodreads.com"
+
+def scrape_goodreads_search(query, num_images=30, output_dir="book_covers_mixed", fetcher=None, base_url=GOODREADS_BASE_URL, store=None):
+    """
+    Scrapes book cover images from a Goodreads.com search query.
+    Book pages and cover downloads run concurrently on the fetcher's pool;
+    politeness is enforced by its per-host rate limiter instead of sleeps.
+    Every cover is registered in the content-addressed image store.
+    """
+    own_fetcher = fetcher is None
+    if own_fetcher:
+        fetcher = Fetcher(cache=HTTPCache())
+    store = store or ImageStore()
+    # Only the title links and the cover <img> are parsed out; selectors live in site_selectors.json
+    extractor = extractor_for("goodreads")
 
-def scrape_goodreads_search(query, num_images=30):
-    """Scrapes book cover images from a Goodreads.com search query."""
     encoded_query = urllib.parse.quote_plus(query)
-    base_url = f"https://www.goodreads.com/search?q={encoded_query}"
-    headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:99.0) Gecko/20100101 Firefox/99.0'}
+    search_url = f"{base_url}/search?q={encoded_query}"
 
     print(f"Fetching book list for query: '{query}'")
     try:
-        search_response = requests.get(base_url, headers=headers)
+        search_response = fetcher.get(search_url)
         search_response.raise_for_status()
-        search_soup = BeautifulSoup(search_response.content, 'html.parser')
-        
-        book_links = []
-        for a_tag in search_soup.find_all('a', class_='bookTitle', href=True):
-            if len(book_links) < num_images:
-                book_links.append("https://www.goodreads.com" + a_tag['href'])
-        
+        hrefs = extractor.extract(search_response.content, "book_links", limit=num_images)
+        book_links = [urllib.parse.urljoin(base_url, href) for href in hrefs]
+
         print(f"Found {len(book_links)} book links to process.")
     except Exception as e:
         print(f"Error fetching search page for '{query}': {e}")
+        if own_fetcher: fetcher.close()
         return
 
-    for book_url in tqdm(book_links, desc=f"Downloading '{query}'"):
+    def download_cover(book_url):
+        """Book page -> cover URL -> image file. Returns the saved path or None."""
+        book_response = fetcher.get(book_url)
+        book_response.raise_for_status()
+        src = extractor.first(book_response.content, "cover")
+        if not src:
+            return None
+
+        image_url = urllib.parse.urljoin(book_url, src)
+        img_data = fetcher.get(image_url).content
+        file_name = f"{query.replace(' ', '')}{book_url.split('/')[-1].split('.')[0]}.jpg"
+        file_path = os.path.join(output_dir, file_name)
+        store.add_bytes(img_data, file_path)
+        return file_path
+
+    futures = {fetcher.submit(download_cover, url): url for url in book_links}
+    saved = []
+    for future in tqdm(as_completed(futures), total=len(futures), desc=f"Downloading '{query}'"):
         try:
-            book_response = requests.get(book_url, headers=headers)
-            book_response.raise_for_status()
-            book_soup = BeautifulSoup(book_response.content, 'html.parser')
-            image_tag = book_soup.find('img', class_='ResponsiveImage')
-            
-            if image_tag and image_tag.get('src'):
-                image_url = image_tag.get('src')
-                img_data = requests.get(image_url, headers=headers).content
-                file_name = f"{query.replace(' ', '')}{book_url.split('/')[-1].split('.')[0]}.jpg"
-                file_path = os.path.join(output_dir, file_name)
-                with open(file_path, 'wb') as handler:
-                    handler.write(img_data)
-                time.sleep(1)
+            path = future.result()
+            if path: saved.append(path)
         except Exception as e:
-            print(f"Could not process {book_url}. Error: {e}")
+            print(f"Could not process {futures[future]}. Error: {e}")
+
+    if own_fetcher: fetcher.close()
+    return saved
 
 if __name__ == '__main__':
-    output_dir = "book_covers_mixed"
+    parser = argparse.ArgumentParser(description="Scrape book covers from Goodreads search results")
+    parser.add_argument('--output', type=str, default="book_covers_mixed", help='Directory to save covers into')
+    parser.add_argument('--num', type=int, default=30, help='Number of books per query')
+    parser.add_argument('--rate', type=float, default=DEFAULT_RATE_PER_HOST, help='Max requests per second per host')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='Concurrent fetch workers')
+    parser.add_argument('--cache-dir', type=str, default=CACHE_DIR, help='On-disk HTTP cache location')
+    parser.add_argument('--no-cache', action='store_true', help='Always hit the network')
+    parser.add_argument('--base-url', type=str, default=GOODREADS_BASE_URL, help='Goodreads root (point at a local fixture server for offline runs)')
+    metrics.add_arguments(parser)
+    args = parser.parse_args()
+    metrics.configure_from_args(args, "scraper")
+
+    output_dir = args.output
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
 
     queries = ["हिन्दी", "ಕನ್ನಡ", "বাংলা", "தமிழ்", "मराठी", "classic fiction"]
-    for q in queries:
-        scrape_goodreads_search(q, num_images=30)
+    cache = None if args.no_cache else HTTPCache(args.cache_dir)
+    store = ImageStore()
+    with Fetcher(rate_per_host=args.rate, max_workers=args.workers, cache=cache) as fetcher:
+        for q in queries:
+            with metrics.stage("scrape", query=q):
+                scrape_goodreads_search(q, num_images=args.num, output_dir=output_dir, fetcher=fetcher, base_url=args.base_url, store=store)
     print(f"\n Scraping complete! Images are in '{output_dir}'.")
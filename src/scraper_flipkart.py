@@ -1,16 +1,23 @@
 import requests
-from bs4 import BeautifulSoup
 import os
-import time
 from tqdm import tqdm
 import argparse
+import urllib.parse
 
-def scrape_flipkart(query, num_images=25):
+from fetcher import Fetcher
+from http_cache import HTTPCache, CACHE_DIR
+from image_store import ImageStore
+from extractors import extractor_for
+import metrics
+
+FLIPKART_BASE_URL = "https://www.flipkart.com"
+
+def scrape_flipkart(query, num_images=25, fetcher=None, store=None, site_url=FLIPKART_BASE_URL):
     """Scrapes book cover images from a Flipkart.com search query."""
     
     # --- Configuration ---
     # Flipkart uses q= for search query
-    base_url = f"https://www.flipkart.com/search?q={query}"
+    base_url = f"{site_url}/search?q={query}"
     output_dir = "data_flipkart"
     
     # Using the same robust headers
@@ -25,55 +32,70 @@ def scrape_flipkart(query, num_images=25):
         os.makedirs(output_dir)
         print(f"Created directory: {output_dir}")
 
+    # One request per second per host, as before, but through the shared cache
+    own_fetcher = fetcher is None
+    if own_fetcher:
+        fetcher = Fetcher(headers=headers, rate_per_host=1.0, burst=1, cache=HTTPCache())
+    # Covers are registered in the shared content-addressed store so duplicates are annotated once
+    store = store or ImageStore()
+
     # --- Step 1: Fetch Search Page ---
     print(f"Fetching search results for query: '{query}' from Flipkart")
     try:
-        response = requests.get(base_url, headers=headers)
+        response = fetcher.get(base_url, headers=headers)
         response.raise_for_status()
-        soup = BeautifulSoup(response.content, 'html.parser')
-        
-        # Flipkart uses a specific class for product images
-        # NOTE: This class name ('_396cs4') might change. If it fails, we'd need to inspect the page again.
-        image_tags = soup.find_all('img', class_='_396cs4', src=True)
-        
-        if not image_tags:
-            print("Could not find any image tags with class '_396cs4'. The page structure might have changed.")
+        # Flipkart uses a specific class for product images. It changes from time to time;
+        # when it does, update site_selectors.json rather than this file.
+        extractor = extractor_for("flipkart")
+        image_srcs = extractor.extract(response.content, "covers")
+
+        if not image_srcs:
+            print(f"Could not find any {extractor.describe('covers')} tags. The page structure might have changed "
+                  f"(selectors are in site_selectors.json).")
+            if own_fetcher: fetcher.close()
             return
 
-        print(f"Found {len(image_tags)} potential images. Downloading the first {num_images}...")
+        print(f"Found {len(image_srcs)} potential images. Downloading the first {num_images}...")
 
     except requests.exceptions.RequestException as e:
         print(f"Error fetching search page: {e}")
+        if own_fetcher: fetcher.close()
         return
 
     # --- Step 2: Download the images ---
     download_count = 0
-    for img_tag in tqdm(image_tags, desc=f"Downloading '{query}' covers"):
+    for src in tqdm(image_srcs, desc=f"Downloading '{query}' covers"):
         if download_count >= num_images:
             break
         
         try:
-            image_url = img_tag['src']
-            img_data = requests.get(image_url, headers=headers).content
+            image_url = urllib.parse.urljoin(base_url, src)
+            img_data = fetcher.get(image_url, headers=headers).content
             
             file_name = f"{query.replace('+', '')}{download_count+1}.jpg"
             file_path = os.path.join(output_dir, file_name)
             
-            with open(file_path, 'wb') as handler:
-                handler.write(img_data)
+            store.add_bytes(img_data, file_path)
             
             download_count += 1
-            time.sleep(1) # Be polite
 
         except Exception as e:
             print(f"An unexpected error occurred for image {image_url}: {e}")
 
+    if own_fetcher: fetcher.close()
     print(f"\nScraping complete. Downloaded {download_count} images to '{output_dir}'.")
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description="Scrape book covers from Flipkart.com")
     parser.add_argument('--query', type=str, required=True, help='Search query (e.g., "kannada+books")')
     parser.add_argument('--num', type=int, default=25, help='Number of images to download')
+    parser.add_argument('--cache-dir', type=str, default=CACHE_DIR, help='On-disk HTTP cache location')
+    parser.add_argument('--no-cache', action='store_true', help='Always hit the network')
+    metrics.add_arguments(parser)
     args = parser.parse_args()
-    
-    scrape_flipkart(args.query, args.num)
+    metrics.configure_from_args(args, "scraper_flipkart")
+
+    cache = None if args.no_cache else HTTPCache(args.cache_dir)
+    with Fetcher(rate_per_host=1.0, burst=1, cache=cache) as fetcher:
+        with metrics.stage("scrape", query=args.query):
+            scrape_flipkart(args.query, args.num, fetcher)
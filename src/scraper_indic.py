@@ -1,15 +1,22 @@
 import requests
-from bs4 import BeautifulSoup
 import os
-import time
 from tqdm import tqdm
 import argparse
+import urllib.parse
 
-def scrape_amazon_indic(query, num_images=25):
+from fetcher import Fetcher
+from http_cache import HTTPCache, CACHE_DIR
+from image_store import ImageStore
+from extractors import extractor_for
+import metrics
+
+AMAZON_BASE_URL = "https://www.amazon.in"
+
+def scrape_amazon_indic(query, num_images=25, fetcher=None, store=None, site_url=AMAZON_BASE_URL):
     """Scrapes book cover images from an Amazon.in search query."""
     
     # --- Configuration ---
-    base_url = f"https://www.amazon.in/s?k={query}"
+    base_url = f"{site_url}/s?k={query}"
     output_dir = "data_indic"
     
     # --- MORE REALISTIC HEADERS ---
@@ -32,51 +39,56 @@ def scrape_amazon_indic(query, num_images=25):
         os.makedirs(output_dir)
         print(f"Created directory: {output_dir}")
 
+    # One request per second per host, as before, but through the shared cache
+    own_fetcher = fetcher is None
+    if own_fetcher:
+        fetcher = Fetcher(headers=headers, rate_per_host=1.0, burst=1, cache=HTTPCache())
+    # Covers are registered in the shared content-addressed store so duplicates are annotated once
+    store = store or ImageStore()
+
     # --- Step 1: Fetch Search Page and find images ---
     print(f"Fetching search results for query: '{query}'")
     try:
-        response = requests.get(base_url, headers=headers)
+        response = fetcher.get(base_url, headers=headers)
         response.raise_for_status()
-        soup = BeautifulSoup(response.content, 'html.parser')
-        
-        image_tags = soup.find_all('img', class_='s-image', src=True)
-        
-        if not image_tags:
-            print("Could not find any image tags with class 's-image'. The page structure might have changed.")
+        # Placeholder images ('images/I/01...') are skipped by the selector itself
+        extractor = extractor_for("amazon")
+        image_srcs = extractor.extract(response.content, "covers")
+
+        if not image_srcs:
+            print(f"Could not find any {extractor.describe('covers')} tags. The page structure might have changed "
+                  f"(selectors are in site_selectors.json).")
+            if own_fetcher: fetcher.close()
             return
 
-        print(f"Found {len(image_tags)} potential images. Downloading the first {num_images}...")
+        print(f"Found {len(image_srcs)} potential images. Downloading the first {num_images}...")
 
     except requests.exceptions.RequestException as e:
         print(f"Error fetching search page: {e}")
+        if own_fetcher: fetcher.close()
         return
 
     # --- Step 2: Download the images ---
     download_count = 0
-    for img_tag in tqdm(image_tags, desc=f"Downloading '{query}' covers"):
+    for src in tqdm(image_srcs, desc=f"Downloading '{query}' covers"):
         if download_count >= num_images:
             break
         
         try:
-            image_url = img_tag['src']
-            
-            if 'images/I/01' in image_url or 'images/G/01' in image_url:
-                continue
-
-            img_data = requests.get(image_url, headers=headers).content
+            image_url = urllib.parse.urljoin(base_url, src)
+            img_data = fetcher.get(image_url, headers=headers).content
             
             file_name = f"{query.replace('+', '')}{download_count+1}.jpg"
             file_path = os.path.join(output_dir, file_name)
             
-            with open(file_path, 'wb') as handler:
-                handler.write(img_data)
+            store.add_bytes(img_data, file_path)
             
             download_count += 1
-            time.sleep(1) # Be polite
 
         except Exception as e:
             print(f"An unexpected error occurred for image {image_url}: {e}")
 
+    if own_fetcher: fetcher.close()
     print(f"\nScraping complete. Downloaded {download_count} images to '{output_dir}'.")
 
 
@@ -84,6 +96,13 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser(description="Scrape book covers from Amazon.in")
     parser.add_argument('--query', type=str, required=True, help='Search query (e.g., "kannada+books")')
     parser.add_argument('--num', type=int, default=25, help='Number of images to download')
+    parser.add_argument('--cache-dir', type=str, default=CACHE_DIR, help='On-disk HTTP cache location')
+    parser.add_argument('--no-cache', action='store_true', help='Always hit the network')
+    metrics.add_arguments(parser)
     args = parser.parse_args()
-    
-    scrape_amazon_indic(args.query, args.num)
+    metrics.configure_from_args(args, "scraper_indic")
+
+    cache = None if args.no_cache else HTTPCache(args.cache_dir)
+    with Fetcher(rate_per_host=1.0, burst=1, cache=cache) as fetcher:
+        with metrics.stage("scrape", query=args.query):
+            scrape_amazon_indic(args.query, args.num, fetcher)
@@ -0,0 +1,208 @@
+import argparse
+import hashlib
+import io
+import json
+import mmap
+import os
+import tarfile
+import time
+
+import numpy as np
+from PIL import Image
+
+import metrics
+
+# --- Configuration ---
+SHARD_SIZE = 64 * 1024 * 1024   # bytes per shard before a new one is started (~1300 covers)
+META_NAME = "shards.json"       # written last: its presence marks a complete pack
+INDEX_NAME = "index.npy"        # int64 (N, 5): shard, image offset, image size, label offset, label size
+SHARD_PATTERN = "shard-{:05d}.tar"
+SPLITS = ("train", "test")
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+YAML_CONTENT = """
+path: ../{dataset_dir}  # packed dataset root dir
+train: train
+val: test
+test: test
+
+# Classes
+names:
+  0: text
+"""
+
+
+def is_packed(path):
+    return os.path.exists(os.path.join(path, META_NAME))
+
+
+def _source_key(image_dir, label_dir, names):
+    digest = hashlib.sha256()
+    for name in names:
+        st = os.stat(os.path.join(image_dir, name))
+        digest.update(f"|{name}:{st.st_mtime_ns}:{st.st_size}".encode())
+        try:
+            st = os.stat(os.path.join(label_dir, os.path.splitext(name)[0] + '.txt'))
+            digest.update(f":{st.st_mtime_ns}:{st.st_size}".encode())
+        except FileNotFoundError:
+            pass
+    return digest.hexdigest()[:16]
+
+
+def _add(tar, name, data):
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    info.mode = 0o644
+    tar.addfile(info, io.BytesIO(data))
+    # addfile() works on a copy of `info`; the data ends the archive, padded to a whole block
+    return tar.offset - -(-len(data) // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+
+
+def pack_split(image_dir, label_dir, out_dir, shard_size=SHARD_SIZE):
+    """
+    Packs one split's images and YOLO labels into tar shards under `out_dir`.
+    Each sample is stored WebDataset-style as `<stem><ext>` followed by
+    `<stem>.txt`, so shards stay readable with plain `tar`. The byte offsets of
+    every member go to a compact int64 index, which is all a reader needs for
+    random access. The pack is keyed by the split's names, mtimes and sizes,
+    and left alone when nothing changed. Returns `out_dir`.
+    """
+    names = sorted(f for f in os.listdir(image_dir) if f.lower().endswith(IMAGE_EXTENSIONS))
+    key = _source_key(image_dir, label_dir, names)
+    meta_path = os.path.join(out_dir, META_NAME)
+    if os.path.exists(meta_path):
+        with open(meta_path, 'r') as f:
+            if json.load(f).get("key") == key:
+                return out_dir
+        os.remove(meta_path)
+
+    os.makedirs(out_dir, exist_ok=True)
+    for stale in os.listdir(out_dir):
+        if stale.startswith("shard-") and stale.endswith(".tar"):
+            os.remove(os.path.join(out_dir, stale))
+
+    start = time.perf_counter()
+    index = np.zeros((len(names), 5), dtype=np.int64)
+    shards = []
+    tar = None
+    for i, name in enumerate(names):
+        if tar is None or tar.offset >= shard_size:
+            if tar is not None:
+                tar.close()
+            shards.append(SHARD_PATTERN.format(len(shards)))
+            tar = tarfile.open(os.path.join(out_dir, shards[-1]), 'w')
+        with open(os.path.join(image_dir, name), 'rb') as f:
+            image = f.read()
+        try:
+            with open(os.path.join(label_dir, os.path.splitext(name)[0] + '.txt'), 'rb') as f:
+                label = f.read()
+        except FileNotFoundError:
+            label = b""
+        image_offset = _add(tar, name, image)
+        label_offset = _add(tar, os.path.splitext(name)[0] + '.txt', label)
+        index[i] = (len(shards) - 1, image_offset, len(image), label_offset, len(label))
+    if tar is not None:
+        tar.close()
+
+    np.save(os.path.join(out_dir, INDEX_NAME), index)
+    tmp_path = meta_path + ".tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump({"key": key, "names": names, "shards": shards, "count": len(names)}, f)
+    os.replace(tmp_path, meta_path)
+    mb = sum(os.path.getsize(os.path.join(out_dir, s)) for s in shards) / 1e6
+    print(f"Packed {len(names)} samples from '{image_dir}' into {len(shards)} shard(s) ({mb:.0f} MB) "
+          f"in {time.perf_counter() - start:.1f}s")
+    return out_dir
+
+
+def pack_dataset(dataset_dir, out_dir, shard_size=SHARD_SIZE):
+    """Packs every split of a YOLO dataset (dataset_builder layout) and writes a dataset.yaml pointing at the packs."""
+    for split in SPLITS:
+        image_dir = os.path.join(dataset_dir, split, 'images')
+        if os.path.isdir(image_dir):
+            with metrics.stage("pack", split=split):
+                pack_split(image_dir, os.path.join(dataset_dir, split, 'labels'), os.path.join(out_dir, split), shard_size)
+    with open(os.path.join(out_dir, 'dataset.yaml'), 'w') as f:
+        f.write(YAML_CONTENT.format(dataset_dir=os.path.basename(os.path.normpath(out_dir))))
+    return out_dir
+
+
+class ShardReader:
+    """
+    Read-only view of a pack from `pack_split`: `reader[i] -> (name, image
+    bytes, label text)`. Shards are memory-mapped on first use, so a random
+    access is one index row plus two slices, with no open() or stat() per sample.
+    Iterating streams the samples in shard order, telling the kernel to read
+    ahead. Readers pickle as just their path, so DataLoader workers map the
+    files themselves.
+    """
+
+    def __init__(self, pack_dir):
+        self.pack_dir = pack_dir
+        with open(os.path.join(pack_dir, META_NAME), 'r') as f:
+            meta = json.load(f)
+        self.key = meta["key"]
+        self.names = meta["names"]
+        self.shards = meta["shards"]
+        self.index = np.load(os.path.join(pack_dir, INDEX_NAME), mmap_mode='r')
+        self.maps = [None] * len(self.shards)
+
+    def __reduce__(self):
+        return ShardReader, (self.pack_dir,)
+
+    def __len__(self):
+        return len(self.names)
+
+    def _map(self, shard):
+        if self.maps[shard] is None:
+            with open(os.path.join(self.pack_dir, self.shards[shard]), 'rb') as f:
+                self.maps[shard] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self.maps[shard]
+
+    def __getitem__(self, index):
+        shard, image_offset, image_size, label_offset, label_size = self.index[index].tolist()
+        data = self._map(shard)
+        return (self.names[index], data[image_offset:image_offset + image_size],
+                data[label_offset:label_offset + label_size].decode('utf-8'))
+
+    def __iter__(self):
+        for shard in range(len(self.shards)):
+            data = self._map(shard)
+            if hasattr(mmap, "MADV_SEQUENTIAL"):
+                data.madvise(mmap.MADV_SEQUENTIAL)
+        for index in range(len(self)):
+            yield self[index]
+
+    def image(self, index):
+        """Sample `index` as a PIL image (decoded lazily by PIL, like Image.open on a file)."""
+        return Image.open(io.BytesIO(self[index][1]))
+
+    def label(self, index):
+        return self[index][2]
+
+    def close(self):
+        for data in self.maps:
+            if data is not None:
+                data.close()
+        self.maps = [None] * len(self.shards)
+
+
+_readers = {}
+
+
+def open_image(pack_dir, index):
+    """Sample `index` of a pack as a PIL image, through one reader per pack and process."""
+    if pack_dir not in _readers:
+        _readers[pack_dir] = ShardReader(pack_dir)
+    return _readers[pack_dir].image(index)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Pack a YOLO dataset into tar shards with a random-access index")
+    parser.add_argument('--src', type=str, default='dataset', help='Dataset directory written by dataset_builder.py')
+    parser.add_argument('--dst', type=str, default='dataset_packed', help='Packed dataset output directory')
+    parser.add_argument('--shard-mb', type=int, default=SHARD_SIZE // (1024 * 1024), help='Target shard size in MB')
+    metrics.add_arguments(parser)
+    args = parser.parse_args()
+    metrics.configure_from_args(args, "shards")
+    pack_dataset(args.src, args.dst, args.shard_mb * 1024 * 1024)
+    print(f"\n✅ Train with: python src/train.py --data {os.path.join(args.dst, 'dataset.yaml')}")
@@ -0,0 +1,216 @@
+import json
+import queue
+import sqlite3
+import threading
+import time
+
+import metrics
+
+# --- Configuration ---
+QUEUE_SLOTS_PER_WORKER = 4  # bounded hand-off between stages: a slow stage back-pressures its producers
+_DONE = object()
+
+
+class Journal:
+    """
+    Durable progress log for a StageGraph, in SQLite (WAL). Every item is a
+    row per stage it reaches: `pending` when handed to that stage, then `done`
+    or `failed`. A stage's outputs are recorded as `pending` for the next stage
+    in the same transaction that marks the input `done`, so a killed run
+    resumes from exactly the pending rows. Payloads are JSON; keys starting
+    with `_` are in-memory extras (e.g. downloaded bytes) and aren't persisted.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("""CREATE TABLE IF NOT EXISTS items (
+            stage TEXT NOT NULL, key TEXT NOT NULL, status TEXT NOT NULL,
+            payload TEXT NOT NULL, error TEXT, updated REAL NOT NULL,
+            PRIMARY KEY (stage, key))""")
+        self.db.execute("CREATE INDEX IF NOT EXISTS items_status ON items (stage, status)")
+        self.db.commit()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _dump(payload):
+        return json.dumps({k: v for k, v in payload.items() if not k.startswith('_')})
+
+    def seed(self, stage, items):
+        """Adds `(key, payload)` items as pending input of `stage` unless already known."""
+        with self.lock:
+            self.db.executemany("INSERT OR IGNORE INTO items VALUES (?, ?, 'pending', ?, NULL, ?)",
+                                [(stage, key, self._dump(payload), time.time()) for key, payload in items])
+            self.db.commit()
+
+    def pending(self, stage):
+        with self.lock:
+            rows = self.db.execute("SELECT key, payload FROM items WHERE stage = ? AND status = 'pending' ORDER BY rowid",
+                                   (stage,)).fetchall()
+        return [(key, json.loads(payload)) for key, payload in rows]
+
+    def payloads(self, stage, status='done'):
+        with self.lock:
+            rows = self.db.execute("SELECT payload FROM items WHERE stage = ? AND status = ?", (stage, status)).fetchall()
+        return [json.loads(payload) for payload, in rows]
+
+    def complete(self, stage, key, next_stage=None, outputs=(), error=None):
+        """
+        Marks `key` done (or failed, with `error`) at `stage` and records its
+        outputs as pending for `next_stage`. Returns the outputs that were new.
+        """
+        now = time.time()
+        added = []
+        with self.lock:
+            if next_stage is not None:
+                for out_key, payload in outputs:
+                    cursor = self.db.execute("INSERT OR IGNORE INTO items VALUES (?, ?, 'pending', ?, NULL, ?)",
+                                             (next_stage, out_key, self._dump(payload), now))
+                    if cursor.rowcount:
+                        added.append((out_key, payload))
+            self.db.execute("UPDATE items SET status = ?, error = ?, updated = ? WHERE stage = ? AND key = ?",
+                            ('failed' if error else 'done', error, now, stage, key))
+            self.db.commit()
+        return added
+
+    def retry_failed(self, stages=None):
+        """Puts failed items (of `stages`, default all) back to pending. Returns how many."""
+        with self.lock:
+            if stages:
+                marks = ",".join("?" * len(stages))
+                cursor = self.db.execute(f"UPDATE items SET status = 'pending', error = NULL WHERE status = 'failed' AND stage IN ({marks})",
+                                         list(stages))
+            else:
+                cursor = self.db.execute("UPDATE items SET status = 'pending', error = NULL WHERE status = 'failed'")
+            self.db.commit()
+        return cursor.rowcount
+
+    def counts(self):
+        """{stage: {status: n}}"""
+        with self.lock:
+            rows = self.db.execute("SELECT stage, status, COUNT(*) FROM items GROUP BY stage, status").fetchall()
+        counts = {}
+        for stage, status, n in rows:
+            counts.setdefault(stage, {})[status] = n
+        return counts
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+class Stage:
+    """
+    One step of a StageGraph. `fn(payload)` runs on `workers` threads and
+    returns an iterable of `(key, payload)` outputs for the next stage (empty
+    to drop the item); raising marks the item failed.
+    """
+
+    def __init__(self, name, fn, workers=1, queue_size=None):
+        self.name = name
+        self.fn = fn
+        self.workers = workers
+        self.queue_size = queue_size or workers * QUEUE_SLOTS_PER_WORKER
+        self.stats = {"done": 0, "failed": 0, "emitted": 0, "busy": 0.0}
+
+
+class StageGraph:
+    """
+    Linear pipeline of Stages joined by bounded queues, so every stage works
+    concurrently on different items and total wall-clock time approaches that
+    of the slowest stage. All progress goes through a Journal; `run(only=...)`
+    executes a subset of stages against whatever is pending for them.
+    """
+
+    def __init__(self, stages, journal):
+        self.stages = list(stages)
+        self.journal = journal
+        self.lock = threading.Lock()
+        self.wall = 0.0
+
+    def _next(self, index):
+        return self.stages[index + 1].name if index + 1 < len(self.stages) else None
+
+    def run(self, only=None, progress=None):
+        """Runs the selected stages (default all) until their inputs are exhausted."""
+        active = [i for i, s in enumerate(self.stages) if only is None or s.name in only]
+        queues = {i: queue.Queue(maxsize=self.stages[i].queue_size) for i in active}
+        # Each queue closes once its producers finish: the backlog feeder, plus the upstream stage's workers if it runs
+        producers = {i: 1 + (self.stages[i - 1].workers if i - 1 in queues else 0) for i in active}
+        # Snapshot the backlog before any worker starts, so items handed over live aren't fed twice
+        backlog = {i: self.journal.pending(self.stages[i].name) for i in active}
+
+        def producer_done(i):
+            with self.lock:
+                producers[i] -= 1
+                last = producers[i] == 0
+            if last:
+                for _ in range(self.stages[i].workers):
+                    queues[i].put(_DONE)
+
+        def feed(i):
+            for item in backlog[i]:
+                queues[i].put(item)
+            producer_done(i)
+
+        def work(i, n):
+            with metrics.profiled(self.stages[i].name, tag=n):
+                process(i)
+            if i + 1 in queues:
+                producer_done(i + 1)
+
+        def process(i):
+            stage = self.stages[i]
+            next_stage = self._next(i)
+            downstream = queues.get(i + 1)
+            while True:
+                metrics.gauge("stage_queue_depth", queues[i].qsize(), stage=stage.name)
+                item = queues[i].get()
+                if item is _DONE:
+                    metrics.gauge("stage_queue_depth", queues[i].qsize(), stage=stage.name)
+                    break
+                key, payload = item
+                start = time.perf_counter()
+                try:
+                    outputs = list(stage.fn(payload) or ())
+                    error = None
+                except Exception as e:
+                    outputs, error = [], f"{type(e).__name__}: {e}"
+                elapsed = time.perf_counter() - start
+                added = self.journal.complete(stage.name, key, next_stage, outputs, error)
+                metrics.observe("stage_item_seconds", elapsed, stage=stage.name)
+                metrics.inc("stage_items_total", stage=stage.name, status="failed" if error else "done")
+                with self.lock:
+                    stage.stats["busy"] += time.perf_counter() - start
+                    stage.stats["failed" if error else "done"] += 1
+                    stage.stats["emitted"] += len(added)
+                if progress: progress(stage.name, key, error)
+                if downstream is not None:
+                    for out in added:
+                        downstream.put(out)
+
+        start = time.perf_counter()
+        threads = [threading.Thread(target=feed, args=(i,), daemon=True) for i in active]
+        threads += [threading.Thread(target=work, args=(i, n), daemon=True, name=f"{self.stages[i].name}-{n}")
+                    for i in active for n in range(self.stages[i].workers)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.wall += time.perf_counter() - start
+
+    def report(self):
+        print(f"Stage graph: {self.wall:.1f}s wall clock")
+        for stage in self.stages:
+            s = stage.stats
+            if not (s["done"] or s["failed"]):
+                continue
+            # Busy time spread over the stage's workers ~ the wall clock the stage alone would need
+            print(f"  {stage.name:<10} {s['done']:>5} done, {s['failed']:>3} failed, {s['emitted']:>5} emitted; "
+                  f"{s['busy'] / stage.workers:.1f}s at {stage.workers} worker(s)")
+        counts = self.journal.counts()
+        pending = {stage: c["pending"] for stage, c in counts.items() if c.get("pending")}
+        if pending:
+            print(f"  Still pending: {pending}")
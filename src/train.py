@@ -0,0 +1,195 @@
+import argparse
+import os
+import time
+
+import numpy as np
+import torch
+from torch import nn
+from torch.utils.data import DataLoader, Dataset
+
+from image_cache import IMG_SIZE, CACHE_DIR, build_cache, ImageCache
+
+# --- Configuration ---
+DATASET_YAML = "dataset/dataset.yaml"
+EPOCHS = 30
+BATCH_SIZE = 16
+LEARNING_RATE = 1e-3
+NUM_WORKERS = 2
+STRIDE = 8             # one prediction cell per 8x8 pixels
+CHECKPOINT_PATH = "runs/text_detector.pt"
+
+
+def read_dataset_yaml(yaml_path):
+    """The `train:`/`val:` image directories of a dataset.yaml, resolved against its folder."""
+    root = os.path.dirname(os.path.abspath(yaml_path))
+    paths = {}
+    with open(yaml_path, 'r') as f:
+        for line in f:
+            key, _, value = line.split('#')[0].partition(':')
+            if key.strip() in ('train', 'val') and value.strip():
+                paths[key.strip()] = os.path.join(root, value.strip())
+    return paths
+
+
+def label_dir_for(image_dir):
+    """dataset/train/images -> dataset/train/labels (the YOLO layout)."""
+    return os.path.join(os.path.dirname(image_dir.rstrip('/')), 'labels')
+
+
+# --- Data: decoded once into a memmap cache; workers only slice it ---
+class CachedDetectionDataset(Dataset):
+    """Serves `(uint8 CHW image, (K, 4) boxes)` from an ImageCache without decoding any JPEG."""
+
+    def __init__(self, cache_prefix):
+        self.cache_prefix = cache_prefix
+        self.cache = None
+        self.length = len(ImageCache(cache_prefix))
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, index):
+        if self.cache is None:
+            # Opened lazily so each DataLoader worker maps the file itself instead of unpickling arrays
+            self.cache = ImageCache(self.cache_prefix)
+        image, boxes = self.cache[index]
+        return torch.from_numpy(np.ascontiguousarray(image)).permute(2, 0, 1), torch.from_numpy(boxes.copy())
+
+
+def collate(batch):
+    images, boxes = zip(*batch)
+    return torch.stack(images), list(boxes)
+
+
+# --- Model: a small anchor-free single-class detector (objectness + box distances per cell) ---
+def conv(c_in, c_out, stride=1):
+    return nn.Sequential(nn.Conv2d(c_in, c_out, 3, stride, 1, bias=False), nn.BatchNorm2d(c_out), nn.ReLU(inplace=True))
+
+
+class TextDetector(nn.Module):
+    """
+    Stride-8 fully convolutional detector. Each cell predicts a text/no-text
+    logit and its distances to the box's left, top, right and bottom edges
+    (as fractions of the image size).
+    """
+
+    def __init__(self, width=32):
+        super().__init__()
+        self.backbone = nn.Sequential(
+            conv(3, width, 2), conv(width, width),
+            conv(width, width * 2, 2), conv(width * 2, width * 2),
+            conv(width * 2, width * 4, 2), conv(width * 4, width * 4), conv(width * 4, width * 4),
+        )
+        self.head = nn.Conv2d(width * 4, 5, 1)
+
+    def forward(self, x):
+        out = self.head(self.backbone(x))
+        return out[:, :1], torch.relu(out[:, 1:])
+
+
+def build_targets(boxes, grid_size):
+    """Per-cell targets: cells whose centre falls inside a box are positive; the smallest such box wins."""
+    obj = torch.zeros(len(boxes), 1, grid_size, grid_size)
+    ltrb = torch.zeros(len(boxes), 4, grid_size, grid_size)
+    centres = (torch.arange(grid_size, dtype=torch.float32) + 0.5) / grid_size
+    cy, cx = torch.meshgrid(centres, centres, indexing='ij')
+    for i, b in enumerate(boxes):
+        for xc, yc, w, h in sorted(b.tolist(), key=lambda r: -r[2] * r[3]):  # large first, small overwrite
+            x0, y0, x1, y1 = xc - w / 2, yc - h / 2, xc + w / 2, yc + h / 2
+            inside = (cx >= x0) & (cx <= x1) & (cy >= y0) & (cy <= y1)
+            obj[i, 0][inside] = 1.0
+            ltrb[i, 0][inside] = (cx - x0)[inside]
+            ltrb[i, 1][inside] = (cy - y0)[inside]
+            ltrb[i, 2][inside] = (x1 - cx)[inside]
+            ltrb[i, 3][inside] = (y1 - cy)[inside]
+    return obj, ltrb
+
+
+def detection_loss(pred_obj, pred_ltrb, boxes):
+    obj, ltrb = build_targets(boxes, pred_obj.shape[-1])
+    obj_loss = nn.functional.binary_cross_entropy_with_logits(pred_obj, obj)
+    positive = obj.expand_as(ltrb) > 0
+    box_loss = nn.functional.l1_loss(pred_ltrb[positive], ltrb[positive]) if positive.any() else pred_ltrb.sum() * 0
+    return obj_loss + 5.0 * box_loss
+
+
+def train(data=DATASET_YAML, epochs=EPOCHS, batch_size=BATCH_SIZE, workers=NUM_WORKERS, imgsz=IMG_SIZE,
+          lr=LEARNING_RATE, threads=None, cache_dir=CACHE_DIR, checkpoint=CHECKPOINT_PATH):
+    """
+    Trains the single-class text detector on the dataset described by `data`.
+    Every image is decoded and letterboxed once into a memory-mapped cache;
+    each epoch reports images/sec and how its time splits between waiting for
+    data and computing, which shows whether the box is input-bound.
+    """
+    if threads: torch.set_num_threads(threads)
+    splits = read_dataset_yaml(data)
+    caches = {split: build_cache(path, label_dir_for(path), imgsz, cache_dir) for split, path in splits.items()}
+    loaders = {split: DataLoader(CachedDetectionDataset(prefix), batch_size=batch_size, shuffle=(split == 'train'),
+                                 num_workers=workers, collate_fn=collate, persistent_workers=workers > 0,
+                                 drop_last=False)
+               for split, prefix in caches.items()}
+    print(f"Training on {len(loaders['train'].dataset)} images, validating on "
+          f"{len(loaders['val'].dataset) if 'val' in loaders else 0}; {workers} loader worker(s), "
+          f"{torch.get_num_threads()} compute thread(s)")
+
+    model = TextDetector()
+    optimizer = torch.optim.AdamW(model.parameters(), lr=lr)
+    scheduler = torch.optim.lr_scheduler.CosineAnnealingLR(optimizer, T_max=epochs)
+    best = float('inf')
+    for epoch in range(1, epochs + 1):
+        model.train()
+        data_time = compute_time = total_loss = 0.0
+        seen = 0
+        epoch_start = tick = time.perf_counter()
+        for images, boxes in loaders['train']:
+            loaded = time.perf_counter()
+            data_time += loaded - tick
+            pred_obj, pred_ltrb = model(images.float().div_(255))
+            loss = detection_loss(pred_obj, pred_ltrb, boxes)
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+            total_loss += loss.item() * len(images)
+            seen += len(images)
+            tick = time.perf_counter()
+            compute_time += tick - loaded
+        scheduler.step()
+        elapsed = time.perf_counter() - epoch_start
+
+        val_loss = evaluate(model, loaders['val']) if 'val' in loaders else total_loss / max(1, seen)
+        print(f"Epoch {epoch}/{epochs}: loss {total_loss / max(1, seen):.4f}, val {val_loss:.4f} | "
+              f"{seen / elapsed:.1f} images/sec | data {data_time:.1f}s ({100 * data_time / elapsed:.0f}%), "
+              f"compute {compute_time:.1f}s ({100 * compute_time / elapsed:.0f}%)")
+        if val_loss < best:
+            best = val_loss
+            os.makedirs(os.path.dirname(checkpoint) or '.', exist_ok=True)
+            torch.save({"model": model.state_dict(), "imgsz": imgsz, "stride": STRIDE, "epoch": epoch}, checkpoint)
+    print(f"\n✅ Training complete! Best val loss {best:.4f}; weights saved to '{checkpoint}'")
+    return model
+
+
+@torch.no_grad()
+def evaluate(model, loader):
+    model.eval()
+    total, seen = 0.0, 0
+    for images, boxes in loader:
+        pred_obj, pred_ltrb = model(images.float().div_(255))
+        total += detection_loss(pred_obj, pred_ltrb, boxes).item() * len(images)
+        seen += len(images)
+    return total / max(1, seen)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Train the single-class text detector on CPU")
+    parser.add_argument('--data', type=str, default=DATASET_YAML, help='dataset.yaml written by prepare_dataset.py, or by shards.py for a packed dataset')
+    parser.add_argument('--epochs', type=int, default=EPOCHS)
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--workers', type=int, default=NUM_WORKERS, help='DataLoader worker processes')
+    parser.add_argument('--threads', type=int, default=None, help='PyTorch compute threads (default: torch default)')
+    parser.add_argument('--imgsz', type=int, default=IMG_SIZE, help='Letterbox size (square)')
+    parser.add_argument('--lr', type=float, default=LEARNING_RATE)
+    parser.add_argument('--cache-dir', type=str, default=CACHE_DIR, help='Where the decoded image cache lives')
+    parser.add_argument('--weights', type=str, default=CHECKPOINT_PATH, help='Checkpoint output path')
+    args = parser.parse_args()
+    train(args.data, args.epochs, args.batch_size, args.workers, args.imgsz, args.lr, args.threads,
+          args.cache_dir, args.weights)
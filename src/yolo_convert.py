@@ -0,0 +1,132 @@
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# --- Configuration ---
+MIN_BOX_SIZE = 1e-4   # normalized width/height below this is treated as degenerate
+WRITE_WORKERS = 8
+
+
+def read_json(paths):
+    for path in paths:
+        with open(path, 'r') as f:
+            yield json.load(f)
+
+
+def load_shapes(documents):
+    """
+    Flattens every shape of a batch of LabelMe documents (dicts) into arrays:
+    `points` (P, 2) float64, `shape_offsets` (S + 1,) into points,
+    `shape_file` (S,) file index per shape, and `sizes` (F, 2) image width/height.
+    """
+    coords, counts, shape_file, sizes = [], [], [], []
+    for file_index, data in enumerate(documents):
+        sizes.append((data['imageWidth'], data['imageHeight']))
+        for shape in data['shapes']:
+            pts = shape['points']
+            if not pts:
+                continue
+            coords.extend(pts)
+            counts.append(len(pts))
+            shape_file.append(file_index)
+
+    points = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+    shape_offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=shape_offsets[1:])
+    return points, shape_offsets, np.asarray(shape_file, dtype=np.int64), np.asarray(sizes, dtype=np.float64).reshape(-1, 2)
+
+
+def boxes_from_shapes(points, shape_offsets, shape_file, sizes):
+    """
+    Normalized, clipped (x_center, y_center, w, h) for every shape in one
+    NumPy pass. Returns `(boxes, keep)` where `keep` masks out degenerate boxes.
+    """
+    if len(shape_file) == 0:
+        return np.zeros((0, 4)), np.zeros(0, dtype=bool)
+    starts = shape_offsets[:-1]
+    mins = np.minimum.reduceat(points, starts, axis=0)
+    maxs = np.maximum.reduceat(points, starts, axis=0)
+    wh = sizes[shape_file]
+    mins = np.clip(mins / wh, 0.0, 1.0)
+    maxs = np.clip(maxs / wh, 0.0, 1.0)
+    boxes = np.concatenate([(mins + maxs) / 2, maxs - mins], axis=1)
+    keep = (boxes[:, 2] > MIN_BOX_SIZE) & (boxes[:, 3] > MIN_BOX_SIZE)
+    return boxes, keep
+
+
+def _format_boxes(file_count, boxes, keep, shape_file, class_id):
+    """One label text per file; each file's rows are formatted with a single % operation."""
+    kept_file = shape_file[keep]
+    kept = boxes[keep]
+    bounds = np.searchsorted(kept_file, np.arange(file_count + 1))
+    row = f"{class_id} %.6f %.6f %.6f %.6f"
+    texts = []
+    for i in range(file_count):
+        chunk = kept[bounds[i]:bounds[i + 1]]
+        texts.append("\n".join([row] * len(chunk)) % tuple(chunk.ravel()) if len(chunk) else "")
+    return texts
+
+
+def _format_polygons(file_count, points, shape_offsets, shape_file, sizes, keep, class_id):
+    """YOLO-seg rows: class followed by the normalized, clipped polygon vertices."""
+    counts = np.diff(shape_offsets)
+    normalized = np.clip(points / np.repeat(sizes[shape_file], counts, axis=0), 0.0, 1.0)
+    keep = keep & (counts >= 3)
+    lines = [[] for _ in range(file_count)]
+    for s in np.flatnonzero(keep):
+        start, end = shape_offsets[s], shape_offsets[s + 1]
+        lines[shape_file[s]].append((f"{class_id}" + " %.6f" * (2 * (end - start))) % tuple(normalized[start:end].ravel()))
+    return ["\n".join(rows) for rows in lines]
+
+
+def _write(path_text):
+    path, text = path_text
+    with open(path, 'w') as f:
+        f.write(text)
+
+
+def convert(json_paths, label_paths, mode="bbox", class_id=0):
+    """
+    Converts LabelMe JSON files to YOLO label files.
+    `mode` is "bbox" (class xc yc w h) or "seg" (class x1 y1 x2 y2 ...).
+    Out-of-bounds coordinates are clipped and degenerate shapes dropped.
+    Returns a stats dict.
+    """
+    return convert_documents(read_json(json_paths), label_paths, mode, class_id)
+
+
+def convert_documents(documents, label_paths, mode="bbox", class_id=0):
+    """convert() for LabelMe dicts already in memory (e.g. from an AnnotationStore)."""
+    points, shape_offsets, shape_file, sizes = load_shapes(documents)
+    file_count = len(sizes)
+    boxes, keep = boxes_from_shapes(points, shape_offsets, shape_file, sizes)
+    if mode == "seg":
+        texts = _format_polygons(file_count, points, shape_offsets, shape_file, sizes, keep, class_id)
+    else:
+        texts = _format_boxes(file_count, boxes, keep, shape_file, class_id)
+
+    with ThreadPoolExecutor(max_workers=WRITE_WORKERS) as pool:
+        list(pool.map(_write, zip(label_paths, texts)))
+    return {"files": file_count, "shapes": int(len(shape_file)), "kept": int(keep.sum()),
+            "dropped": int(len(shape_file) - keep.sum())}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Convert LabelMe JSON sidecars to YOLO labels "
+                                                 "(for an annotation store, use annotation_store.py export-yolo)")
+    parser.add_argument('--src', type=str, default='book_covers_mixed', help='Directory of LabelMe JSON files')
+    parser.add_argument('--dst', type=str, required=True, help='Directory to write .txt labels into')
+    parser.add_argument('--mode', choices=['bbox', 'seg'], default='bbox', help='Box (detect) or polygon (segment) labels')
+    args = parser.parse_args()
+
+    os.makedirs(args.dst, exist_ok=True)
+    names = [os.path.splitext(f)[0] for f in os.listdir(args.src) if f.endswith('.json')]
+    start = time.perf_counter()
+    stats = convert([os.path.join(args.src, n + '.json') for n in names],
+                    [os.path.join(args.dst, n + '.txt') for n in names], mode=args.mode)
+    print(f"Converted {stats['files']} files ({stats['kept']} shapes kept, {stats['dropped']} dropped) "
+          f"in {time.perf_counter() - start:.2f}s")
@@ -0,0 +1,41 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+import rename_engine  # noqa: E402
+
+
+def make_split(root, split, images, labels=()):
+    for kind, names in (("images", images), ("labels", labels)):
+        directory = root / split / kind
+        directory.mkdir(parents=True, exist_ok=True)
+        for name in names:
+            (directory / name).write_text(name, encoding="utf-8")
+
+
+def test_clean_numbers_images_that_sanitize_to_the_same_name(tmp_path):
+    make_split(tmp_path, "train", ["hindi123.jpg?ref=a", "hindi123.jpg?ref=b", "hindi77.jpg"])
+    make_split(tmp_path, "test", [])
+
+    moves = rename_engine.rename(str(tmp_path), rename_engine.language_prefix, sanitize_names=True)
+
+    images = tmp_path / "train" / "images"
+    assert sorted(os.listdir(images)) == ["hindi_001.jpg", "hindi_002.jpg", "hindi_003.jpg"]
+    # Every original file survives under its own number
+    contents = {(images / name).read_text(encoding="utf-8") for name in os.listdir(images)}
+    assert contents == {"hindi123.jpg?ref=a", "hindi123.jpg?ref=b", "hindi77.jpg"}
+    assert len(moves) == 3
+    assert not os.path.exists(tmp_path / rename_engine.JOURNAL_NAME)
+
+
+def test_truncated_journal_is_discarded(tmp_path):
+    make_split(tmp_path, "train", ["hindi_x.jpg"])
+    make_split(tmp_path, "test", [])
+    # Killed while writing the plan: phase 1 was never marked, so nothing was renamed
+    (tmp_path / rename_engine.JOURNAL_NAME).write_text('[["a", "b", "c"], ["d", "', encoding="utf-8")
+
+    rename_engine.rename(str(tmp_path))
+
+    assert os.listdir(tmp_path / "train" / "images") == ["hindi_001.jpg"]
+    assert not os.path.exists(tmp_path / rename_engine.JOURNAL_NAME)